@@ -1,14 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import grammar, speak, write, describe, notifications
+from app.routes import grammar, speak, write, describe, notifications, progress
+from app.services.progress_store import close_progress_store
+from app.services.leaderboard import reset_leaderboard_index
+from app.services.score_distribution import reset_score_distribution
+from app.services.email_service import email_service
+from app.services.email_outbox import close_email_outbox
+from app.services.firestore_executor import close_firestore_executor
+from app.services.notification_scheduler import notification_scheduler
 import firebase_admin
 from firebase_admin import credentials
+import logging
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize Firebase Admin SDK
 try:
     # Check if Firebase is already initialized
@@ -27,7 +38,19 @@ except ValueError:
         # Initialize with default credentials for development
         firebase_admin.initialize_app()
 
-app = FastAPI(title="English Learning App Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Flush buffered progress writes and drain queued emails before the worker exits;
+    # one failing step must not skip the rest
+    for step in (reset_leaderboard_index, reset_score_distribution, close_progress_store, email_service.close,
+                 close_email_outbox, notification_scheduler.close, close_firestore_executor):
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Shutdown step {step.__qualname__} failed: {str(e)}")
+
+app = FastAPI(title="English Learning App Backend", lifespan=lifespan)
 
 # Add CORS middleware first
 app.add_middleware(
@@ -49,6 +72,7 @@ app.include_router(speak.router, prefix="/speak", tags=["Speak"])
 app.include_router(write.router, prefix="/write", tags=["Write"])
 app.include_router(describe.router, prefix="/describe", tags=["Describe"])
 app.include_router(notifications.router, prefix="/notifications", tags=["Notifications"])
+app.include_router(progress.router, prefix="/progress", tags=["Progress"])
 
 @app.get("/")
 async def root():
@@ -63,6 +87,7 @@ async def health_check():
             "speak": "/speak/feedback", 
             "write": "/write/feedback",
             "describe_image": "/describe/image",
-            "describe_feedback": "/describe/feedback"
+            "describe_feedback": "/describe/feedback",
+            "progress": "/progress/user/{user_id}"
         }
     }
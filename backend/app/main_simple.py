@@ -2,11 +2,28 @@
 Simplified version of main.py that works without Firebase
 Use this for testing if you don't have Firebase set up yet
 """
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import grammar, speak, write, describe
+from app.routes import grammar, speak, write, describe, progress
+from app.services.progress_store import close_progress_store
+from app.services.leaderboard import reset_leaderboard_index
+from app.services.score_distribution import reset_score_distribution
 
-app = FastAPI(title="English Learning App Backend")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Flush buffered progress writes before the worker exits; one failing step must not skip the rest
+    for step in (reset_leaderboard_index, reset_score_distribution, close_progress_store):
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Shutdown step {step.__qualname__} failed: {str(e)}")
+
+app = FastAPI(title="English Learning App Backend", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,6 +39,7 @@ app.include_router(grammar.router, prefix="/grammar", tags=["Grammar"])
 app.include_router(speak.router, prefix="/speak", tags=["Speak"])
 app.include_router(write.router, prefix="/write", tags=["Write"])
 app.include_router(describe.router, prefix="/describe", tags=["Describe"])
+app.include_router(progress.router, prefix="/progress", tags=["Progress"])
 
 @app.get("/")
 async def root():
@@ -40,6 +58,7 @@ async def health_check():
             "speak": "/speak/feedback", 
             "write": "/write/feedback",
             "describe_image": "/describe/image",
-            "describe_feedback": "/describe/feedback"
+            "describe_feedback": "/describe/feedback",
+            "progress": "/progress/user/{user_id}"
         }
     }
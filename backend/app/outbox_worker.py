@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Email Outbox Worker
+Delivers emails queued by the notification scheduler. Run as many copies
+as needed; each claims its own batches, and batches from a worker that
+dies are picked up again once their lease expires.
+
+    python app/outbox_worker.py           # keep polling the outbox
+    python app/outbox_worker.py --once    # deliver everything due, then exit
+    python app/outbox_worker.py --retry-dead
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scheduler_main import initialize_firebase
+from app.services.email_outbox import close_email_outbox, get_email_outbox
+from app.services.email_service import email_service
+from app.services.firestore_executor import close_firestore_executor
+from app.services.notification_scheduler import notification_scheduler
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+async def main(args):
+    # Delivered emails are logged to Firestore
+    initialize_firebase()
+
+    worker = notification_scheduler.create_outbox_worker()
+    try:
+        if args.once:
+            delivered = await worker.drain()
+            logger.info(f"Outbox drained: {delivered} messages attempted, {get_email_outbox().stats()}")
+        else:
+            logger.info("Starting email outbox worker...")
+            await worker.run()
+    finally:
+        email_service.close()
+        close_email_outbox()
+        notification_scheduler.close()
+        close_firestore_executor()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver queued notification emails")
+    parser.add_argument("--once", action="store_true", help="deliver everything due, then exit")
+    parser.add_argument("--retry-dead", action="store_true", help="requeue dead-lettered messages and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+
+    if args.retry_dead:
+        logger.info(f"Requeued {get_email_outbox().retry_dead()} dead-lettered messages")
+        close_email_outbox()
+        sys.exit(0)
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        logger.info("Outbox worker stopped by user")
@@ -6,12 +6,16 @@ import os
 import tempfile
 import json
 from dotenv import load_dotenv
+from ..services.response_cache import analysis_response_cache, cache_key, model_dump
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 router = APIRouter()
 
+# Feedback text used when Gemini is unavailable; such responses are never cached
+FALLBACK_FEEDBACK = "Keep practicing your speaking skills!"
+
 # Advanced request/response models
 class WordScore(BaseModel):
     word: str
@@ -78,12 +82,19 @@ async def analyze_advanced_speech(request: SpeechAnalysisRequest):
         if not transcript:
             raise HTTPException(status_code=400, detail="Empty transcript")
         
+        # Identical re-submissions (same transcript, timing and confidences) hit the cache
+        request_digest = cache_key(json.dumps(model_dump(request), sort_keys=True))
+        
         # Perform comprehensive analysis
-        analysis_result = await perform_comprehensive_analysis(
-            transcript, 
-            request.duration_seconds,
-            request.word_confidences,
-            request.audio_metrics
+        analysis_result = await analysis_response_cache.get_or_create(
+            request_digest,
+            lambda: perform_comprehensive_analysis(
+                transcript, 
+                request.duration_seconds,
+                request.word_confidences,
+                request.audio_metrics
+            ),
+            lambda response: response.detailed_feedback != FALLBACK_FEEDBACK
         )
         
         return analysis_result
@@ -95,14 +106,17 @@ async def perform_comprehensive_analysis(
     transcript: str, 
     duration: float, 
     word_confidences: List[Dict[str, float]],
-    audio_metrics: Optional[Dict] = None
+    audio_metrics: Optional[Dict] = None,
+    ai_analysis: Optional[Dict] = None
 ) -> AdvancedSpeechResponse:
     """
-    Perform comprehensive speech analysis using AI and local algorithms
+    Perform comprehensive speech analysis using AI and local algorithms.
+    Pass `ai_analysis` when the AI call was already started elsewhere.
     """
     
     # 1. Get AI-powered detailed analysis
-    ai_analysis = await get_ai_detailed_analysis(transcript)
+    if ai_analysis is None:
+        ai_analysis = await get_ai_detailed_analysis(transcript)
     
     # 2. Calculate pronunciation scores
     pronunciation_analysis = calculate_pronunciation_analysis(transcript, word_confidences)
@@ -203,7 +217,7 @@ async def get_ai_detailed_analysis(transcript: str) -> Dict:
             "vocabulary_level": "B1",
             "complexity_score": 6,
             "fluency_assessment": "Analysis unavailable",
-            "detailed_feedback": "Keep practicing your speaking skills!",
+            "detailed_feedback": FALLBACK_FEEDBACK,
             "cefr_indicators": ["Assessment pending"]
         }
 
@@ -263,11 +277,16 @@ def calculate_fluency_metrics(transcript: str, duration: float, audio_metrics: O
     # Calculate words per minute
     wpm = (word_count / duration) * 60 if duration > 0 else 0
     
-    # Estimate pause count from punctuation and sentence structure
-    pause_count = transcript.count(',') + transcript.count('.') + transcript.count('...') + transcript.count(';')
-    
-    # Estimate average pause duration
-    avg_pause_duration = (duration - (word_count * 0.5)) / max(pause_count, 1)  # Rough estimate
+    if audio_metrics and 'pause_count' in audio_metrics:
+        # Pauses measured from the audio stream (live sessions)
+        pause_count = audio_metrics['pause_count']
+        avg_pause_duration = audio_metrics.get('average_pause_duration', 0)
+    else:
+        # Estimate pause count from punctuation and sentence structure
+        pause_count = transcript.count(',') + transcript.count('.') + transcript.count('...') + transcript.count(';')
+        
+        # Estimate average pause duration
+        avg_pause_duration = (duration - (word_count * 0.5)) / max(pause_count, 1)  # Rough estimate
     
     # Speech rate consistency (simplified)
     consistency = min(10, max(1, 10 - abs(wpm - 150) / 15))  # 150 WPM is ideal
@@ -489,4 +508,7 @@ def recommend_next_task(cefr_level: str, overall_score: float) -> str:
 # Health check endpoint
 @router.get("/health")
 async def health_check():
-    return {"status": "Advanced speech analysis service is running"}
\ No newline at end of file
+    return {
+        "status": "Advanced speech analysis service is running",
+        "cache": analysis_response_cache.stats()
+    }
\ No newline at end of file
@@ -1,11 +1,18 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from typing import Optional, List, Dict
 import logging
 from datetime import datetime
 from firebase_admin import firestore
+from ..services.email_outbox import get_email_outbox
 from ..services.email_service import email_service
+from ..services.firestore_executor import run_firestore
+from ..services.notification_log import NotificationLog
+from ..services.notification_stats import get_preference_counts
+from ..services.preferences_cache import preferences_cache
 from ..services.notification_scheduler import notification_scheduler
+from ..services.reminder_slots import is_valid_timezone, reminder_bucket
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -22,9 +29,25 @@ def get_db():
 class NotificationPreferences(BaseModel):
     email_reminders: bool = True
     reminder_time: str = "19:00"  # 7 PM default
+    timezone: str = "UTC"  # IANA name, e.g. "Asia/Kolkata"
     streak_reminders: bool = True
     achievement_notifications: bool = True
 
+    @field_validator('reminder_time')
+    @classmethod
+    def check_reminder_time(cls, value: str) -> str:
+        try:
+            return datetime.strptime(value, "%H:%M").strftime("%H:%M")
+        except ValueError:
+            raise ValueError("reminder_time must be HH:MM")
+
+    @field_validator('timezone')
+    @classmethod
+    def check_timezone(cls, value: str) -> str:
+        if not is_valid_timezone(value):
+            raise ValueError(f"Unknown timezone: {value}")
+        return value
+
 class UpdatePreferencesRequest(BaseModel):
     user_id: str
     preferences: NotificationPreferences
@@ -48,9 +71,17 @@ async def update_notification_preferences(request: UpdatePreferencesRequest):
     """Update user's notification preferences"""
     try:
         db = get_db()
-        # Store preferences in Firestore
-        prefs_ref = db.collection('notification_preferences').document(request.user_id)
-        prefs_ref.set(request.preferences.dict())
+        preferences = request.preferences
+        # Store preferences in Firestore, keyed by reminder slot so the scheduler can query one slot at a time
+        await asyncio.gather(
+            run_firestore(get_preference_counts(db).save_preferences, request.user_id, {
+                **preferences.dict(),
+                'reminder_bucket': reminder_bucket(preferences.reminder_time, preferences.timezone)
+            }),
+            run_firestore(db.collection('notification_meta').document('reminder_timezones').set,
+                          {'zones': firestore.ArrayUnion([preferences.timezone])}, merge=True)
+        )
+        preferences_cache.invalidate(request.user_id)
         
         logger.info(f"Updated notification preferences for user {request.user_id}")
         
@@ -67,12 +98,16 @@ async def update_notification_preferences(request: UpdatePreferencesRequest):
 async def get_notification_preferences(user_id: str):
     """Get user's notification preferences"""
     try:
-        db = get_db()
-        prefs_ref = db.collection('notification_preferences').document(user_id)
-        prefs_doc = prefs_ref.get()
-        
-        if prefs_doc.exists:
-            return prefs_doc.to_dict()
+        found, prefs = preferences_cache.get(user_id)
+        if not found:
+            generation = preferences_cache.generation
+            prefs_ref = get_db().collection('notification_preferences').document(user_id)
+            prefs_doc = await run_firestore(prefs_ref.get)
+            prefs = prefs_doc.to_dict() if prefs_doc.exists else None
+            preferences_cache.put(user_id, prefs, generation)
+        
+        if prefs is not None:
+            return prefs
         else:
             # Return default preferences
             default_prefs = NotificationPreferences()
@@ -89,20 +124,20 @@ async def send_test_email(request: TestEmailRequest):
         success = False
         
         if request.type == "streak_reminder":
-            success = email_service.send_streak_reminder(
+            success = await email_service.send_streak_reminder_async(
                 request.email,
                 request.user_name,
                 request.current_streak,
                 request.longest_streak
             )
         elif request.type == "streak_broken":
-            success = email_service.send_streak_broken_email(
+            success = await email_service.send_streak_broken_email_async(
                 request.email,
                 request.user_name,
                 request.current_streak
             )
         elif request.type == "achievement":
-            success = email_service.send_achievement_email(
+            success = await email_service.send_achievement_email_async(
                 request.email,
                 request.user_name,
                 request.achievement_name,
@@ -129,6 +164,8 @@ async def trigger_manual_check(background_tasks: BackgroundTasks):
     try:
         background_tasks.add_task(notification_scheduler.check_inactive_users)
         background_tasks.add_task(notification_scheduler.check_broken_streaks)
+        # Deliver what the checks queued without waiting for an outbox worker
+        background_tasks.add_task(notification_scheduler.create_outbox_worker().drain)
         
         return NotificationResponse(
             success=True,
@@ -139,32 +176,30 @@ async def trigger_manual_check(background_tasks: BackgroundTasks):
         logger.error(f"Error triggering manual check: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to trigger manual check")
 
+@router.get("/outbox")
+async def get_outbox_status(dead_letters: int = 20):
+    """Queued email counts by status and the most recent dead letters"""
+    try:
+        outbox = get_email_outbox()
+        return {
+            "counts": outbox.stats(),
+            "dead_letters": outbox.dead_letters(dead_letters)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting outbox status: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get outbox status")
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """Hit rate and memory use of the notification preferences cache"""
+    return {"preferences": preferences_cache.stats()}
+
 @router.get("/history/{user_id}")
 async def get_notification_history(user_id: str, days: int = 7):
     """Get user's notification history"""
     try:
-        db = get_db()
-        notifications_ref = db.collection('notifications').document(user_id)
-        notifications_doc = notifications_ref.get()
-        
-        if not notifications_doc.exists:
-            return {"notifications": []}
-        
-        notifications_data = notifications_doc.to_dict()
-        
-        # Get notifications for the last N days
-        from datetime import datetime, timedelta
-        history = []
-        
-        for i in range(days):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            if date in notifications_data:
-                for notification in notifications_data[date]:
-                    notification['date'] = date
-                    history.append(notification)
-        
-        # Sort by timestamp (newest first)
-        history.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        history = await run_firestore(NotificationLog(get_db()).history, user_id, days)
         
         return {"notifications": history}
         
@@ -176,9 +211,7 @@ async def get_notification_history(user_id: str, days: int = 7):
 async def clear_notification_history(user_id: str):
     """Clear user's notification history"""
     try:
-        db = get_db()
-        notifications_ref = db.collection('notifications').document(user_id)
-        notifications_ref.delete()
+        await run_firestore(NotificationLog(get_db()).clear, user_id)
         
         return NotificationResponse(
             success=True,
@@ -193,28 +226,14 @@ async def clear_notification_history(user_id: str):
 async def get_notification_stats():
     """Get notification system statistics"""
     try:
-        db = get_db()
-        # Get total users with preferences
-        prefs_collection = db.collection('notification_preferences')
-        prefs_docs = prefs_collection.stream()
-        
-        total_users = 0
-        email_enabled = 0
-        streak_reminders_enabled = 0
-        
-        for doc in prefs_docs:
-            total_users += 1
-            prefs = doc.to_dict()
-            if prefs.get('email_reminders', True):
-                email_enabled += 1
-            if prefs.get('streak_reminders', True):
-                streak_reminders_enabled += 1
+        # Counters maintained on every preferences write, cached briefly
+        counts = await run_firestore(get_preference_counts(get_db()).get)
         
         return {
-            "total_users_with_preferences": total_users,
-            "email_reminders_enabled": email_enabled,
-            "streak_reminders_enabled": streak_reminders_enabled,
-            "scheduler_running": notification_scheduler.is_running
+            **counts,
+            "scheduler_running": notification_scheduler.is_running,
+            "scheduler_jobs": notification_scheduler.timers.stats() if notification_scheduler.timers else [],
+            "scans": notification_scheduler.scan_summaries
         }
         
     except Exception as e:
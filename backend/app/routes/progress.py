@@ -1,17 +1,36 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Iterator, List, Optional
+from datetime import datetime
+import base64
 import json
-import os
-from datetime import datetime, timedelta
+import threading
+import zlib
+from ..services.progress_buffer import WriteBufferFull
+from ..services.progress_store import LEADERBOARD_SECTIONS, MAX_SCORE, get_progress_store
+from ..services.progress_rollup import UserRollup
+from ..services.leaderboard import get_leaderboard_index, total_best_score
+from ..services.score_distribution import get_score_distribution
 
 router = APIRouter()
 
+HISTORY_MAX_PAGE_SIZE = 5000
+# Pages larger than this are streamed in chunks instead of built in memory
+HISTORY_STREAM_THRESHOLD = 200
+# Handlers run on the threadpool; updates for the same user take the same lock so
+# the read-then-write below can't interleave and double-count in the indexes
+USER_LOCK_STRIPES = 64
+_user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+
+def user_lock(user_id: str) -> threading.Lock:
+    return _user_locks[zlib.crc32(user_id.encode("utf-8")) % USER_LOCK_STRIPES]
+
 # Data models
 class ProgressUpdate(BaseModel):
     user_id: str
     section: str
-    score: int
+    score: int = Field(..., ge=0, le=MAX_SCORE)
     session_data: Optional[Dict] = None
 
 class ProgressResponse(BaseModel):
@@ -27,221 +46,239 @@ class ProgressResponse(BaseModel):
 class SessionHistory(BaseModel):
     sessions: List[Dict]
     analytics: Dict
+    next_cursor: Optional[str] = None
+
+def encode_cursor(session: Dict) -> str:
+    """Opaque keyset cursor pointing just past a session"""
+    raw = f"{session['timestamp']}|{session['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, session_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return timestamp, int(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-# Simple file-based storage (in production, use a proper database)
-PROGRESS_FILE = "user_progress.json"
+def parse_timestamp(value: Optional[str], name: str) -> Optional[str]:
+    """Normalize an ISO date or datetime to the stored timestamp format"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' timestamp: {value}")
 
-def load_progress_data():
-    """Load progress data from file"""
-    if not os.path.exists(PROGRESS_FILE):
-        return {}
+@router.post("/update")
+def update_progress(progress: ProgressUpdate):
+    """Update user progress with detailed session tracking"""
     try:
-        with open(PROGRESS_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
-
-def save_progress_data(data):
-    """Save progress data to file"""
-    with open(PROGRESS_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-
-def calculate_improvement_trend(sessions: List[Dict]) -> str:
-    """Calculate if user is improving, stable, or declining"""
-    if len(se")str(e)}d: {leaderboar get ed to"Faildetail=f500, tatus_code=eption(sise HTTPExc        raion as e:
-pt Exceptexce    
-    Top 10
-     # ard[:10]} eaderboerboard": l"leadeturn {        r 
-e)
-       verse=Tru"]), rescore"average_core"], x[(x["total_sa x: y=lambdard.sort(kederbo       leaore
-  average sce, then byal scorort by tot # S       
-          })
-     ns)
-     (sessioenssions": l"total_se          
-      ore, 2),(avg_scroundre": ge_sco "avera              
- core,l_sore": totatal_sc "to         D
-      onymous I00}",  # An00r_id) % 1seUser_{hash(u"user_id": f   "            
- rd.append({eaderboa          l       
-  )
-     sionsen(ses/ lsessions) r s in e", 0) fo("scorsum(s.getscore = avg_                ions:
- if sess           core = 0
-     avg_s[])
-       ", ns"sessiot(ata.geser_dions = u      sess           
-                )
-0)
-   escribe", ata.get("dr_d     use          
-  te", 0) +rita.get("wda  user_        
-      k", 0) + get("speaser_data.          u      (
- core =al_s  tot          
-():ta.itemsdaer_data in r_id, usor use        f[]
-= eaderboard 
-        l        ess_data()
-ad_progr= lota  dary:
-          t""
- s"formerof top peroard us leaderbnymot ano"Ge ""ard():
-   _leaderbof getasync derboard")
-("/leaderouter.get")
-
-@{str(e)}ry: sion histot sesiled to geFa"0, detail=f=50status_codeption(PExceraise HTT       s e:
- ception acept Ex    ex
-        
-        )ics
-alytalytics=an        an    ssions
-ast 20 se# Return l20:],  ons[-ns=sessiessio     sy(
-       nHistor Sessio   return
-             
-t_sessions)len(recenivity"] = nt_actecetics["ranaly]
-               
- k_ago> wee)) -01"", "1970-01estamptim"ormat(s.get(fromisofime.atet     if ds 
-       s in session s for 
-           ns = [sioescent_s
-        reays=7)timedelta(d - me.now()go = datetiweek_a      days)
-  st 7 lat activity (     # Recen 
-          ction] = 0
-"][seby_sectionage_scores_ics["avernalyt     a  
-         :        else   e, 2)
- orround(avg_sction] = on"][secsectis_by_erage_scoreytics["avanal             ions)
-   n_sessn(sectioions) / letion_sesss in sec for ore", 0)scm(s.get("su= vg_score         a:
-        ion_sessions sectif          ]
-  ) == section("section" s.getions ifr s in sess fosions = [ssection_ses            ribe"]:
-"desc , "write",["speak"n r section i     fon
-   tiores by secrage scote ave   # Calcula           
- 1
-  on] +=cti"][setionsions_by_sec["sesticsaly          an= 0
-  ection] ][sby_section"essions_nalytics["s         a    ]:
-   "y_sectionessions_bytics["sal ann not in if sectio        own")
-   "unknsection", ion.get("ss seon =secti    :
-        ionsin sesssion es   for sction
-     s by seup session   # Gro 
-             }
-       }
-          )
-  ", 0ribeget("descser_id].data[u": ibe    "descr         
-   rite", 0),"wet(.gta[user_id]"write": da           0),
-     , t("speak"user_id].geata[ deak":   "sp           
-  cores": {_s  "best    
-      y": [],_activit  "recent
-          n": {},_by_sectioge_scores"avera         ": {},
-   by_sectionions_    "sess       s),
- ssionns": len(seal_sessio "tot       
-    s = { analytic       ytics
-d analte detaileulalcCa   #     
-     
-    s", [])sion("ses_id].geterns = data[usessio 
-        s})
-       analytics={sions=[], nHistory(sesessio return S          in data:
- user_id not      if    
-        _data()
-rogressd_p  data = loa   try:
-   "
-    ""d analyticsory ansion histtailed ses de""Get  ":
-  ser_id: str)history(ut_session_ef ge
-async dionHistory)el=Sessnse_modpoesy", r/historser_id}"/user/{uouter.get(@r)
-
-tr(e)}"ess: {st progrto geled "Fai detail=fcode=500,us_statn(HTTPExceptio   raise     on as e:
- ept Excepti  
-    exc
-         )d
-     pdateast_u=latedast_upd l  
-         ent_trend,=improvemvement_trendimpro          ,
-  ge_score, 2)eraund(ave=rocore_sverag  a          ons,
-l_sessi=totatal_sessions    to       be", 0),
- escri"dget(a.at_dribe=user       desc  , 0),
-   ite"t("wrata.ge_drite=user  w        0),
-   ak",t("speer_data.ge=useaksp           ,
- idr_user_id=use     (
-       ponsegressResro  return P    
-    
-      ssions""no_seend = ement_tr      improv     
-  = "Never"st_updatedla        0.0
-     age_score =erav            else:
-        sessions)
-d(nt_tren_improvemetend = calculavement_tre    impro        ')
-Unknownstamp', 'ime].get('tssions[-1 = seedupdat       last_s
-     iontal_sess tosessions) /s in  for ', 0)scoreet('(s.gume_score = sverag    a        s > 0:
-essionf total_s  ins)
-      len(sessios = onotal_sessi       tytics
- analculate   # Cal          
-])
-    ns", [get("sessioata.ser_d = usionsses       [user_id]
- a = data_dat     user   
-           )
-         Never"
-updated="    last_            ",
-serend="new_uement_tr   improv             e=0.0,
-scor    average_         ons=0,
-   otal_sessi    t        ,
-    be=0     descri     ,
-      te=0         wri
-          speak=0,          d,
-   d=user_i_i  user            esponse(
-  essRreturn Progr            new users
-ss for progredefault Return       #       ta:
-n da not i if user_id          
-  ata()
-   ss_dprogre= load_     data    try:
-
-    ytics"""s with analgreser prohensive uset compre """Gtr):
-   : ss(user_ider_progrest_usgef sync deonse)
-aespressRroge_model=P", responser/{user_id}t("/uster.ge")
-
-@rou)}s: {str(edate progresailed to uptail=f"Fcode=500, destatus_TPException(raise HT       as e:
-  oncept Exceptiex    
-    score}
-    rogress. p":ew_scorelly", "nessfudated succupProgress "age": "mess return {            
-a(data)
-   ss_datrogreve_p  sa  
-      50:]
-      "][-onsssi["seuser_id]= data[sions"] ses]["ser_id      data[u      > 50:
-s"]) onsessir_id]["data[usef len(        ir user
-ions pe0 sess only last 5Keep #        
-  rd)
-      coresession_ppend(s"].ad]["session[user_itada       }
-       ta or {}
-  ession_dass.s progren_data":"sessio         
-   (),soformat().ie.nowetimdatmestamp":         "ti    .score,
-gresscore": pro     "s     section,
-  progress.n": ctio       "se
-     record = {n_ssiose     ecord
-    session r       # Add   
-     
- core)ss.sgrere, pro_sco(current maxection] =[progress.sser_id]     data[u   ection, 0)
-.sprogressr_id].get(ata[usee = dnt_scor  curre      core)
- highest s(keepction score se   # Update  
-       }
-               ()
-  ormatnow().isofatetime. dt":reated_a    "c     ,
-       []ions":    "sess             ,
-ribe": 0"desc        
-        ite": 0,       "wr         ak": 0,
-   "spe       {
-        = d]ta[user_i         da  :
-  in datar_id notf use i        
-    
-   ess.user_idrogrer_id = p    usa()
-    rogress_data = load_p
-        dat try:
-   """ckingran tsioed sesth detailgress wite user pro""Updae):
-    "pdatgressUogress: Pros(pre_progresc def updat")
-asyn/update.post("
-@router"
- "stable     returnlse:
-   "
-    edecliningeturn "   r.5:
-     rst - 0< avg_fig_second  elif avng"
-   rn "improvitu      re.5:
-  _first + 0second > avg avg_    
-    if_half)
-len(secondalf) / cond_h sum(sevg_second =
-    afirst_half) / len(lf)hairst_m(f = su  avg_first]
-    
-  cores)//2:scores[len(s =  second_half   
-es)//2]corlen(sres[:alf = sco    first_hns]
-iocent_sessor s in re0) f, re''scoet([s.g scores =    a"
-    
-atient_d"insufficturn        res) < 2:
- onrecent_sessif len(    iessions
- 5 s # Lastons[-5:] siesessions = s recent_s
-   ata"
-    nt_dufficiereturn "ins:
-        ions) < 2ss
\ No newline at end of file
+        store = get_progress_store()
+        leaderboard = get_leaderboard_index(store)
+        distribution = get_score_distribution(store)
+        with user_lock(progress.user_id):
+            user = store.get_user(progress.user_id)
+            timestamp = datetime.now().isoformat()
+
+            # One transactional upsert: best score per section plus the session record
+            store.record_session(
+                progress.user_id,
+                progress.section,
+                progress.score,
+                timestamp,
+                progress.session_data or {}
+            )
+
+            # Derive the post-update state from the earlier read instead of reading again
+            scores = dict(user["scores"]) if user else {}
+            rollup = user["rollup"] if user else UserRollup()
+            previous_best = scores.get(progress.section)
+            scores[progress.section] = max(previous_best or 0, progress.score)
+            rollup.add(progress.section, progress.score, timestamp)
+
+            # Re-rank just this user instead of recomputing the whole leaderboard on read
+            leaderboard.update(
+                progress.user_id,
+                total_best_score(scores),
+                rollup.average_score,
+                rollup.total_sessions
+            )
+            distribution.record_best(progress.section, previous_best, scores[progress.section])
+
+        return {"message": "Progress updated successfully", "new_score": progress.score}
+
+    except WriteBufferFull as e:
+        raise HTTPException(status_code=503, detail=f"Progress storage is unavailable, try again later: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update progress: {str(e)}")
+
+@router.get("/user/{user_id}", response_model=ProgressResponse)
+def get_user_progress(user_id: str):
+    """Get comprehensive user progress with analytics"""
+    try:
+        store = get_progress_store()
+        user = store.get_user(user_id)
+
+        if user is None:
+            # Return default progress for new users
+            return ProgressResponse(
+                user_id=user_id,
+                speak=0,
+                write=0,
+                describe=0,
+                total_sessions=0,
+                average_score=0.0,
+                improvement_trend="new_user",
+                last_updated="Never"
+            )
+
+        scores = user["scores"]
+        rollup = user["rollup"]
+
+        # Analytics come from the rollup maintained on each update
+        total_sessions = rollup.total_sessions
+        if total_sessions > 0:
+            average_score = rollup.average_score
+            last_updated = rollup.last_timestamp
+            improvement_trend = rollup.trend()
+        else:
+            average_score = 0.0
+            last_updated = "Never"
+            improvement_trend = "no_sessions"
+
+        return ProgressResponse(
+            user_id=user_id,
+            speak=scores.get("speak", 0),
+            write=scores.get("write", 0),
+            describe=scores.get("describe", 0),
+            total_sessions=total_sessions,
+            average_score=round(average_score, 2),
+            improvement_trend=improvement_trend,
+            last_updated=last_updated
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get progress: {str(e)}")
+
+def stream_history(store, user_id: str, analytics: Dict, start: Optional[str], end: Optional[str],
+                   before: Optional[tuple], limit: int) -> Iterator[str]:
+    """Yield a SessionHistory JSON body, fetching sessions one chunk at a time"""
+    yield '{"analytics":' + json.dumps(analytics) + ',"sessions":['
+    remaining = limit
+    last = None
+    while remaining > 0:
+        chunk = store.get_session_page(user_id, start, end, before, min(remaining, HISTORY_STREAM_THRESHOLD))
+        for session in chunk:
+            yield ("," if last is not None else "") + json.dumps(session)
+            last = session
+        remaining -= len(chunk)
+        if len(chunk) < HISTORY_STREAM_THRESHOLD:
+            break
+        before = (last["timestamp"], last["id"])
+    next_cursor = encode_cursor(last) if last is not None and remaining == 0 else None
+    yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
+
+@router.get("/user/{user_id}/history", response_model=SessionHistory)
+def get_session_history(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    """Get a page of session history (newest first) and analytics"""
+    before = decode_cursor(cursor) if cursor else None
+    start = parse_timestamp(from_, "from")
+    end = parse_timestamp(to, "to")
+    try:
+        store = get_progress_store()
+        user = store.get_user(user_id)
+
+        if user is None:
+            return SessionHistory(sessions=[], analytics={})
+
+        scores = user["scores"]
+        rollup = user["rollup"]
+
+        # Analytics come from the rollup maintained on each update
+        analytics = {
+            "total_sessions": rollup.total_sessions,
+            "sessions_by_section": dict(rollup.section_counts),
+            "average_scores_by_section": {
+                section: round(rollup.section_average(section), 2)
+                for section in ["speak", "write", "describe"]
+            },
+            "recent_activity": rollup.recent_activity(),
+            "best_scores": {
+                "speak": scores.get("speak", 0),
+                "write": scores.get("write", 0),
+                "describe": scores.get("describe", 0)
+            }
+        }
+
+        if limit > HISTORY_STREAM_THRESHOLD:
+            return StreamingResponse(
+                stream_history(store, user_id, analytics, start, end, before, limit),
+                media_type="application/json"
+            )
+
+        sessions = store.get_session_page(user_id, start, end, before, limit)
+        return SessionHistory(
+            sessions=sessions,
+            analytics=analytics,
+            # A full page may have more behind it
+            next_cursor=encode_cursor(sessions[-1]) if len(sessions) == limit else None
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get session history: {str(e)}")
+
+@router.get("/write-stats")
+def get_write_stats():
+    """Batching achieved by the progress write-behind buffer"""
+    store = get_progress_store()
+    if not hasattr(store, "stats"):
+        return {"write_behind": False}
+    return {"write_behind": True, **store.stats()}
+
+@router.get("/percentiles")
+def get_percentiles(section: str, score: Optional[int] = None, user_id: Optional[str] = None):
+    """Where a score (or a user's best score) ranks among all users' best scores in a section"""
+    if section not in LEADERBOARD_SECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown section: {section}")
+    try:
+        store = get_progress_store()
+        distribution = get_score_distribution(store)
+
+        if score is None and user_id is not None:
+            user = store.get_user(user_id)
+            score = user["scores"].get(section) if user else None
+
+        result = {
+            "section": section,
+            "users": distribution.users(section),
+            "quantiles": {
+                f"p{int(q * 100)}": distribution.quantile(section, q)
+                for q in (0.25, 0.5, 0.75, 0.9)
+            }
+        }
+        if score is not None:
+            result["score"] = score
+            # "You scored better than N% of users"
+            result["better_than_percent"] = distribution.percentile_rank(section, score)
+        return result
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get percentiles: {str(e)}")
+
+@router.get("/leaderboard")
+def get_leaderboard():
+    """Get anonymous leaderboard of top performers"""
+    try:
+        # Rows carry stable anonymous IDs
+        leaderboard = get_leaderboard_index(get_progress_store()).top(10)
+
+        return {"leaderboard": leaderboard}  # Top 10
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get leaderboard: {str(e)}")
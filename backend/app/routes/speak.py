@@ -1,16 +1,34 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 import google.generativeai as genai
 import os
 import tempfile
 import re
+import json
+import asyncio
+import hashlib
+import logging
 from dotenv import load_dotenv
+from ..services.audio_pipeline import TARGET_SAMPLE_RATE, AudioDecodeError, normalize_upload
+from ..services.live_speech import LiveSpeechSession, create_stream_decoder
+from ..services.response_cache import analysis_response_cache, cache_key, model_dump, speak_response_cache
+from .advanced_speech import get_ai_detailed_analysis, perform_comprehensive_analysis
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Typical MediaRecorder Opus bitrate (~32 kbps), used when audio can't be decoded
+OPUS_BYTES_PER_SECOND = 4000
+
+# Fallback mistake text when Gemini fails; such responses are never cached
+AI_UNAVAILABLE = "Unable to analyze - AI service temporarily unavailable"
+
+# Send live metrics back at most every half second of received audio
+PARTIAL_INTERVAL_SAMPLES = TARGET_SAMPLE_RATE // 2
+
 # Response schema
 class SpeakResponse(BaseModel):
     transcript: str
@@ -49,48 +67,13 @@ def calculate_pronunciation_score(transcript: str, feedback: str) -> int:
     
     return max(1, min(10, base_score))
 
-@router.post("/feedback")
-async def speak_feedback(file: UploadFile = File(...), question: str = ""):
+async def generate_speak_feedback(transcript: str, question: str = "") -> SpeakResponse:
+    """Get structured Gemini feedback for a transcript, with a canned fallback"""
     try:
-        # Basic file validation
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-            
-        # For now, simulate transcription since Whisper isn't installed
-        # Generate more realistic and varied transcripts
-        import random
-        
-        # Read file size to simulate different speech lengths
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # Generate transcript based on file size (simulating speech length)
-        if file_size < 10000:  # Short recording
-            transcripts = [
-                "Hello, my name is Sarah and I am learning English.",
-                "Today is a beautiful day and I feel very happy.",
-                "I love reading books and watching movies in English.",
-                "My favorite hobby is cooking traditional food from my country."
-            ]
-        elif file_size < 50000:  # Medium recording
-            transcripts = [
-                "Hello everyone, I want to talk about my memorable vacation. Last summer, I visited Paris with my family. We stayed there for one week and visited many famous places like the Eiffel Tower and the Louvre Museum. The food was absolutely delicious and the people were very friendly.",
-                "I think learning English is very important in today's world. It helps us communicate with people from different countries and cultures. I practice speaking English every day by watching movies, reading books, and talking with my friends. Sometimes it's challenging, but I never give up.",
-                "My dream is to become a teacher someday. I love working with children and helping them learn new things. Education is very powerful and can change people's lives. I am studying hard at university and gaining experience by volunteering at local schools."
-            ]
-        else:  # Long recording
-            transcripts = [
-                "Good morning everyone, I would like to share my thoughts about technology and how it has changed our lives. In the past twenty years, we have seen incredible advances in smartphones, computers, and the internet. These technologies have made communication faster and easier, but they have also created new challenges. For example, many people spend too much time on social media and forget to have real conversations with their family and friends. I believe we need to find a balance between using technology and maintaining human connections. What do you think about this topic?",
-                "Today I want to talk about the importance of environmental protection. Climate change is one of the biggest challenges facing our planet right now. We can see the effects everywhere - rising temperatures, melting ice caps, and extreme weather events. However, I believe that each person can make a difference through small actions. We can reduce our carbon footprint by using public transportation, recycling, and choosing sustainable products. Governments and businesses also need to take responsibility and invest in renewable energy sources. If we work together, we can create a better future for the next generation."
-            ]
+        # Get detailed feedback from Gemini
+        model = genai.GenerativeModel('gemini-1.5-flash')
         
-        transcript = random.choice(transcripts)
-        
-        try:
-            # Get detailed feedback from Gemini
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = f"""
+        prompt = f"""
 You are an English-learning feedback assistant. The user will give a short spoken answer that may contain grammar mistakes.
 
 USER'S ANSWER: "{transcript}"
@@ -132,119 +115,172 @@ STRICT RULES:
 - Keep everything short, simple, and structured
 - If no errors, say "NO_ERRORS_FOUND" and praise briefly
 """
+        
+        response = await model.generate_content_async(prompt)
+        feedback_text = response.text
+        
+        print(f"✅ Gemini feedback received: {feedback_text}")
+        
+        # Parse the structured feedback
+        detailed_scores = {}
+        mistakes = []
+        strengths = []
+        suggestions = []
+        overall_comment = ""
+        corrected_speech = ""
+        
+        try:
+            # Extract detailed scores
+            pronunciation_match = re.search(r'PRONUNCIATION:\s*(\d+)', feedback_text)
+            grammar_match = re.search(r'GRAMMAR:\s*(\d+)', feedback_text)
+            fluency_match = re.search(r'FLUENCY:\s*(\d+)', feedback_text)
+            vocabulary_match = re.search(r'VOCABULARY:\s*(\d+)', feedback_text)
+            overall_match = re.search(r'OVERALL_SCORE:\s*(\d+)', feedback_text)
             
-            response = model.generate_content(prompt)
-            feedback_text = response.text
+            if pronunciation_match:
+                detailed_scores['pronunciation'] = int(pronunciation_match.group(1))
+            if grammar_match:
+                detailed_scores['grammar'] = int(grammar_match.group(1))
+            if fluency_match:
+                detailed_scores['fluency'] = int(fluency_match.group(1))
+            if vocabulary_match:
+                detailed_scores['vocabulary'] = int(vocabulary_match.group(1))
             
-            print(f"✅ Gemini feedback received: {feedback_text}")
+            # Extract Grammar Corrections
+            grammar_section = re.search(r'GRAMMAR_CORRECTIONS:\s*(.*?)(?=\n\n\d+\.|VOCABULARY_IMPROVEMENTS:|$)', feedback_text, re.DOTALL)
+            if grammar_section:
+                grammar_text = grammar_section.group(1).strip()
+                grammar_lines = [line.strip() for line in grammar_text.split('\n') if line.strip() and '❌' in line]
+                mistakes.extend(grammar_lines)
             
-            # Parse the structured feedback
-            detailed_scores = {}
-            mistakes = []
-            strengths = []
-            suggestions = []
-            overall_comment = ""
-            corrected_speech = ""
+            # Extract Vocabulary Improvements
+            vocab_section = re.search(r'VOCABULARY_IMPROVEMENTS:\s*(.*?)(?=\n\n\d+\.|FLUENCY_TIPS:|$)', feedback_text, re.DOTALL)
+            if vocab_section:
+                vocab_text = vocab_section.group(1).strip()
+                vocab_lines = [line.strip() for line in vocab_text.split('\n') if line.strip() and '💡' in line]
+                strengths.extend(vocab_lines)
             
-            try:
-                # Extract detailed scores
-                pronunciation_match = re.search(r'PRONUNCIATION:\s*(\d+)', feedback_text)
-                grammar_match = re.search(r'GRAMMAR:\s*(\d+)', feedback_text)
-                fluency_match = re.search(r'FLUENCY:\s*(\d+)', feedback_text)
-                vocabulary_match = re.search(r'VOCABULARY:\s*(\d+)', feedback_text)
-                overall_match = re.search(r'OVERALL_SCORE:\s*(\d+)', feedback_text)
-                
-                if pronunciation_match:
-                    detailed_scores['pronunciation'] = int(pronunciation_match.group(1))
-                if grammar_match:
-                    detailed_scores['grammar'] = int(grammar_match.group(1))
-                if fluency_match:
-                    detailed_scores['fluency'] = int(fluency_match.group(1))
-                if vocabulary_match:
-                    detailed_scores['vocabulary'] = int(vocabulary_match.group(1))
-                
-                # Extract Grammar Corrections
-                grammar_section = re.search(r'GRAMMAR_CORRECTIONS:\s*(.*?)(?=\n\n\d+\.|VOCABULARY_IMPROVEMENTS:|$)', feedback_text, re.DOTALL)
-                if grammar_section:
-                    grammar_text = grammar_section.group(1).strip()
-                    grammar_lines = [line.strip() for line in grammar_text.split('\n') if line.strip() and '❌' in line]
-                    mistakes.extend(grammar_lines)
-                
-                # Extract Vocabulary Improvements
-                vocab_section = re.search(r'VOCABULARY_IMPROVEMENTS:\s*(.*?)(?=\n\n\d+\.|FLUENCY_TIPS:|$)', feedback_text, re.DOTALL)
-                if vocab_section:
-                    vocab_text = vocab_section.group(1).strip()
-                    vocab_lines = [line.strip() for line in vocab_text.split('\n') if line.strip() and '💡' in line]
-                    strengths.extend(vocab_lines)
-                
-                # Extract Fluency Tips
-                fluency_section = re.search(r'FLUENCY_TIPS:\s*(.*?)(?=\n\n\d+\.|IMPROVED_VERSION:|$)', feedback_text, re.DOTALL)
-                if fluency_section:
-                    fluency_text = fluency_section.group(1).strip()
-                    fluency_lines = [line.strip() for line in fluency_text.split('\n') if line.strip() and '💡' in line]
-                    suggestions.extend(fluency_lines)
-                
-                # Extract Improved Version
-                improved_match = re.search(r'IMPROVED_VERSION:\s*(.*?)(?=\n\nDETAILED_SCORES:|$)', feedback_text, re.DOTALL)
-                if improved_match:
-                    corrected_speech = improved_match.group(1).strip()
-                
-                # Check if no errors found
-                if "NO_ERRORS_FOUND" in feedback_text:
-                    mistakes = ["✅ No errors found! Excellent speaking!"]
-                    strengths = ["✅ Perfect grammar and vocabulary"]
-                    suggestions = ["💡 Keep up the great work!"]
-                
-                # If no mistakes parsed, add default
-                if not mistakes:
-                    mistakes = ["✅ Good job! Minor improvements suggested below."]
-                
-                # Return the full formatted feedback from Gemini
-                overall_comment = feedback_text
-                        
-            except Exception as parse_error:
-                print(f"Parsing error: {parse_error}")
-                # Fallback if parsing fails
-                detailed_scores = {'pronunciation': 7, 'grammar': 7, 'fluency': 7, 'vocabulary': 7}
-                mistakes = ["✅ Good effort in speaking practice"]
-                strengths = ["💡 Keep practicing regularly"]
-                suggestions = ["💡 Focus on clear pronunciation"]
-                overall_comment = "Good job practicing your speaking skills!"
+            # Extract Fluency Tips
+            fluency_section = re.search(r'FLUENCY_TIPS:\s*(.*?)(?=\n\n\d+\.|IMPROVED_VERSION:|$)', feedback_text, re.DOTALL)
+            if fluency_section:
+                fluency_text = fluency_section.group(1).strip()
+                fluency_lines = [line.strip() for line in fluency_text.split('\n') if line.strip() and '💡' in line]
+                suggestions.extend(fluency_lines)
             
-            # Calculate overall score
-            if detailed_scores:
-                score = int(sum(detailed_scores.values()) / len(detailed_scores))
-            else:
-                score = calculate_pronunciation_score(transcript, feedback_text)
+            # Extract Improved Version
+            improved_match = re.search(r'IMPROVED_VERSION:\s*(.*?)(?=\n\nDETAILED_SCORES:|$)', feedback_text, re.DOTALL)
+            if improved_match:
+                corrected_speech = improved_match.group(1).strip()
             
-            return SpeakResponse(
-                transcript=transcript,
-                feedback=overall_comment.strip() or feedback_text,
-                score=score,
-                detailed_scores=detailed_scores,
-                mistakes=mistakes,
-                strengths=strengths,
-                suggestions=suggestions,
-                question=question
-            )
+            # Check if no errors found
+            if "NO_ERRORS_FOUND" in feedback_text:
+                mistakes = ["✅ No errors found! Excellent speaking!"]
+                strengths = ["✅ Perfect grammar and vocabulary"]
+                suggestions = ["💡 Keep up the great work!"]
             
-        except Exception as gemini_error:
-            # Fallback response if Gemini fails
-            return SpeakResponse(
-                transcript=transcript,
-                feedback="Great job practicing your speaking! Keep working on pronunciation and fluency. Your effort is appreciated!",
-                score=7,
-                detailed_scores={
-                    'pronunciation': 7,
-                    'grammar': 7, 
-                    'fluency': 7,
-                    'vocabulary': 7
-                },
-                mistakes=["Unable to analyze - AI service temporarily unavailable"],
-                strengths=["Good effort in speaking practice", "Completed the speaking exercise"],
-                suggestions=["Keep practicing regularly", "Focus on clear pronunciation", "Try speaking for longer periods"],
-                question=question
-            )
+            # If no mistakes parsed, add default
+            if not mistakes:
+                mistakes = ["✅ Good job! Minor improvements suggested below."]
+            
+            # Return the full formatted feedback from Gemini
+            overall_comment = feedback_text
+                    
+        except Exception as parse_error:
+            print(f"Parsing error: {parse_error}")
+            # Fallback if parsing fails
+            detailed_scores = {'pronunciation': 7, 'grammar': 7, 'fluency': 7, 'vocabulary': 7}
+            mistakes = ["✅ Good effort in speaking practice"]
+            strengths = ["💡 Keep practicing regularly"]
+            suggestions = ["💡 Focus on clear pronunciation"]
+            overall_comment = "Good job practicing your speaking skills!"
+        
+        # Calculate overall score
+        if detailed_scores:
+            score = int(sum(detailed_scores.values()) / len(detailed_scores))
+        else:
+            score = calculate_pronunciation_score(transcript, feedback_text)
+        
+        return SpeakResponse(
+            transcript=transcript,
+            feedback=overall_comment.strip() or feedback_text,
+            score=score,
+            detailed_scores=detailed_scores,
+            mistakes=mistakes,
+            strengths=strengths,
+            suggestions=suggestions,
+            question=question
+        )
+        
+    except Exception as gemini_error:
+        # Fallback response if Gemini fails
+        return SpeakResponse(
+            transcript=transcript,
+            feedback="Great job practicing your speaking! Keep working on pronunciation and fluency. Your effort is appreciated!",
+            score=7,
+            detailed_scores={
+                'pronunciation': 7,
+                'grammar': 7, 
+                'fluency': 7,
+                'vocabulary': 7
+            },
+            mistakes=[AI_UNAVAILABLE],
+            strengths=["Good effort in speaking practice", "Completed the speaking exercise"],
+            suggestions=["Keep practicing regularly", "Focus on clear pronunciation", "Try speaking for longer periods"],
+            question=question
+        )
+
+@router.post("/feedback")
+async def speak_feedback(file: UploadFile = File(...), question: str = ""):
+    try:
+        # Basic file validation
+        if not file.filename:
+            raise HTTPException(status_code=400, detail="No file provided")
+            
+        # For now, simulate transcription since Whisper isn't installed
+        # Generate more realistic and varied transcripts
+        import random
+        
+        # Decode WebM/Opus or WAV into 16 kHz mono PCM and use the real duration
+        try:
+            with await normalize_upload(file) as audio:
+                duration = audio.duration_seconds
+                digest = audio.digest
+        except AudioDecodeError as decode_error:
+            # Fall back to estimating speech length from the upload size
+            logger.warning(f"Audio normalization failed, estimating length from size: {decode_error}")
+            await file.seek(0)
+            content = await file.read()
+            duration = len(content) / OPUS_BYTES_PER_SECOND
+            digest = hashlib.sha256(content).hexdigest()
+        
+        # Generate transcript based on speech length
+        if duration < 2.5:  # Short recording
+            transcripts = [
+                "Hello, my name is Sarah and I am learning English.",
+                "Today is a beautiful day and I feel very happy.",
+                "I love reading books and watching movies in English.",
+                "My favorite hobby is cooking traditional food from my country."
+            ]
+        elif duration < 12.5:  # Medium recording
+            transcripts = [
+                "Hello everyone, I want to talk about my memorable vacation. Last summer, I visited Paris with my family. We stayed there for one week and visited many famous places like the Eiffel Tower and the Louvre Museum. The food was absolutely delicious and the people were very friendly.",
+                "I think learning English is very important in today's world. It helps us communicate with people from different countries and cultures. I practice speaking English every day by watching movies, reading books, and talking with my friends. Sometimes it's challenging, but I never give up.",
+                "My dream is to become a teacher someday. I love working with children and helping them learn new things. Education is very powerful and can change people's lives. I am studying hard at university and gaining experience by volunteering at local schools."
+            ]
+        else:  # Long recording
+            transcripts = [
+                "Good morning everyone, I would like to share my thoughts about technology and how it has changed our lives. In the past twenty years, we have seen incredible advances in smartphones, computers, and the internet. These technologies have made communication faster and easier, but they have also created new challenges. For example, many people spend too much time on social media and forget to have real conversations with their family and friends. I believe we need to find a balance between using technology and maintaining human connections. What do you think about this topic?",
+                "Today I want to talk about the importance of environmental protection. Climate change is one of the biggest challenges facing our planet right now. We can see the effects everywhere - rising temperatures, melting ice caps, and extreme weather events. However, I believe that each person can make a difference through small actions. We can reduce our carbon footprint by using public transportation, recycling, and choosing sustainable products. Governments and businesses also need to take responsibility and invest in renewable energy sources. If we work together, we can create a better future for the next generation."
+            ]
+        
+        transcript = random.choice(transcripts)
+        
+        # Re-submits of the same recording and question reuse the earlier feedback
+        return await speak_response_cache.get_or_create(
+            cache_key(digest, question),
+            lambda: generate_speak_feedback(transcript, question),
+            lambda response: AI_UNAVAILABLE not in response.mistakes
+        )
             
     except Exception as e:
         # Return a user-friendly error response
@@ -262,4 +298,154 @@ STRICT RULES:
             strengths=["Attempted the speaking exercise"],
             suggestions=["Try again in a few moments", "Ensure good microphone quality", "Speak clearly and at moderate pace"],
             question=question
-        )
\ No newline at end of file
+        )
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """Hit rate and memory use of the speaking feedback caches"""
+    return {
+        "speak_feedback": speak_response_cache.stats(),
+        "analyze_speech": analysis_response_cache.stats()
+    }
+
+LIVE_FORMATS = ("webm", "wav", "pcm16")
+LIVE_MODES = ("basic", "advanced")
+MAX_LIVE_SAMPLE_RATE = 192000
+
+class LiveProtocolError(Exception):
+    """A live session message that does not follow the protocol"""
+
+def parse_live_message(text) -> dict:
+    """Decode one JSON text frame of the live protocol"""
+    try:
+        event = json.loads(text or "")
+    except ValueError:
+        raise LiveProtocolError("Messages must be JSON")
+    if not isinstance(event, dict):
+        raise LiveProtocolError("Messages must be JSON objects")
+    return event
+
+def parse_start_message(text) -> dict:
+    """Validate the start message; returns format, sample_rate, question and mode"""
+    start = parse_live_message(text)
+    if start.get("type") != "start":
+        raise LiveProtocolError("Expected a start message")
+    audio_format = start.get("format", "webm")
+    if audio_format not in LIVE_FORMATS:
+        raise LiveProtocolError(f"format must be one of {', '.join(LIVE_FORMATS)}")
+    sample_rate = start.get("sample_rate", TARGET_SAMPLE_RATE)
+    if isinstance(sample_rate, bool) or not isinstance(sample_rate, int) or not 0 < sample_rate <= MAX_LIVE_SAMPLE_RATE:
+        raise LiveProtocolError(f"sample_rate must be an integer between 1 and {MAX_LIVE_SAMPLE_RATE}")
+    mode = start.get("mode", "basic")
+    if mode not in LIVE_MODES:
+        raise LiveProtocolError(f"mode must be one of {', '.join(LIVE_MODES)}")
+    question = start.get("question", "")
+    if not isinstance(question, str):
+        raise LiveProtocolError("question must be a string")
+    return {"format": audio_format, "sample_rate": sample_rate, "question": question, "mode": mode}
+
+def discard_task(task: asyncio.Future):
+    """Cancel a task nobody will await, retrieving its exception if it already failed"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+async def close_live_session(websocket: WebSocket, detail: str, code: int):
+    """Send an error frame and close; the client may already be gone"""
+    try:
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=code)
+    except Exception:
+        pass
+
+@router.websocket("/live")
+async def live_speaking_session(websocket: WebSocket):
+    """
+    Live speaking session. The client sends a JSON start message
+    ({"type": "start", "format": "webm"|"wav"|"pcm16", "sample_rate": 48000,
+    "question": "...", "mode": "basic"|"advanced"}), then binary audio chunks
+    and {"type": "transcript", "text": "...", "final": true} messages from the
+    browser recognizer, and {"type": "stop"} when the user stops speaking.
+    Malformed messages close the socket with 1003, server failures with 1011.
+    """
+    await websocket.accept()
+    loop = asyncio.get_event_loop()
+    session = None
+    try:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        start = parse_start_message(message.get("text"))
+        
+        decoder = create_stream_decoder(start["format"], start["sample_rate"])
+        session = LiveSpeechSession(decoder, start["question"])
+        mode = start["mode"]
+        last_partial = 0
+        
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            
+            if message.get("bytes") is not None:
+                # Resampling and ffmpeg pipe writes block, so decode off the event loop
+                await loop.run_in_executor(None, session.add_audio, message["bytes"])
+                if session.total_samples - last_partial >= PARTIAL_INTERVAL_SAMPLES:
+                    last_partial = session.total_samples
+                    await websocket.send_json(session.partial())
+                continue
+            
+            event = parse_live_message(message.get("text"))
+            if event.get("type") == "transcript":
+                session.add_transcript(str(event.get("text", "")), bool(event.get("final")))
+                await websocket.send_json(session.partial())
+            elif event.get("type") == "stop":
+                break
+        
+        transcript = session.transcript
+        if not transcript:
+            await websocket.send_json({"type": "error", "detail": "No speech recognized"})
+            await websocket.close()
+            return
+        
+        # Start the LLM call right away; it only needs the transcript, while the
+        # local scoring waits for the decoder to flush the final audio
+        if mode == "advanced":
+            analysis_task = asyncio.ensure_future(get_ai_detailed_analysis(transcript))
+        else:
+            analysis_task = asyncio.ensure_future(generate_speak_feedback(transcript, session.question))
+        try:
+            await loop.run_in_executor(None, session.finish_audio)
+            metrics = session.metrics()
+            await websocket.send_json({"type": "analyzing", "transcript": transcript, "metrics": metrics})
+            analysis = await analysis_task
+        except BaseException:
+            # A disconnect or decode failure leaves nobody to await the LLM call
+            discard_task(analysis_task)
+            raise
+        
+        if mode == "advanced":
+            result = await perform_comprehensive_analysis(
+                transcript, session.duration_seconds, [], metrics, ai_analysis=analysis
+            )
+        else:
+            result = analysis
+        
+        await websocket.send_json({"type": "final", "result": model_dump(result), "metrics": metrics})
+        await websocket.close()
+        
+    except WebSocketDisconnect:
+        logger.info("Live speaking session disconnected")
+    except LiveProtocolError as e:
+        logger.warning(f"Live speaking session protocol error: {e}")
+        await close_live_session(websocket, str(e), 1003)
+    except AudioDecodeError as e:
+        logger.warning(f"Live speaking session audio error: {e}")
+        await close_live_session(websocket, str(e), 1003)
+    except Exception as e:
+        logger.error(f"Live speaking session failed: {e}")
+        await close_live_session(websocket, "Speaking analysis failed", 1011)
+    finally:
+        if session:
+            session.close()
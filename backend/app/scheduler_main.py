@@ -16,6 +16,9 @@ from firebase_admin import credentials
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.notification_scheduler import notification_scheduler
+from app.services.email_outbox import close_email_outbox
+from app.services.email_service import email_service
+from app.services.firestore_executor import close_firestore_executor
 
 # Load environment variables
 load_dotenv()
@@ -32,6 +35,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Outbox workers started alongside the scheduler; 0 leaves delivery to app/outbox_worker.py processes
+INLINE_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "1"))
+
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
     try:
@@ -68,15 +74,23 @@ async def main():
     logger.info("Environment variables validated")
     logger.info(f"Email notifications will be sent from: {os.getenv('EMAIL_ADDRESS')}")
     
+    workers = [notification_scheduler.create_outbox_worker() for _ in range(INLINE_OUTBOX_WORKERS)]
     try:
-        # Start the scheduler
-        await notification_scheduler.run_scheduler()
+        # Start the scheduler; it queues emails and the workers deliver them
+        await asyncio.gather(notification_scheduler.run_scheduler(), *(worker.run() for worker in workers))
     except KeyboardInterrupt:
         logger.info("Received interrupt signal, shutting down...")
         notification_scheduler.stop_scheduler()
+        for worker in workers:
+            worker.stop()
     except Exception as e:
         logger.error(f"Scheduler error: {str(e)}")
         sys.exit(1)
+    finally:
+        email_service.close()
+        close_email_outbox()
+        notification_scheduler.close()
+        close_firestore_executor()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import logging
+from typing import Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Canonical format shared by the ASR and fluency stages
+TARGET_SAMPLE_RATE = 16000
+# data chunk sizes written by streaming encoders that do not know the length up front
+UNKNOWN_DATA_SIZES = (0, 0xFFFFFFFF)
+CHUNK_SIZE = 64 * 1024
+SCRATCH_DIR = os.getenv("AUDIO_SCRATCH_DIR", tempfile.gettempdir())
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+class AudioDecodeError(Exception):
+    """Raised when an upload cannot be decoded into PCM"""
+
+
+class LinearResampler:
+    """Streaming linear-interpolation resampler that keeps phase across chunks"""
+
+    def __init__(self, source_rate: int, target_rate: int = TARGET_SAMPLE_RATE):
+        if source_rate <= 0:
+            raise AudioDecodeError(f"Invalid sample rate: {source_rate}")
+        self.step = source_rate / target_rate
+        self.passthrough = source_rate == target_rate
+        self.position = 0.0
+        self.carry = np.zeros(0, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.passthrough:
+            return samples
+        if self.carry.size:
+            samples = np.concatenate((self.carry, samples))
+        last = samples.size - 1
+        if last < 1 or self.position >= last:
+            self.carry = samples[-1:] if samples.size else self.carry
+            self.position -= max(last, 0)
+            return np.zeros(0, dtype=np.float32)
+
+        count = int(np.ceil((last - self.position) / self.step))
+        positions = self.position + self.step * np.arange(count)
+        index = positions.astype(np.int64)
+        frac = (positions - index).astype(np.float32)
+        out = samples[index] * (1.0 - frac) + samples[index + 1] * frac
+
+        # Re-anchor the read position on the last sample, which is carried over
+        self.position = self.position + self.step * count - last
+        self.carry = samples[-1:]
+        return out
+
+
+def pcm_to_mono_float(data: bytes, sample_width: int, channels: int, is_float: bool = False) -> np.ndarray:
+    """Convert interleaved PCM frames to mono float32 in [-1, 1]"""
+    if is_float:
+        samples = np.frombuffer(data, dtype="<f4" if sample_width == 4 else "<f8").astype(np.float32)
+    elif sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+        widened[:, 1:] = raw
+        samples = widened.view("<i4").reshape(-1).astype(np.float32) / 2147483648.0
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise AudioDecodeError(f"Unsupported sample width: {sample_width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def float_to_int16(samples: np.ndarray) -> np.ndarray:
+    """Clip and quantize float samples to int16 PCM"""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+
+
+class WavStreamDecoder:
+    """Incremental RIFF/WAVE decoder producing 16 kHz mono int16 chunks"""
+
+    def __init__(self):
+        self.header = b""
+        self.in_data = False
+        self.pending = b""
+        # Bytes of the data chunk still to decode; None when the size is unknown
+        self.data_remaining = None
+        self.channels = 1
+        self.sample_width = 2
+        self.is_float = False
+        self.resampler = None
+
+    def _parse_header(self) -> bool:
+        """Walk RIFF chunks until the data chunk starts; False if more bytes are needed"""
+        buf = self.header
+        if len(buf) < 12:
+            return False
+        if buf[:4] != b"RIFF" or buf[8:12] != b"WAVE":
+            raise AudioDecodeError("Not a RIFF/WAVE stream")
+
+        offset = 12
+        fmt_seen = False
+        while offset + 8 <= len(buf):
+            chunk_id = buf[offset:offset + 4]
+            chunk_size = struct.unpack("<I", buf[offset + 4:offset + 8])[0]
+            body = offset + 8
+            if chunk_id == b"data":
+                if not fmt_seen:
+                    raise AudioDecodeError("WAV data chunk before fmt chunk")
+                self.in_data = True
+                if chunk_size not in UNKNOWN_DATA_SIZES:
+                    self.data_remaining = chunk_size
+                self.pending = buf[body:]
+                self.header = b""
+                return True
+            if body + chunk_size > len(buf):
+                return False
+            if chunk_id == b"fmt ":
+                if chunk_size < 16:
+                    raise AudioDecodeError(f"WAV fmt chunk too short: {chunk_size} bytes")
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", buf[body:body + 16])
+                if audio_format == 0xFFFE and chunk_size >= 40:
+                    # WAVE_FORMAT_EXTENSIBLE keeps the real format in the sub-format GUID
+                    audio_format = struct.unpack("<H", buf[body + 24:body + 26])[0]
+                if audio_format not in (1, 3):
+                    raise AudioDecodeError(f"Unsupported WAV encoding: {audio_format}")
+                if channels == 0 or sample_rate == 0:
+                    raise AudioDecodeError(f"Invalid WAV format: {channels} channels at {sample_rate} Hz")
+                if bits not in ((32, 64) if audio_format == 3 else (8, 16, 24, 32)):
+                    raise AudioDecodeError(f"Unsupported WAV sample size: {bits} bits")
+                self.channels = channels
+                self.sample_width = bits // 8
+                self.is_float = audio_format == 3
+                self.resampler = LinearResampler(sample_rate)
+                fmt_seen = True
+            offset = body + chunk_size + (chunk_size & 1)
+        return False
+
+    def _take(self, data: bytes) -> bytes:
+        """Trim to the data chunk's declared size; chunks after it (LIST, id3 ...) are not audio"""
+        if self.data_remaining is None:
+            return data
+        data = data[:self.data_remaining]
+        self.data_remaining -= len(data)
+        return data
+
+    def feed(self, data: bytes) -> np.ndarray:
+        if not self.in_data:
+            self.header += data
+            if not self._parse_header():
+                return np.zeros(0, dtype="<i2")
+            data, self.pending = self._take(self.pending), b""
+        else:
+            data = self.pending + self._take(data)
+
+        frame_size = self.sample_width * self.channels
+        usable = len(data) - len(data) % frame_size
+        self.pending = data[usable:]
+        if not usable:
+            return np.zeros(0, dtype="<i2")
+        samples = pcm_to_mono_float(data[:usable], self.sample_width, self.channels, self.is_float)
+        return float_to_int16(self.resampler.process(samples))
+
+    def close(self) -> np.ndarray:
+        if not self.in_data:
+            raise AudioDecodeError("Truncated WAV header")
+        return np.zeros(0, dtype="<i2")
+
+
+class FFmpegStreamDecoder:
+    """Pipes compressed audio (WebM/Opus, OGG, MP4...) through ffmpeg"""
+
+    def __init__(self):
+        if shutil.which(FFMPEG_BINARY) is None:
+            raise AudioDecodeError("ffmpeg is required to decode compressed audio")
+        self.process = subprocess.Popen(
+            [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.output = queue.Queue()
+        self.odd_byte = b""
+        # Drain stdout on a thread so writes to stdin never deadlock
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self):
+        while True:
+            data = self.process.stdout.read1(CHUNK_SIZE)
+            if not data:
+                break
+            self.output.put(data)
+        self.output.put(None)
+
+    def _collect(self, block: bool) -> np.ndarray:
+        parts = [self.odd_byte]
+        while True:
+            try:
+                data = self.output.get(block=block)
+            except queue.Empty:
+                break
+            if data is None:
+                break
+            parts.append(data)
+        data = b"".join(parts)
+        usable = len(data) - len(data) % 2
+        self.odd_byte = data[usable:]
+        return np.frombuffer(data[:usable], dtype="<i2")
+
+    def feed(self, data: bytes) -> np.ndarray:
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            raise AudioDecodeError(self._stderr() or "ffmpeg exited early")
+        return self._collect(block=False)
+
+    def close(self) -> np.ndarray:
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        tail = self._collect(block=True)
+        self.reader.join()
+        if self.process.wait() != 0:
+            raise AudioDecodeError(self._stderr() or "ffmpeg failed to decode audio")
+        return tail
+
+    def _stderr(self) -> str:
+        try:
+            return self.process.stderr.read().decode("utf-8", "replace").strip()
+        except Exception:
+            return ""
+
+
+def open_decoder(first_chunk: bytes):
+    """Pick a decoder by sniffing magic bytes; the upload filename is not trusted"""
+    if first_chunk[:4] == b"RIFF" and first_chunk[8:12] == b"WAVE":
+        return WavStreamDecoder()
+    return FFmpegStreamDecoder()
+
+
+class NormalizedAudio:
+    """16 kHz mono int16 PCM backed by a memory-mapped scratch file"""
+
+    def __init__(self, path: str, num_samples: int, digest: str = ""):
+        self.path = path
+        self.num_samples = num_samples
+        self.sample_rate = TARGET_SAMPLE_RATE
+        # SHA-256 of the original upload bytes, computed while streaming
+        self.digest = digest
+        if num_samples:
+            self.samples = np.memmap(path, dtype="<i2", mode="r", shape=(num_samples,))
+        else:
+            self.samples = np.zeros(0, dtype="<i2")
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.num_samples / self.sample_rate
+
+    def close(self):
+        """Release the mapping and delete the scratch file"""
+        if isinstance(self.samples, np.memmap):
+            self.samples._mmap.close()
+        self.samples = np.zeros(0, dtype="<i2")
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AudioNormalizer:
+    """Push-style normalizer: feed raw upload chunks, get a NormalizedAudio at the end"""
+
+    def __init__(self, scratch_dir: Optional[str] = None):
+        fd, self.path = tempfile.mkstemp(prefix="speech-", suffix=".pcm", dir=scratch_dir or SCRATCH_DIR)
+        self.scratch = os.fdopen(fd, "wb")
+        self.decoder = None
+        self.sniff = b""
+        self.num_samples = 0
+        self.hasher = hashlib.sha256()
+
+    def _write(self, pcm: np.ndarray):
+        if pcm.size:
+            self.scratch.write(pcm.tobytes())
+            self.num_samples += pcm.size
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        self.hasher.update(data)
+        if self.decoder is None:
+            # Need the first 12 bytes to tell RIFF/WAVE apart from containers
+            self.sniff += data
+            if len(self.sniff) < 12:
+                return
+            data, self.sniff = self.sniff, b""
+            self.decoder = open_decoder(data)
+        self._write(self.decoder.feed(data))
+
+    def finish(self) -> NormalizedAudio:
+        try:
+            if self.decoder is None:
+                if not self.sniff:
+                    raise AudioDecodeError("Empty audio upload")
+                self.decoder = open_decoder(self.sniff)
+                self._write(self.decoder.feed(self.sniff))
+            self._write(self.decoder.close())
+        except Exception:
+            self.abort()
+            raise
+        self.scratch.close()
+        return NormalizedAudio(self.path, self.num_samples, self.hasher.hexdigest())
+
+    def abort(self):
+        """Drop the scratch file after a failed decode"""
+        if isinstance(self.decoder, FFmpegStreamDecoder) and self.decoder.process.poll() is None:
+            self.decoder.process.kill()
+        self.scratch.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def normalize_chunks(chunks: Iterable[bytes], scratch_dir: Optional[str] = None) -> NormalizedAudio:
+    """Normalize an iterable of raw audio chunks"""
+    normalizer = AudioNormalizer(scratch_dir)
+    try:
+        for chunk in chunks:
+            normalizer.feed(chunk)
+    except Exception:
+        normalizer.abort()
+        raise
+    return normalizer.finish()
+
+
+async def normalize_upload(upload, scratch_dir: Optional[str] = None) -> NormalizedAudio:
+    """
+    Stream a FastAPI UploadFile through the normalizer chunk by chunk.
+    Resampling and ffmpeg pipe writes block, so each step runs on the
+    default executor and the event loop keeps serving other requests.
+    """
+    loop = asyncio.get_running_loop()
+    normalizer = AudioNormalizer(scratch_dir)
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            await loop.run_in_executor(None, normalizer.feed, chunk)
+    except BaseException:
+        normalizer.abort()
+        raise
+    return await loop.run_in_executor(None, normalizer.finish)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.message import Message
+from typing import Dict, List, Optional, Union
+
+from .email_templates import RenderedMessage
+
+logger = logging.getLogger(__name__)
+
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_SEND_RATE = float(os.getenv("SMTP_SEND_RATE", "10"))
+SMTP_SEND_BURST = int(os.getenv("SMTP_SEND_BURST", "20"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+# Errors that mean the connection itself is unusable, as opposed to one message being refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+
+def connection_lost(e: Exception) -> bool:
+    if isinstance(e, smtplib.SMTPResponseException) and not isinstance(e, smtplib.SMTPConnectError):
+        # 421 is the server closing the session; any other reply is about this message
+        return e.smtp_code == 421
+    return isinstance(e, CONNECTION_ERRORS)
+
+
+def message_refused(e: Exception) -> bool:
+    """The server rejected this message but the session is still usable"""
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code != 421
+    return isinstance(e, smtplib.SMTPRecipientsRefused)
+
+
+class RateLimiter:
+    """Token bucket shared by all connections: `rate` messages per second, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPConnection:
+    """One authenticated SMTP session, opened on first use and reused for many messages"""
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 starttls: bool, max_messages: int):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.server: Optional[smtplib.SMTP] = None
+        self.sent = 0
+
+    def open(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.sent = 0
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    def send(self, msg: Union[RenderedMessage, Message]):
+        # Providers cap messages per session, so start a fresh one before reaching the cap
+        if self.server is not None and self.sent >= self.max_messages:
+            self.close()
+        if self.server is None:
+            self.open()
+        if isinstance(msg, RenderedMessage):
+            # Bodies are 8bit UTF-8; servers without 8BITMIME and over-long lines get quoted-printable
+            if self.server.has_extn("8bitmime") and msg.fits_8bit():
+                self.server.sendmail(msg.from_addr, msg.to_addrs, msg.data, mail_options=["BODY=8BITMIME"])
+            else:
+                self.server.sendmail(msg.from_addr, msg.to_addrs, msg.quoted_printable())
+        else:
+            self.server.send_message(msg)
+        self.sent += 1
+
+
+class EmailDispatcher:
+    """
+    Sends messages over a small pool of persistent SMTP connections. Each
+    worker thread owns one connection and sends its messages back to back on
+    it, so the connect, STARTTLS and login round trips are paid once per
+    connection instead of once per message. A dropped connection is reopened
+    and the message retried once. A shared token bucket keeps the overall
+    send rate within the provider's quota.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 pool_size: int = SMTP_POOL_SIZE, rate: float = SMTP_SEND_RATE, burst: int = SMTP_SEND_BURST,
+                 starttls: bool = SMTP_STARTTLS, max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.limiter = RateLimiter(rate, burst)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="smtp")
+        self.local = threading.local()
+        self.connections: List[SMTPConnection] = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.reconnects = 0
+
+    def _connection(self) -> SMTPConnection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = SMTPConnection(self.host, self.port, self.username, self.password,
+                                        self.starttls, self.max_messages)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def _count(self, sent: int = 0, failed: int = 0, reconnects: int = 0):
+        with self.lock:
+            self.sent += sent
+            self.failed += failed
+            self.reconnects += reconnects
+
+    def _deliver(self, msg: Union[RenderedMessage, Message]) -> bool:
+        connection = self._connection()
+        self.limiter.acquire()
+        try:
+            reused = connection.server is not None
+            try:
+                connection.send(msg)
+            except Exception as e:
+                if not reused or not connection_lost(e):
+                    raise
+                # The server dropped or timed out an idle session; retry once on a fresh one
+                logger.warning(f"SMTP connection lost, reconnecting: {str(e)}")
+                connection.close()
+                self._count(reconnects=1)
+                connection.send(msg)
+            self._count(sent=1)
+            return True
+        except Exception as e:
+            if not message_refused(e):
+                # Anything but a refusal may leave the session mid-command, so start a fresh one next time
+                connection.close()
+            logger.error(f"Failed to send email to {msg['To']}: {str(e)}")
+            self._count(failed=1)
+            return False
+
+    def submit(self, msg: Union[RenderedMessage, Message]) -> Future:
+        """Queue a message; the future resolves to True once the server accepts it"""
+        return self.executor.submit(self._deliver, msg)
+
+    def send(self, msg: Union[RenderedMessage, Message]) -> bool:
+        return self.submit(msg).result()
+
+    async def send_async(self, msg: Union[RenderedMessage, Message]) -> bool:
+        """Send without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(msg))
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "reconnects": self.reconnects,
+                "open_connections": sum(1 for c in self.connections if c.server is not None),
+            }
+
+    def close(self):
+        """Finish queued messages, then QUIT every connection"""
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
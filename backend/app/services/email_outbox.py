@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_PATH = os.getenv("EMAIL_OUTBOX_PATH", "email_outbox.db")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_OUTBOX_RETRY_BASE", "60"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("EMAIL_OUTBOX_LEASE", "300"))
+OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+
+# Message type -> EmailService coroutine taking (to_email, **payload)
+SEND_METHODS = {
+    "streak_reminder": "send_streak_reminder_async",
+    "streak_broken": "send_streak_broken_email_async",
+    "achievement": "send_achievement_email_async",
+}
+
+
+def idempotency_key(user_id: str, message_type: str, date: str) -> str:
+    return f"{user_id}|{message_type}|{date}"
+
+
+class EmailOutbox:
+    """
+    Durable queue of outgoing emails in SQLite. Each message is keyed by
+    (user, type, date), so enqueueing the same reminder twice is a no-op
+    and a re-run job only fills in what is missing. Workers claim due
+    messages under a lease: a worker that dies mid-batch leaves its claims
+    to expire and be picked up again, and each claim carries its own lease
+    token so only the worker holding a message can record its outcome.
+    Failed sends are retried with
+    exponential backoff and dead-lettered after OUTBOX_MAX_ATTEMPTS.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            user_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            to_email TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            lease_until REAL,
+            lease_owner TEXT,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+        CREATE INDEX IF NOT EXISTS idx_outbox_day ON outbox (date, type, user_id);
+    """
+
+    def __init__(self, path: str = EMAIL_OUTBOX_PATH, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 retry_base: float = OUTBOX_RETRY_BASE_SECONDS, retry_max: float = OUTBOX_RETRY_MAX_SECONDS,
+                 lease: float = OUTBOX_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(outbox)")}
+        if "lease_owner" not in columns:
+            # Outboxes created before claims were tagged with their owner
+            conn.execute("ALTER TABLE outbox ADD COLUMN lease_owner TEXT")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets workers read while the scheduler enqueues"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def enqueue_many(self, messages: Iterable[Dict]) -> int:
+        """
+        Queue {"user_id", "type", "date", "to_email", "payload"} messages in
+        one transaction; returns how many were new
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, user_id, type, date, to_email, payload, "
+                "next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (idempotency_key(m["user_id"], m["type"], m["date"]), m["user_id"], m["type"], m["date"],
+                     m["to_email"], json.dumps(m["payload"]), now, now)
+                    for m in messages
+                ],
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def enqueue(self, user_id: str, message_type: str, date: str, to_email: str, payload: Dict) -> bool:
+        return self.enqueue_many([{
+            "user_id": user_id, "type": message_type, "date": date, "to_email": to_email, "payload": payload,
+        }]) == 1
+
+    def day_keys(self, date: str) -> Set[Tuple[str, str]]:
+        """(user_id, type) of every message for `date`, whatever its status"""
+        rows = self._connection().execute("SELECT user_id, type FROM outbox WHERE date = ?", (date,))
+        return {(row["user_id"], row["type"]) for row in rows}
+
+    def claim(self, limit: int = OUTBOX_BATCH_SIZE) -> List[Dict]:
+        """Lease up to `limit` due messages, including ones whose previous lease expired"""
+        now = time.time()
+        owner = uuid.uuid4().hex
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "UNION ALL SELECT * FROM outbox WHERE status = 'sending' AND lease_until < ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', lease_until = ?, lease_owner = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                [(now + self.lease, owner, row["id"]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            {
+                "id": row["id"],
+                "user_id": row["user_id"],
+                "type": row["type"],
+                "date": row["date"],
+                "to_email": row["to_email"],
+                "payload": json.loads(row["payload"]),
+                "attempts": row["attempts"] + 1,
+                "lease_owner": owner,
+            }
+            for row in rows
+        ]
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    def complete(self, results: Iterable[tuple]):
+        """
+        Record (message, error) outcomes from a claimed batch; error is None
+        on success. Messages whose lease expired and were claimed again by
+        another worker are left to that worker.
+        """
+        now = time.time()
+        sent, retries, dead = [], [], []
+        for message, error in results:
+            lease = (message["id"], message["lease_owner"])
+            if error is None:
+                sent.append((now,) + lease)
+            elif message["attempts"] >= self.max_attempts:
+                dead.append((error,) + lease)
+                logger.error(f"Dead-lettered {message['type']} email to {message['to_email']} "
+                             f"after {message['attempts']} attempts: {error}")
+            else:
+                retries.append((now + self.retry_delay(message["attempts"]), error) + lease)
+        owned = "WHERE id = ? AND status = 'sending' AND lease_owner = ?"
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, lease_until = NULL, lease_owner = NULL, "
+                "last_error = NULL " + owned,
+                sent,
+            )
+            conn.executemany(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ?, lease_until = NULL, lease_owner = NULL, "
+                "last_error = ? " + owned,
+                retries,
+            )
+            conn.executemany(
+                "UPDATE outbox SET status = 'dead', lease_until = NULL, lease_owner = NULL, last_error = ? " + owned,
+                dead,
+            )
+            stale = len(sent) + len(retries) + len(dead) - (conn.total_changes - before)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if stale:
+            logger.warning(f"Skipped {stale} outbox results: their lease expired and another worker claimed them")
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        rows = self._connection().execute(
+            "SELECT id, user_id, type, date, to_email, attempts, last_error FROM outbox "
+            "WHERE status = 'dead' ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def retry_dead(self) -> int:
+        """Put every dead-lettered message back in the queue with a fresh attempt budget"""
+        cursor = self._connection().execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        counts = {"pending": 0, "sending": 0, "sent": 0, "dead": 0}
+        for row in self._connection().execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return counts
+
+    def close(self):
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+class OutboxWorker:
+    """
+    Drains the outbox: claims a batch, sends it concurrently through the
+    email service, then records every outcome in one transaction.
+    `on_sent` runs for each delivered message (the scheduler logs it).
+    """
+
+    def __init__(self, outbox: EmailOutbox, email_service, batch_size: int = OUTBOX_BATCH_SIZE,
+                 on_sent: Optional[Callable[[Dict], Awaitable[None]]] = None):
+        self.outbox = outbox
+        self.email_service = email_service
+        self.batch_size = batch_size
+        self.on_sent = on_sent
+        self.is_running = False
+
+    async def _send(self, message: Dict) -> tuple:
+        try:
+            send = getattr(self.email_service, SEND_METHODS[message["type"]])
+            if not await send(message["to_email"], **message["payload"]):
+                return message, "send failed"
+        except Exception as e:
+            return message, str(e)
+        # The email is out; a failing hook must not turn it into a retry and a second send
+        if self.on_sent is not None:
+            try:
+                await self.on_sent(message)
+            except Exception as e:
+                logger.error(f"Error after sending {message['type']} to {message['to_email']}: {str(e)}")
+        return message, None
+
+    async def run_once(self) -> int:
+        """Deliver one claimed batch; returns the number of messages attempted"""
+        loop = asyncio.get_running_loop()
+        batch = await loop.run_in_executor(None, self.outbox.claim, self.batch_size)
+        if not batch:
+            return 0
+        results = await asyncio.gather(*(self._send(message) for message in batch))
+        await loop.run_in_executor(None, self.outbox.complete, results)
+        return len(batch)
+
+    async def drain(self) -> int:
+        """Deliver everything currently due"""
+        total = 0
+        while True:
+            attempted = await self.run_once()
+            if not attempted:
+                return total
+            total += attempted
+
+    async def run(self, poll_interval: float = OUTBOX_POLL_SECONDS):
+        self.is_running = True
+        while self.is_running:
+            try:
+                if not await self.run_once():
+                    await asyncio.sleep(poll_interval)
+            except Exception as e:
+                logger.error(f"Outbox worker error: {str(e)}")
+                await asyncio.sleep(poll_interval)
+
+    def stop(self):
+        self.is_running = False
+
+
+_outbox: Optional[EmailOutbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_email_outbox() -> EmailOutbox:
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = EmailOutbox(EMAIL_OUTBOX_PATH)
+    return _outbox
+
+
+def close_email_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is not None:
+            _outbox.close()
+            _outbox = None
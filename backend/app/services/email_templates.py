@@ -0,0 +1,407 @@
+import html
+import quopri
+import uuid
+from functools import lru_cache
+from email.header import Header
+from email.utils import formataddr
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+
+class CompiledTemplate:
+    """
+    A template split once into static segments and named slots. Static
+    segments are stored already encoded as UTF-8 with CRLF line endings, so
+    rendering only encodes the slot values and joins bytes. Slot values that
+    are bytes are spliced in as-is (pre-rendered fragments); anything else
+    is converted to text, HTML-escaped for HTML templates, and encoded.
+    """
+
+    def __init__(self, source: str, escape_html: bool = False):
+        self.escape_html = escape_html
+        self.parts: List[bytes] = []
+        self.slots: List[Tuple[int, str]] = []
+        literal_run = []
+        for literal, field, _, _ in Formatter().parse(source):
+            literal_run.append(literal)
+            if field is not None:
+                self._add_static("".join(literal_run))
+                literal_run = []
+                self.slots.append((len(self.parts), field))
+                self.parts.append(b"")
+        self._add_static("".join(literal_run))
+
+    def _add_static(self, text: str):
+        if text:
+            self.parts.append(text.replace("\r\n", "\n").replace("\n", "\r\n").encode("utf-8"))
+
+    def _encode(self, value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        text = str(value)
+        if self.escape_html:
+            text = html.escape(text)
+        return text.encode("utf-8")
+
+    def render(self, values: Dict) -> bytes:
+        parts = self.parts.copy()
+        for index, name in self.slots:
+            parts[index] = self._encode(values[name])
+        return b"".join(parts)
+
+    def render_str(self, values: Dict) -> str:
+        return self.render(values).decode("utf-8").replace("\r\n", "\n")
+
+
+class EmailTemplate:
+    """Subject, HTML and plain-text bodies of one email type, compiled once"""
+
+    def __init__(self, subject: str, html_source: str, text_source: str):
+        self.subject = subject
+        self.html = CompiledTemplate(html_source, escape_html=True)
+        self.text = CompiledTemplate(text_source)
+
+
+# RFC 5321 limit on a line's length, excluding the CRLF
+MAX_LINE_OCTETS = 998
+
+
+class RenderedMessage:
+    """
+    A complete message, encoded and ready to hand to SMTP DATA. `data` has
+    8bit bodies; `quoted_printable()` rebuilds it for servers without
+    8BITMIME or bodies with lines too long to send as 8bit.
+    """
+
+    __slots__ = ("from_addr", "to_addrs", "subject", "data", "builder", "parts")
+
+    def __init__(self, from_addr: str, to_addr: str, subject: str, data: bytes,
+                 builder: Optional["MessageBuilder"] = None, parts: tuple = ()):
+        self.from_addr = from_addr
+        self.to_addrs = [to_addr]
+        self.subject = subject
+        self.data = data
+        self.builder = builder
+        self.parts = parts
+
+    def fits_8bit(self) -> bool:
+        return all(
+            len(line) <= MAX_LINE_OCTETS
+            for body in self.parts[1:] if body
+            for line in body.split(b"\r\n")
+        )
+
+    def quoted_printable(self) -> bytes:
+        return self.builder.assemble_quoted_printable(*self.parts)
+
+    def __getitem__(self, name: str) -> Optional[str]:
+        # Enough of email.message.Message's header access for logging
+        return {"To": self.to_addrs[0], "From": self.from_addr, "Subject": self.subject}.get(name)
+
+
+# Subjects only vary by a streak count or achievement name, so their encoded forms repeat
+@lru_cache(maxsize=1024)
+def encode_header(value: str) -> str:
+    if "\r" in value or "\n" in value:
+        raise ValueError("Header value contains a line break")
+    return value if value.isascii() else Header(value, "utf-8").encode(linesep="\r\n")
+
+
+class MessageBuilder:
+    """
+    Assembles multipart/alternative messages from pre-encoded pieces. The
+    top-level headers that never change, the MIME boundary and both part
+    headers are encoded once; a message costs the per-recipient headers plus
+    one join. Bodies are sent as 8bit UTF-8, which every mainstream
+    provider accepts (8BITMIME), so no base64 pass over the body is needed;
+    a server without it gets the bodies as quoted-printable instead.
+    """
+
+    def __init__(self, from_name: str, from_address: str):
+        self.from_address = from_address or ""
+        boundary = f"=_fluentease_{uuid.uuid4().hex}"
+        self.head = (
+            f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+            f"MIME-Version: 1.0\r\n"
+            f"From: {formataddr((from_name, self.from_address))}\r\n"
+        ).encode("utf-8")
+        self.text_open = (
+            f"\r\n--{boundary}\r\n"
+            f'Content-Type: text/plain; charset="utf-8"\r\n'
+            f"Content-Transfer-Encoding: 8bit\r\n\r\n"
+        ).encode("ascii")
+        self.html_open = (
+            f"\r\n--{boundary}\r\n"
+            f'Content-Type: text/html; charset="utf-8"\r\n'
+            f"Content-Transfer-Encoding: 8bit\r\n\r\n"
+        ).encode("ascii")
+        self.close = f"\r\n--{boundary}--\r\n".encode("ascii")
+        self.text_open_qp = self.text_open.replace(b"8bit", b"quoted-printable")
+        self.html_open_qp = self.html_open.replace(b"8bit", b"quoted-printable")
+
+    def _assemble(self, headers: bytes, text_body: Optional[bytes], html_body: bytes,
+                  text_open: bytes, html_open: bytes) -> bytes:
+        if text_body:
+            return b"".join((self.head, headers, text_open, text_body, html_open, html_body, self.close))
+        return b"".join((self.head, headers, html_open, html_body, self.close))
+
+    def assemble_quoted_printable(self, headers: bytes, text_body: Optional[bytes], html_body: bytes) -> bytes:
+        return self._assemble(
+            headers,
+            quopri.encodestring(text_body) if text_body else None,
+            quopri.encodestring(html_body),
+            self.text_open_qp,
+            self.html_open_qp,
+        )
+
+    def build(self, to_email: str, subject: str, html_body: bytes, text_body: Optional[bytes] = None) -> RenderedMessage:
+        if "\r" in to_email or "\n" in to_email:
+            raise ValueError("Invalid recipient address")
+        headers = f"Subject: {encode_header(subject)}\r\nTo: {to_email}\r\n".encode("utf-8")
+        data = self._assemble(headers, text_body, html_body, self.text_open, self.html_open)
+        return RenderedMessage(self.from_address, to_email, subject, data, self, (headers, text_body, html_body))
+
+    def render(self, template: EmailTemplate, to_email: str, values: Dict) -> RenderedMessage:
+        subject = template.subject.format(**values)
+        return self.build(to_email, subject, template.html.render(values), template.text.render(values))
+
+
+def encode_body(content: str) -> bytes:
+    """Encode free-form body text the way compiled templates store theirs"""
+    return content.replace("\r\n", "\n").replace("\n", "\r\n").encode("utf-8")
+
+
+# -- templates ---------------------------------------------------------------
+
+STREAK_REMINDER_HTML = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Keep Your Streak Going!</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: linear-gradient(135deg, #ff6b6b, #ffa500); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                .streak-counter {{ background: white; padding: 20px; border-radius: 10px; text-align: center; margin: 20px 0; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+                .cta-button {{ display: inline-block; background: #4CAF50; color: white; padding: 15px 30px; text-decoration: none; border-radius: 25px; font-weight: bold; margin: 20px 0; }}
+                .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>🔥 Don't Break Your Streak!</h1>
+                    <p>Hi {user_name}, your learning journey is on fire!</p>
+                </div>
+                <div class="content">
+                    <div class="streak-counter">
+                        <h2 style="color: #ff6b6b; margin: 0;">Current Streak</h2>
+                        <div style="font-size: 48px; font-weight: bold; color: #333; margin: 10px 0;">{current_streak}</div>
+                        <p style="margin: 0; color: #666;">consecutive days</p>
+                    </div>
+                    
+                    <p>You're doing amazing! You've been learning consistently for <strong>{current_streak} days</strong> in a row.</p>
+                    
+                    {record_note_html}
+                    
+                    <p>Don't let this streak end! Just 5-10 minutes of practice today will keep your momentum going.</p>
+                    
+                    <div style="text-align: center;">
+                        <a href="https://your-app-url.com/speak" class="cta-button">🎤 Practice Speaking</a>
+                        <a href="https://your-app-url.com/write" class="cta-button">✍️ Practice Writing</a>
+                        <a href="https://your-app-url.com/describe" class="cta-button">🖼️ Practice Describing</a>
+                    </div>
+                    
+                    <p style="margin-top: 30px; padding: 15px; background: #e8f5e8; border-radius: 5px;">
+                        💡 <strong>Quick Tip:</strong> Set a daily reminder on your phone to practice at the same time each day. Consistency is key to language learning success!
+                    </p>
+                </div>
+                <div class="footer">
+                    <p>Keep learning, keep growing! 🌱</p>
+                    <p>FluentEase - Your English Learning Companion</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+STREAK_REMINDER_TEXT = """
+        Hi {user_name},
+
+        🔥 Don't Break Your {current_streak}-Day Streak!
+
+        You're doing amazing! You've been learning consistently for {current_streak} days in a row.
+
+        {record_note_text}
+
+        Don't let this streak end! Just 5-10 minutes of practice today will keep your momentum going.
+
+        Practice options:
+        🎤 Speaking Practice
+        ✍️ Writing Practice  
+        🖼️ Describing Practice
+
+        💡 Quick Tip: Set a daily reminder on your phone to practice at the same time each day. Consistency is key to language learning success!
+
+        Keep learning, keep growing! 🌱
+        FluentEase - Your English Learning Companion
+        """
+
+STREAK_BROKEN_HTML = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Let's Start Fresh!</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: linear-gradient(135deg, #6c5ce7, #a29bfe); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                .cta-button {{ display: inline-block; background: #00b894; color: white; padding: 15px 30px; text-decoration: none; border-radius: 25px; font-weight: bold; margin: 20px 0; }}
+                .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>💔 Streak Ended - But Don't Give Up!</h1>
+                    <p>Hi {user_name}, every expert was once a beginner.</p>
+                </div>
+                <div class="content">
+                    <p>Your {broken_streak}-day learning streak has ended, but that doesn't diminish the amazing progress you made!</p>
+                    
+                    <p>🌟 <strong>What you achieved:</strong></p>
+                    <ul>
+                        <li>✅ {broken_streak} consecutive days of learning</li>
+                        <li>✅ Built a strong learning habit</li>
+                        <li>✅ Improved your English skills significantly</li>
+                    </ul>
+                    
+                    <p>The best time to start a new streak is right now! Even the most successful learners have ups and downs.</p>
+                    
+                    <div style="text-align: center;">
+                        <a href="https://your-app-url.com/streaks" class="cta-button">🔥 Start New Streak</a>
+                    </div>
+                    
+                    <p style="margin-top: 30px; padding: 15px; background: #e8f4fd; border-radius: 5px;">
+                        💪 <strong>Remember:</strong> Progress isn't always linear. What matters is getting back on track and continuing your learning journey!
+                    </p>
+                </div>
+                <div class="footer">
+                    <p>You've got this! 💪</p>
+                    <p>FluentEase - Your English Learning Companion</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+STREAK_BROKEN_TEXT = """
+        Hi {user_name},
+
+        💔 Your {broken_streak}-day streak ended, but don't give up!
+
+        What you achieved:
+        ✅ {broken_streak} consecutive days of learning
+        ✅ Built a strong learning habit  
+        ✅ Improved your English skills significantly
+
+        The best time to start a new streak is right now! Even the most successful learners have ups and downs.
+
+        💪 Remember: Progress isn't always linear. What matters is getting back on track and continuing your learning journey!
+
+        You've got this! 💪
+        FluentEase - Your English Learning Companion
+        """
+
+ACHIEVEMENT_HTML = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Achievement Unlocked!</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: linear-gradient(135deg, #ffd700, #ffb347); color: #333; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                .achievement {{ background: white; padding: 30px; border-radius: 10px; text-align: center; margin: 20px 0; box-shadow: 0 4px 15px rgba(255,215,0,0.3); }}
+                .cta-button {{ display: inline-block; background: #ff6b6b; color: white; padding: 15px 30px; text-decoration: none; border-radius: 25px; font-weight: bold; margin: 20px 0; }}
+                .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>🏆 Achievement Unlocked!</h1>
+                    <p>Congratulations {user_name}!</p>
+                </div>
+                <div class="content">
+                    <div class="achievement">
+                        <div style="font-size: 64px; margin-bottom: 15px;">{achievement_emoji}</div>
+                        <h2 style="color: #ffd700; margin: 0 0 10px 0;">{achievement_name}</h2>
+                        <p style="color: #666; margin: 0;">You've reached a new milestone!</p>
+                    </div>
+                    
+                    <p>Your dedication to learning English is paying off! This achievement shows your commitment to consistent practice and improvement.</p>
+                    
+                    <p>Keep up the fantastic work and continue building your English skills. Every day of practice brings you closer to fluency!</p>
+                    
+                    <div style="text-align: center;">
+                        <a href="https://your-app-url.com/streaks" class="cta-button">🔥 View All Achievements</a>
+                    </div>
+                </div>
+                <div class="footer">
+                    <p>Celebrating your success! 🎉</p>
+                    <p>FluentEase - Your English Learning Companion</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+ACHIEVEMENT_TEXT = """
+        Hi {user_name},
+
+        🏆 Achievement Unlocked!
+
+        {achievement_emoji} {achievement_name}
+
+        Your dedication to learning English is paying off! This achievement shows your commitment to consistent practice and improvement.
+
+        Keep up the fantastic work and continue building your English skills. Every day of practice brings you closer to fluency!
+
+        Celebrating your success! 🎉
+        FluentEase - Your English Learning Companion
+        """
+
+RECORD_NOTE_HTML = CompiledTemplate(
+    "<p>🏆 You're getting close to beating your personal record of <strong>{longest_streak} days</strong>!</p>",
+    escape_html=True,
+)
+RECORD_NOTE_TEXT = CompiledTemplate("🏆 You're getting close to beating your personal record of {longest_streak} days!")
+
+STREAK_REMINDER = EmailTemplate(
+    "🔥 Don't break your {current_streak}-day learning streak!", STREAK_REMINDER_HTML, STREAK_REMINDER_TEXT
+)
+STREAK_BROKEN = EmailTemplate(
+    "💔 Your {broken_streak}-day streak ended - Let's start fresh!", STREAK_BROKEN_HTML, STREAK_BROKEN_TEXT
+)
+ACHIEVEMENT = EmailTemplate("🏆 Achievement Unlocked: {achievement_name}!", ACHIEVEMENT_HTML, ACHIEVEMENT_TEXT)
+
+
+def streak_reminder_values(user_name: str, current_streak: int, longest_streak: int) -> Dict:
+    near_record = current_streak >= longest_streak - 2
+    record = {"longest_streak": longest_streak}
+    return {
+        "user_name": user_name,
+        "current_streak": current_streak,
+        "record_note_html": RECORD_NOTE_HTML.render(record) if near_record else b"",
+        "record_note_text": RECORD_NOTE_TEXT.render(record) if near_record else b"",
+    }
@@ -0,0 +1,42 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+# Blocking Firestore calls that may be in flight at once from async code
+FIRESTORE_EXECUTOR_THREADS = int(os.getenv("FIRESTORE_EXECUTOR_THREADS", "16"))
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_firestore_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FIRESTORE_EXECUTOR_THREADS, thread_name_prefix="firestore")
+    return _executor
+
+
+async def run_firestore(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking Firestore call on the shared pool so it does not stall
+    the event loop. The pool size caps how many calls run at once; further
+    calls wait for a free thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_firestore_executor(), functools.partial(func, *args, **kwargs))
+
+
+def close_firestore_executor():
+    """Wait for in-flight Firestore calls on shutdown"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,306 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .reminder_slots import get_zone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "10"))
+# "file" (one leader per host), "firestore" (one leader across hosts) or "none"
+SCHEDULER_LEADER = os.getenv("SCHEDULER_LEADER", "file")
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", "notification_scheduler.lock")
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "60"))
+
+# A trigger maps the current time to the job's next run time (aware datetimes)
+Trigger = Callable[[datetime], datetime]
+
+
+def every_slot(minutes: int) -> Trigger:
+    """Runs at the start of every `minutes`-long slot of the hour (:00, :30, ... for 30)"""
+    def next_run(now: datetime) -> datetime:
+        start = now.replace(second=0, microsecond=0)
+        return start + timedelta(minutes=minutes - start.minute % minutes)
+    return next_run
+
+
+def daily_at(at: str, zone: Optional[str] = None) -> Trigger:
+    """Runs once a day at "HH:MM" in `zone` (server local time if None)"""
+    hour, minute = (int(part) for part in at.split(":"))
+
+    def next_run(now: datetime) -> datetime:
+        # Work in naive wall-clock time and attach the offset last, so a run
+        # after a DST change gets that day's offset rather than today's
+        tz = get_zone(zone) if zone else None
+        local = now.astimezone(tz).replace(tzinfo=None)
+        run = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run <= local:
+            run += timedelta(days=1)
+        # A naive datetime's astimezone() applies the server's local rules for that date
+        return run.replace(tzinfo=tz) if tz else run.astimezone()
+    return next_run
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[datetime], Awaitable[None]], trigger: Trigger, jitter: float):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.task: Optional[asyncio.Task] = None
+        self.next_run: Optional[datetime] = None
+        self.runs = 0
+        self.skipped = 0
+        self.last_duration: Optional[float] = None
+
+
+class TimerScheduler:
+    """
+    Runs async jobs off a heap of wake-up times. The loop sleeps exactly
+    until the earliest due job instead of polling. Each run is started as
+    its own task, and a job whose previous run is still going skips its
+    turn rather than overlapping it. Jobs get a random start delay of up
+    to `jitter` seconds and receive their nominal run time as an argument.
+    Jobs only run while this process holds `leader`; runs still in progress
+    when the lease is lost are cancelled so they can't overlap the new
+    leader's.
+    """
+
+    def __init__(self, leader=None, retry_interval: float = 15.0):
+        self.jobs: List[Job] = []
+        self.heap: List[tuple] = []
+        self.counter = itertools.count()
+        self.leader = leader
+        self.retry_interval = retry_interval
+        self.changed = asyncio.Event()
+        self.is_running = False
+        self.is_leader = False
+
+    def add_job(self, name: str, func: Callable[[datetime], Awaitable[None]], trigger: Trigger,
+                jitter: float = SCHEDULER_JITTER_SECONDS):
+        self.jobs.append(Job(name, func, trigger, jitter))
+
+    def _push(self, job: Job, now: datetime):
+        job.next_run = job.trigger(now)
+        due = job.next_run.timestamp() + random.uniform(0, job.jitter)
+        heapq.heappush(self.heap, (due, next(self.counter), job))
+
+    async def _execute(self, job: Job, scheduled: datetime):
+        started = time.monotonic()
+        try:
+            await job.func(scheduled)
+        except Exception as e:
+            logger.error(f"Scheduled job {job.name} failed: {str(e)}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+
+    def _start(self, job: Job, scheduled: datetime):
+        if job.task is not None and not job.task.done():
+            job.skipped += 1
+            logger.warning(f"Skipping {job.name} at {scheduled:%H:%M}: previous run still in progress")
+            return
+        job.task = asyncio.create_task(self._execute(job, scheduled), name=f"job-{job.name}")
+
+    def _running(self) -> List[asyncio.Task]:
+        return [job.task for job in self.jobs if job.task is not None and not job.task.done()]
+
+    async def _cancel_running(self):
+        running = self._running()
+        for task in running:
+            logger.warning(f"Cancelling {task.get_name()}: scheduler leadership lost")
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run_jobs(self):
+        self.heap = []
+        now = datetime.now(timezone.utc)
+        for job in self.jobs:
+            self._push(job, now)
+        while self.is_running and self.is_leader and self.heap:
+            due, _, job = self.heap[0]
+            delay = due - time.time()
+            if delay > 0:
+                # Sleep until the earliest job, waking early on stop or lost leadership
+                self.changed.clear()
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            self._start(job, job.next_run)
+            # Schedule from the current time so a long stall skips missed runs instead of replaying them
+            self._push(job, datetime.now(timezone.utc))
+
+    async def _keep_leadership(self):
+        """Renew the lease; on failure stop starting jobs and fall back to standby"""
+        while self.is_running and self.is_leader:
+            await asyncio.sleep(self.leader.renew_interval)
+            if not await asyncio.get_running_loop().run_in_executor(None, self.leader.renew):
+                logger.warning("Lost scheduler leadership")
+                self.is_leader = False
+                self.changed.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.is_running = True
+        while self.is_running:
+            if self.leader is not None and not await loop.run_in_executor(None, self.leader.acquire):
+                logger.debug("Another process is the scheduler leader; standing by")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            self.is_leader = True
+            logger.info(f"Scheduler is leader; running {len(self.jobs)} jobs")
+            renewer = asyncio.create_task(self._keep_leadership()) if self.leader is not None else None
+            try:
+                await self._run_jobs()
+            finally:
+                if renewer is not None:
+                    renewer.cancel()
+            if not self.is_leader:
+                await self._cancel_running()
+        await self._shutdown()
+
+    async def _shutdown(self):
+        running = self._running()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        if self.leader is not None and self.is_leader:
+            await asyncio.get_running_loop().run_in_executor(None, self.leader.release)
+        self.is_leader = False
+
+    def stop(self):
+        self.is_running = False
+        self.changed.set()
+
+    def stats(self) -> List[Dict]:
+        return [
+            {
+                "name": job.name,
+                "next_run": job.next_run.isoformat() if job.next_run else None,
+                "running": job.task is not None and not job.task.done(),
+                "runs": job.runs,
+                "skipped": job.skipped,
+                "last_duration": job.last_duration,
+            }
+            for job in self.jobs
+        ]
+
+
+class FileLeaderLock:
+    """
+    Leadership among processes on one host: an exclusive, non-blocking lock
+    on a local file, held for the life of the process. The OS releases it
+    if the process dies, so a standby takes over on its next attempt.
+    """
+
+    renew_interval = 30.0
+
+    def __init__(self, path: str = SCHEDULER_LOCK_PATH):
+        self.path = path
+        self.file = None
+
+    def acquire(self) -> bool:
+        if self.file is not None:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{socket.gethostname()} {os.getpid()}\n")
+        handle.flush()
+        self.file = handle
+        return True
+
+    def renew(self) -> bool:
+        return self.file is not None
+
+    def release(self):
+        if self.file is not None:
+            # Closing the handle drops the lock
+            self.file.close()
+            self.file = None
+
+
+class FirestoreLeaderLease:
+    """
+    Leadership across hosts: a lease document naming the holder and its
+    expiry, taken and renewed in transactions. A leader that stops renewing
+    loses the lease after `ttl` seconds.
+    """
+
+    def __init__(self, db, name: str = "notification_scheduler", ttl: float = SCHEDULER_LEASE_SECONDS):
+        self.db = db
+        self.ref = db.collection("scheduler_leases").document(name)
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _claim(self) -> bool:
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def claim(transaction) -> bool:
+            snapshot = self.ref.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else None
+            now = time.time()
+            if lease and lease["holder"] != self.holder and lease["expires_at"] > now:
+                return False
+            transaction.set(self.ref, {"holder": self.holder, "expires_at": now + self.ttl})
+            return True
+
+        return claim(self.db.transaction())
+
+    def acquire(self) -> bool:
+        try:
+            return self._claim()
+        except Exception as e:
+            logger.error(f"Failed to acquire scheduler lease: {str(e)}")
+            return False
+
+    def renew(self) -> bool:
+        return self.acquire()
+
+    def release(self):
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def release(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict()["holder"] == self.holder:
+                transaction.delete(self.ref)
+
+        try:
+            release(self.db.transaction())
+        except Exception as e:
+            logger.error(f"Failed to release scheduler lease: {str(e)}")
+
+
+def create_leader(db=None, kind: str = SCHEDULER_LEADER):
+    if kind == "file":
+        return FileLeaderLock()
+    if kind == "firestore":
+        return FirestoreLeaderLease(db)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown scheduler leader election: {kind}")
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+from itertools import islice
+from typing import Dict, List, Optional
+
+from .progress_store import LEADERBOARD_SECTIONS, ProgressStore
+
+logger = logging.getLogger(__name__)
+
+# Rebuild from the store this often so each worker sees the others' updates (0 = never, for one worker)
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "0"))
+
+
+def anonymize_user_id(user_id: str) -> str:
+    """Stable anonymous ID; unlike hash(), the same across processes and restarts"""
+    return f"User_{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:8]}"
+
+
+class _Node:
+    __slots__ = ("key", "value", "forward")
+
+    def __init__(self, key, value, level: int):
+        self.key = key
+        self.value = value
+        self.forward = [None] * level
+
+
+class SkipList:
+    """Ordered map with O(log n) expected insert/remove and in-order iteration"""
+
+    MAX_LEVEL = 16
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, None, self.MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _predecessors(self, key) -> List[_Node]:
+        update = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        return update
+
+    def insert(self, key, value):
+        update = self._predecessors(key)
+        level = self._random_level()
+        if level > self.level:
+            self.level = level
+        node = _Node(key, value, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+        self.size += 1
+
+    def remove(self, key) -> bool:
+        update = self._predecessors(key)
+        node = update[0].forward[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(len(node.forward)):
+            update[i].forward[i] = node.forward[i]
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return True
+
+    def __iter__(self):
+        node = self.head.forward[0]
+        while node is not None:
+            yield node.key, node.value
+            node = node.forward[0]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class LeaderboardIndex:
+    """Users ordered by (total best score, average session score), highest first"""
+
+    def __init__(self):
+        self.entries = SkipList()
+        self.keys: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def update(self, user_id: str, total_score: int, average_score: float, total_sessions: int):
+        """Re-rank one user: O(log n) expected"""
+        # Negated so ascending skip-list order is best-first; user_id breaks ties
+        key = (-total_score, -average_score, user_id)
+        with self.lock:
+            old_key = self.keys.get(user_id)
+            if old_key is not None:
+                self.entries.remove(old_key)
+            self.entries.insert(key, total_sessions)
+            self.keys[user_id] = key
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        """O(limit) read of the best users"""
+        with self.lock:
+            head = list(islice(self.entries, limit))
+        return [
+            {
+                "user_id": anonymize_user_id(user_id),
+                "total_score": -negative_total,
+                "average_score": round(-negative_average, 2),
+                "total_sessions": total_sessions,
+            }
+            for (negative_total, negative_average, user_id), total_sessions in head
+        ]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def total_best_score(scores: Dict[str, int]) -> int:
+    return sum(scores.get(section, 0) for section in LEADERBOARD_SECTIONS)
+
+
+def build_leaderboard_index(store: ProgressStore) -> LeaderboardIndex:
+    """One scan of the store"""
+    index = LeaderboardIndex()
+    for summary in store.iter_user_summaries():
+        index.update(
+            summary["user_id"],
+            total_best_score(summary["scores"]),
+            summary["average_score"],
+            summary["total_sessions"],
+        )
+    return index
+
+
+_index: Optional[LeaderboardIndex] = None
+_index_lock = threading.Lock()
+_stop_refreshing: Optional[threading.Event] = None
+
+
+def _refresh_loop(store: ProgressStore, stop: threading.Event):
+    global _index
+    while not stop.wait(LEADERBOARD_REFRESH_INTERVAL):
+        try:
+            index = build_leaderboard_index(store)
+        except Exception as e:
+            logger.error(f"Failed to refresh leaderboard index: {str(e)}")
+            continue
+        with _index_lock:
+            if not stop.is_set():
+                _index = index
+
+
+def get_leaderboard_index(store: ProgressStore) -> LeaderboardIndex:
+    """
+    Shared index, built from the store with one scan on first use. Each
+    worker process has its own index. With several workers, set
+    LEADERBOARD_REFRESH_INTERVAL so each worker rebuilds from the shared
+    store and picks up the others' updates.
+    """
+    global _index, _stop_refreshing
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = build_leaderboard_index(store)
+                logger.info(f"Built leaderboard index for {len(index)} users")
+                if LEADERBOARD_REFRESH_INTERVAL > 0:
+                    _stop_refreshing = threading.Event()
+                    threading.Thread(target=_refresh_loop, args=(store, _stop_refreshing), daemon=True).start()
+                _index = index
+    return _index
+
+
+def reset_leaderboard_index():
+    """Drop the index so the next read rebuilds it (used when the store is swapped, and on shutdown)"""
+    global _index, _stop_refreshing
+    with _index_lock:
+        if _stop_refreshing is not None:
+            _stop_refreshing.set()
+            _stop_refreshing = None
+        _index = None
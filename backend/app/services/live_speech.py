@@ -0,0 +1,135 @@
+from typing import Dict, List
+
+import numpy as np
+
+from .audio_pipeline import (
+    TARGET_SAMPLE_RATE,
+    FFmpegStreamDecoder,
+    LinearResampler,
+    WavStreamDecoder,
+    float_to_int16,
+)
+
+# Voice activity detection on 30 ms frames of the normalized stream
+FRAME_SAMPLES = TARGET_SAMPLE_RATE * 30 // 1000
+SILENCE_DBFS = -40.0
+MIN_PAUSE_SECONDS = 0.3
+
+
+class PCMStreamDecoder:
+    """Raw little-endian int16 PCM from an AudioWorklet, resampled to 16 kHz"""
+
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE):
+        self.resampler = LinearResampler(sample_rate)
+        self.odd_byte = b""
+
+    def feed(self, data: bytes) -> np.ndarray:
+        data = self.odd_byte + data
+        usable = len(data) - len(data) % 2
+        self.odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+        if self.resampler.passthrough:
+            return samples
+        return float_to_int16(self.resampler.process(samples.astype(np.float32) / 32768.0))
+
+    def close(self) -> np.ndarray:
+        return np.zeros(0, dtype="<i2")
+
+
+def create_stream_decoder(audio_format: str, sample_rate: int = TARGET_SAMPLE_RATE):
+    """Decoder for the format announced in the session's start message"""
+    if audio_format == "pcm16":
+        return PCMStreamDecoder(sample_rate)
+    if audio_format == "wav":
+        return WavStreamDecoder()
+    return FFmpegStreamDecoder()
+
+
+class LiveSpeechSession:
+    """Running transcript and fluency metrics for one live speaking answer"""
+
+    def __init__(self, decoder, question: str = ""):
+        self.decoder = decoder
+        self.question = question
+        self.final_segments: List[str] = []
+        self.interim_text = ""
+        self.total_samples = 0
+        self.frame_buffer = np.zeros(0, dtype=np.float32)
+        self.speech_started = False
+        self.silent_frames = 0
+        self.speech_frames = 0
+        self.pauses: List[float] = []
+
+    @property
+    def transcript(self) -> str:
+        parts = self.final_segments + ([self.interim_text] if self.interim_text else [])
+        return " ".join(part.strip() for part in parts if part.strip())
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.total_samples / TARGET_SAMPLE_RATE
+
+    def add_transcript(self, text: str, is_final: bool):
+        """Record an interim or final hypothesis from the client's recognizer"""
+        if is_final:
+            self.final_segments.append(text)
+            self.interim_text = ""
+        else:
+            self.interim_text = text
+
+    def add_audio(self, data: bytes) -> int:
+        """Decode an audio chunk and update pause tracking; returns new samples"""
+        return self._consume(self.decoder.feed(data))
+
+    def finish_audio(self):
+        self._consume(self.decoder.close())
+
+    def _consume(self, pcm: np.ndarray) -> int:
+        if not pcm.size:
+            return 0
+        self.total_samples += pcm.size
+        frames = np.concatenate((self.frame_buffer, pcm.astype(np.float32) / 32768.0))
+        usable = frames.size - frames.size % FRAME_SAMPLES
+        self.frame_buffer = frames[usable:]
+        if usable:
+            energy = np.sqrt(np.mean(frames[:usable].reshape(-1, FRAME_SAMPLES) ** 2, axis=1))
+            levels = 20 * np.log10(np.maximum(energy, 1e-10))
+            for voiced in levels > SILENCE_DBFS:
+                self._update_vad(bool(voiced))
+        return pcm.size
+
+    def _update_vad(self, voiced: bool):
+        if voiced:
+            if self.speech_started and self.silent_frames:
+                pause = self.silent_frames * FRAME_SAMPLES / TARGET_SAMPLE_RATE
+                if pause >= MIN_PAUSE_SECONDS:
+                    self.pauses.append(pause)
+            self.speech_started = True
+            self.silent_frames = 0
+            self.speech_frames += 1
+        elif self.speech_started:
+            self.silent_frames += 1
+
+    def metrics(self) -> Dict:
+        """Fluency metrics shaped like advanced_speech.FluentcyMetrics"""
+        word_count = len(self.transcript.split())
+        duration = self.duration_seconds
+        wpm = (word_count / duration) * 60 if duration > 0 else 0
+        return {
+            "words_per_minute": round(wpm, 1),
+            "pause_count": len(self.pauses),
+            "average_pause_duration": round(sum(self.pauses) / len(self.pauses), 2) if self.pauses else 0.0,
+            "speech_rate_consistency": min(10, max(1, 10 - abs(wpm - 150) / 15)),
+            "speaking_seconds": round(self.speech_frames * FRAME_SAMPLES / TARGET_SAMPLE_RATE, 2),
+            "duration_seconds": round(duration, 2),
+            "word_count": word_count,
+        }
+
+    def partial(self) -> Dict:
+        return {"type": "partial", "transcript": self.transcript, "metrics": self.metrics()}
+
+    def close(self):
+        """Stop an ffmpeg decoder if the client vanished mid-stream"""
+        process = getattr(self.decoder, "process", None)
+        if process is not None and process.poll() is None:
+            process.kill()
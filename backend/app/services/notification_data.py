@@ -0,0 +1,96 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Documents per get_all round trip, and how many round trips may be in flight at once
+GET_ALL_CHUNK_SIZE = int(os.getenv("FIRESTORE_GET_ALL_CHUNK", "300"))
+GET_ALL_CONCURRENCY = int(os.getenv("FIRESTORE_GET_ALL_CONCURRENCY", "8"))
+# Firestore accepts at most 30 values in one "in" filter
+MAX_IN_VALUES = 30
+
+
+class NotificationDataAccess:
+    """
+    Batched Firestore reads for the notification jobs. Documents are fetched
+    with get_all in fixed-size chunks, several chunks at a time on a bounded
+    thread pool, so loading N users costs about N / chunk size round trips
+    instead of one round trip per document.
+    """
+
+    def __init__(self, db, chunk_size: int = GET_ALL_CHUNK_SIZE, concurrency: int = GET_ALL_CONCURRENCY):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="firestore-read")
+        self.lock = threading.Lock()
+        self.document_reads = 0
+        self.round_trips = 0
+
+    def _count(self, documents: int, round_trips: int = 1):
+        with self.lock:
+            self.document_reads += documents
+            self.round_trips += round_trips
+
+    def _stream(self, collection: str, fields: Optional[List[str]]) -> List[Tuple[str, Dict]]:
+        query = self.db.collection(collection)
+        if fields:
+            query = query.select(fields)
+        documents = [(doc.id, doc.to_dict()) for doc in query.stream()]
+        self._count(len(documents))
+        return documents
+
+    async def stream_collection(self, collection: str, fields: Optional[List[str]] = None) -> List[Tuple[str, Dict]]:
+        """All (id, data) pairs in a collection, optionally projected to `fields`"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._stream, collection, fields)
+
+    def _query(self, collection: str, field: str, op: str, value, fields: Optional[List[str]]) -> List[Tuple[str, Dict]]:
+        query = self.db.collection(collection).where(field, op, value)
+        if fields:
+            query = query.select(fields)
+        documents = [(doc.id, doc.to_dict()) for doc in query.stream()]
+        self._count(len(documents))
+        return documents
+
+    async def query_collection(self, collection: str, field: str, op: str, value,
+                               fields: Optional[List[str]] = None) -> List[Tuple[str, Dict]]:
+        """(id, data) pairs for documents matching one field condition"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._query, collection, field, op, value, fields)
+
+    async def query_in(self, collection: str, field: str, values: Iterable, fields: Optional[List[str]] = None) -> List[Tuple[str, Dict]]:
+        """(id, data) pairs for documents whose `field` is any of `values`, one query per 30 values"""
+        values = list(dict.fromkeys(values))
+        chunks = [values[i:i + MAX_IN_VALUES] for i in range(0, len(values), MAX_IN_VALUES)]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self._query, collection, field, 'in', chunk, fields) for chunk in chunks
+        ))
+        return [document for chunk in results for document in chunk]
+
+    def _get_chunk(self, collection: str, ids: List[str]) -> Dict[str, Optional[Dict]]:
+        refs = [self.db.collection(collection).document(document_id) for document_id in ids]
+        found = {snapshot.id: snapshot.to_dict() if snapshot.exists else None for snapshot in self.db.get_all(refs)}
+        self._count(len(ids))
+        return found
+
+    async def get_documents(self, collection: str, ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Map each id to its document data, or None if it does not exist"""
+        ids = list(dict.fromkeys(ids))
+        chunks = [ids[i:i + self.chunk_size] for i in range(0, len(ids), self.chunk_size)]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self._get_chunk, collection, chunk) for chunk in chunks
+        ))
+        documents: Dict[str, Optional[Dict]] = {document_id: None for document_id in ids}
+        for chunk in results:
+            documents.update(chunk)
+        return documents
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"document_reads": self.document_reads, "round_trips": self.round_trips}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
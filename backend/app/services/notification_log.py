@@ -0,0 +1,126 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_LOG_RETENTION_DAYS = int(os.getenv("NOTIFICATION_LOG_RETENTION_DAYS", "90"))
+# Firestore allows at most 500 writes per batch
+MAX_WRITES_PER_BATCH = 500
+
+
+class NotificationLog:
+    """
+    Per-user, per-day notification log: notifications/{user_id}/notification_days/{date}
+    with an "entries" array. Logging is a single ArrayUnion write with no
+    read, so it costs the same however long the history is and concurrent
+    logs for the same day cannot overwrite each other. Day documents carry
+    an "expires_at" time for a Firestore TTL policy; prune() deletes
+    expired days where no policy is configured.
+    """
+
+    def __init__(self, db, retention_days: int = NOTIFICATION_LOG_RETENTION_DAYS):
+        self.db = db
+        self.retention_days = retention_days
+
+    def _days(self, user_id: str):
+        return self.db.collection('notifications').document(user_id).collection('notification_days')
+
+    def _expires_at(self, date: str) -> datetime:
+        day = datetime.strptime(date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        return day + timedelta(days=self.retention_days + 1)
+
+    def _day_fields(self, date: str, entries: List[Dict]) -> Dict:
+        return {
+            'date': date,
+            'expires_at': self._expires_at(date),
+            'entries': firestore.ArrayUnion(entries),
+        }
+
+    def append(self, user_id: str, notification_type: str, data: Dict):
+        date = datetime.now().strftime('%Y-%m-%d')
+        entry = {
+            'type': notification_type,
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        }
+        self._days(user_id).document(date).set(self._day_fields(date, [entry]), merge=True)
+
+    def history(self, user_id: str, days: int) -> List[Dict]:
+        """Entries from the last `days` days, newest first, each with its "date\""""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        history = []
+        for doc in self._days(user_id).where('date', '>=', since).stream():
+            day = doc.to_dict()
+            for entry in day.get('entries', []):
+                history.append({**entry, 'date': day['date']})
+        # Entries not yet moved out of a legacy document by migrate_legacy()
+        legacy = self.db.collection('notifications').document(user_id).get()
+        if legacy.exists:
+            for date, entries in legacy.to_dict().items():
+                if isinstance(entries, list) and date >= since:
+                    history.extend({**entry, 'date': date} for entry in entries)
+        history.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        return history
+
+    def clear(self, user_id: str):
+        batch = self.db.batch()
+        writes = 0
+        for doc in self._days(user_id).select([]).stream():
+            batch.delete(doc.reference)
+            writes += 1
+            if writes == MAX_WRITES_PER_BATCH:
+                batch.commit()
+                batch = self.db.batch()
+                writes = 0
+        # Logs written before day documents lived in the parent document
+        batch.delete(self.db.collection('notifications').document(user_id))
+        batch.commit()
+
+    def migrate_legacy(self) -> int:
+        """
+        Split old notifications/{user_id} documents (one key per date) into
+        day documents and delete them. New logs never create the parent
+        document, so this only visits users who still have a legacy one.
+        """
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        migrated = 0
+        batch = self.db.batch()
+        writes = 0
+        for doc in self.db.collection('notifications').stream():
+            operations = [
+                (self._days(doc.id).document(date), self._day_fields(date, entries))
+                for date, entries in doc.to_dict().items()
+                if isinstance(entries, list) and date >= cutoff
+            ]
+            # Keep a user's day documents and the delete of their legacy document in one batch
+            if writes + len(operations) + 1 > MAX_WRITES_PER_BATCH:
+                batch.commit()
+                batch = self.db.batch()
+                writes = 0
+            for ref, fields in operations:
+                batch.set(ref, fields, merge=True)
+            batch.delete(doc.reference)
+            writes += len(operations) + 1
+            migrated += 1
+        if writes:
+            batch.commit()
+        return migrated
+
+    def prune(self) -> int:
+        """Delete day documents older than the retention window; returns how many"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        query = self.db.collection_group('notification_days').where('date', '<', cutoff).select([])
+        deleted = 0
+        while True:
+            refs = [doc.reference for doc in query.limit(MAX_WRITES_PER_BATCH).stream()]
+            if not refs:
+                return deleted
+            batch = self.db.batch()
+            for ref in refs:
+                batch.delete(ref)
+            batch.commit()
+            deleted += len(refs)
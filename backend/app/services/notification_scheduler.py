@@ -1,229 +1,396 @@
 import asyncio
-import schedule
-import time
-from datetime import datetime, timedelta
-from typing import List, Dict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Dict, Optional, Set
 import logging
 from firebase_admin import firestore
+from .email_outbox import OutboxWorker, get_email_outbox
 from .email_service import email_service
+from .firestore_executor import run_firestore
+from .job_scheduler import TimerScheduler, create_leader, daily_at, every_slot
+from .notification_data import NotificationDataAccess
+from .notification_log import NotificationLog
+from .notification_stats import get_preference_counts
+from .notified_index import NotifiedIndex
+from .preferences_cache import PreferencesCache, preferences_cache
+from .sharded_scan import ShardedScan
+from .reminder_slots import (
+    DEFAULT_REMINDER_TIME,
+    DEFAULT_REMINDER_TIMEZONE,
+    REMINDER_SLOT_MINUTES,
+    current_buckets,
+    reminder_bucket,
+)
 
 logger = logging.getLogger(__name__)
 
 class NotificationScheduler:
-    def __init__(self):
+    def __init__(self, db=None, prefs_cache: Optional[PreferencesCache] = None):
+        # The Firestore client is resolved on first use, so the global
+        # instance can be created before Firebase is initialized
+        self._db = db
+        self.prefs_cache = prefs_cache or preferences_cache
+        self._data: Optional[NotificationDataAccess] = None
+        self._log: Optional[NotificationLog] = None
+        self.is_running = False
+        self.timers: Optional[TimerScheduler] = None
+        # Summary of the latest sharded scan per job
+        self.scan_summaries: Dict[str, Dict] = {}
+        # Who has already been queued which email today
+        self.notified = NotifiedIndex()
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db
+
+    @property
+    def data(self) -> NotificationDataAccess:
+        if self._data is None:
+            self._data = NotificationDataAccess(self.db)
+        return self._data
+
+    @property
+    def log(self) -> NotificationLog:
+        if self._log is None:
+            self._log = NotificationLog(self.db)
+        return self._log
+
+    def close(self):
+        """Release the read pool on shutdown"""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    async def active_yesterday(self) -> List[tuple]:
+        """
+        Streaks whose last activity was yesterday. The client sets
+        lastActivityDate on every activity, so this equality query returns
+        exactly the users active yesterday and not yet today, and its cost
+        follows the number of candidates rather than the user base.
+        """
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        return await self.data.query_collection('streaks', 'lastActivityDate', '==', yesterday)
+
+    async def reminder_timezones(self) -> List[str]:
+        """Every timezone a user has saved preferences in (kept by /notifications/preferences)"""
+        documents = await self.data.get_documents('notification_meta', ['reminder_timezones'])
+        return (documents['reminder_timezones'] or {}).get('zones', [])
+
+    async def preferences(self, user_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Preferences per user (None if never saved), from the cache where possible; reads warm it"""
+        found, missing = self.prefs_cache.get_many(user_ids)
+        if missing:
+            generation = self.prefs_cache.generation
+            fetched = await self.data.get_documents('notification_preferences', missing)
+            self.prefs_cache.put_many(fetched, generation)
+            found.update(fetched)
+        return found
+
+    async def find_slot_users(self, now: datetime) -> Set[str]:
+        """
+        Users whose reminder slot starts at `now`: those whose saved
+        reminder_time and timezone fall in this slot, plus, in the default
+        slot, candidates who never saved preferences
+        """
+        buckets = current_buckets(now, await self.reminder_timezones())
+        generation = self.prefs_cache.generation
+        slot_prefs = dict(await self.data.query_in('notification_preferences', 'reminder_bucket', buckets))
+        # The slot query already read these users' preferences
+        self.prefs_cache.put_many(slot_prefs, generation)
+        user_ids = {
+            user_id for user_id, prefs in slot_prefs.items()
+            if prefs.get('email_reminders', True) and prefs.get('streak_reminders', True)
+        }
+        
+        if reminder_bucket(DEFAULT_REMINDER_TIME, DEFAULT_REMINDER_TIMEZONE) in current_buckets(now, [DEFAULT_REMINDER_TIMEZONE]):
+            candidates = [user_id for user_id, _ in await self.active_yesterday()]
+            prefs = await self.preferences(candidates)
+            user_ids.update(user_id for user_id in candidates if prefs[user_id] is None)
+        
+        return user_ids
+
+    async def inactive_among(self, streaks: List[tuple]) -> List[Dict]:
+        """
+        Of these (user_id, streak) pairs, users who practiced yesterday but
+        not yet today, have a streak to keep and have an email address
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        candidates = {}
+        for user_id, streak_data in streaks:
+            if self.notified.contains(user_id, 'streak_reminder', today):
+                continue
+            activities = streak_data.get('activities', {})
+            
+            # Check if user was active yesterday but not today
+            was_active_yesterday = yesterday in activities and activities[yesterday].get('count', 0) > 0
+            is_active_today = today in activities and activities[today].get('count', 0) > 0
+            
+            # Only send reminder if they have a streak to maintain
+            if was_active_yesterday and not is_active_today and streak_data.get('currentStreak', 0) > 0:
+                candidates[user_id] = streak_data
+        
+        users = await self.data.get_documents('users', candidates.keys())
+        
+        inactive_users = []
+        for user_id, streak_data in candidates.items():
+            user_data = users.get(user_id)
+            
+            # Skip if user doesn't have email
+            if user_data is None or 'email' not in user_data:
+                continue
+            
+            inactive_users.append({
+                'user_id': user_id,
+                'email': user_data['email'],
+                'name': user_data.get('displayName', 'Learner'),
+                'current_streak': streak_data.get('currentStreak', 0),
+                'longest_streak': streak_data.get('longestStreak', 0)
+            })
+        
+        return inactive_users
+
+    async def find_inactive_users(self, user_ids: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Users who practiced yesterday but not yet today and have a streak to
+        keep, among `user_ids` if given, otherwise among everyone
+        """
+        await self.hydrate_notified()
+        if user_ids is None:
+            streaks = await self.active_yesterday()
+        else:
+            documents = await self.data.get_documents('streaks', user_ids)
+            streaks = [(user_id, data) for user_id, data in documents.items() if data is not None]
+        return await self.inactive_among(streaks)
+
+    async def hydrate_notified(self):
+        """Load today's queued and sent emails from the outbox into the notified index, once per run"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        await asyncio.get_running_loop().run_in_executor(None, self.notified.hydrate, get_email_outbox(), today)
+
+    async def queue_reminders(self, inactive_users: List[Dict]) -> int:
+        today = datetime.now().strftime('%Y-%m-%d')
+        queued = await asyncio.get_running_loop().run_in_executor(None, get_email_outbox().enqueue_many, [
+            {
+                'user_id': user['user_id'],
+                'type': 'streak_reminder',
+                'date': today,
+                'to_email': user['email'],
+                'payload': {
+                    'user_name': user['name'],
+                    'current_streak': user['current_streak'],
+                    'longest_streak': user['longest_streak']
+                }
+            }
+            for user in inactive_users
+        ])
+        for user in inactive_users:
+            self.notified.add(user['user_id'], 'streak_reminder', today)
+        return queued
+
+    async def scan_active_yesterday(self, job: str, handle) -> Dict:
+        """
+        Hand yesterday's active streaks to `handle` page by page, split into
+        document-ID shards that checkpoint their progress, so a run
+        interrupted part way resumes where it stopped
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        scan = ShardedScan(self.db, self.data.executor, f"{job}-{today}",
+                           'streaks', 'lastActivityDate', '==', yesterday)
+        summary = await scan.run(handle)
+        self.scan_summaries[job] = summary
+        logger.info(f"{job} scan: {summary['scanned']} streaks in {len(summary['shards'])} shards,"
+                    f" {summary['matched']} matched, {summary['seconds']}s")
+        for shard in summary['shards']:
+            logger.debug(f"{job} shard {shard['shard']} {shard['range']}: {shard['scanned']} scanned,"
+                         f" {shard['matched']} matched, {shard['seconds']:.2f}s, resumed={shard['resumed']}")
+        return summary
+
+    async def check_reminder_slot(self, now: Optional[datetime] = None):
+        """Queue streak reminders for the users whose reminder time falls in the slot starting now"""
         try:
-            self.db = firestore.client()
-            self.is_running = False
+            now = now or datetime.now(timezone.utc)
+            user_ids = await self.find_slot_users(now)
+            logger.info(f"Reminder slot {now:%H:%M} UTC: {len(user_ids)} users")
+            if user_ids:
+                await self.check_inactive_users(user_ids)
         except Exception as e:
-            logger.warning(f"Firebase not initialized in NotificationScheduler: {e}")
-            self.db = None
-            self.is_running = False
+            logger.error(f"Error in check_reminder_slot: {str(e)}")
 
-    async def check_inactive_users(self):
-        """Check for users who haven't practiced today and send reminder emails"""
+    async def check_inactive_users(self, user_ids: Optional[Iterable[str]] = None):
+        """
+        Queue streak reminders for users who haven't practiced today, among
+        `user_ids` or, if None, everyone in a sharded scan; the outbox worker
+        sends them
+        """
         try:
             logger.info("Checking for inactive users...")
             
-            # Get current date
-            today = datetime.now().strftime('%Y-%m-%d')
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            
-            # Get all users
-            users_ref = self.db.collection('users')
-            users = users_ref.stream()
-            
-            inactive_users = []
-            
-            for user_doc in users:
-                user_data = user_doc.to_dict()
-                user_id = user_doc.id
-                
-                # Skip if user doesn't have email
-                if 'email' not in user_data:
-                    continue
-                
-                # Check user's streak data
-                streak_ref = self.db.collection('streaks').document(user_id)
-                streak_doc = streak_ref.get()
-                
-                if not streak_doc.exists:
-                    continue
+            if user_ids is None:
+                async def handle(page: List[tuple]) -> int:
+                    inactive_users = await self.inactive_among(page)
+                    await self.queue_reminders(inactive_users)
+                    return len(inactive_users)
                 
-                streak_data = streak_doc.to_dict()
-                activities = streak_data.get('activities', {})
-                
-                # Check if user was active yesterday but not today
-                was_active_yesterday = yesterday in activities and activities[yesterday].get('count', 0) > 0
-                is_active_today = today in activities and activities[today].get('count', 0) > 0
-                
-                # Send reminder if user was active yesterday but not today
-                if was_active_yesterday and not is_active_today:
-                    current_streak = streak_data.get('currentStreak', 0)
-                    longest_streak = streak_data.get('longestStreak', 0)
-                    
-                    # Only send reminder if they have a streak to maintain
-                    if current_streak > 0:
-                        inactive_users.append({
-                            'user_id': user_id,
-                            'email': user_data['email'],
-                            'name': user_data.get('displayName', 'Learner'),
-                            'current_streak': current_streak,
-                            'longest_streak': longest_streak
-                        })
+                await self.hydrate_notified()
+                await self.scan_active_yesterday('inactive_users', handle)
+                return
             
-            # Send reminder emails
-            for user in inactive_users:
-                try:
-                    success = email_service.send_streak_reminder(
-                        user['email'],
-                        user['name'],
-                        user['current_streak'],
-                        user['longest_streak']
-                    )
-                    
-                    if success:
-                        logger.info(f"Sent streak reminder to {user['email']}")
-                        
-                        # Log the notification
-                        await self.log_notification(user['user_id'], 'streak_reminder', {
-                            'current_streak': user['current_streak'],
-                            'email_sent': True
-                        })
-                    else:
-                        logger.error(f"Failed to send streak reminder to {user['email']}")
-                        
-                except Exception as e:
-                    logger.error(f"Error sending reminder to {user['email']}: {str(e)}")
+            inactive_users = await self.find_inactive_users(user_ids)
+            queued = await self.queue_reminders(inactive_users)
             
-            logger.info(f"Processed {len(inactive_users)} inactive users")
+            logger.info(f"Processed {len(inactive_users)} inactive users, queued {queued} reminders")
             
         except Exception as e:
             logger.error(f"Error in check_inactive_users: {str(e)}")
 
+    async def broken_among(self, streaks: List[tuple]) -> List[Dict]:
+        """
+        Of these (user_id, streak) pairs, users whose streak broke yesterday
+        and who have not been queued a broken-streak email today
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        # Decide from the streak documents alone, then batch-load only the candidates' other documents
+        candidates = {}
+        for user_id, streak_data in streaks:
+            # Already queued or sent today
+            if self.notified.contains(user_id, 'streak_broken', today):
+                continue
+            activities = streak_data.get('activities', {})
+            current_streak = streak_data.get('currentStreak', 0)
+            
+            # Check if streak was broken (had activity yesterday but current streak is 0)
+            was_active_yesterday = yesterday in activities and activities[yesterday].get('count', 0) > 0
+            if current_streak == 0 and was_active_yesterday:
+                # Get the broken streak length from yesterday's data
+                candidates[user_id] = activities[yesterday].get('streak_before_break', 1)
+        
+        users = await self.data.get_documents('users', candidates.keys())
+        
+        broken_streaks = []
+        for user_id, broken_streak in candidates.items():
+            user_data = users.get(user_id)
+            if user_data is None or 'email' not in user_data:
+                continue
+            
+            broken_streaks.append({
+                'user_id': user_id,
+                'email': user_data['email'],
+                'name': user_data.get('displayName', 'Learner'),
+                'broken_streak': broken_streak
+            })
+        
+        return broken_streaks
+
+    async def find_broken_streaks(self) -> List[Dict]:
+        """Users whose streak broke yesterday and who have not been queued a broken-streak email today"""
+        await self.hydrate_notified()
+        return await self.broken_among(await self.active_yesterday())
+
+    async def queue_broken_streak_emails(self, broken_streaks: List[Dict]) -> int:
+        today = datetime.now().strftime('%Y-%m-%d')
+        queued = await asyncio.get_running_loop().run_in_executor(None, get_email_outbox().enqueue_many, [
+            {
+                'user_id': user['user_id'],
+                'type': 'streak_broken',
+                'date': today,
+                'to_email': user['email'],
+                'payload': {
+                    'user_name': user['name'],
+                    'broken_streak': user['broken_streak']
+                }
+            }
+            for user in broken_streaks
+        ])
+        for user in broken_streaks:
+            self.notified.add(user['user_id'], 'streak_broken', today)
+        return queued
+
     async def check_broken_streaks(self):
-        """Check for users whose streaks were broken and send encouragement emails"""
+        """Queue encouragement emails for users whose streaks were broken, in a sharded scan"""
         try:
             logger.info("Checking for broken streaks...")
             
-            today = datetime.now().strftime('%Y-%m-%d')
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            
-            # Get all streak documents
-            streaks_ref = self.db.collection('streaks')
-            streaks = streaks_ref.stream()
+            async def handle(page: List[tuple]) -> int:
+                broken_streaks = await self.broken_among(page)
+                await self.queue_broken_streak_emails(broken_streaks)
+                return len(broken_streaks)
             
-            for streak_doc in streaks:
-                streak_data = streak_doc.to_dict()
-                user_id = streak_doc.id
-                
-                # Get user data
-                user_ref = self.db.collection('users').document(user_id)
-                user_doc = user_ref.get()
-                
-                if not user_doc.exists:
-                    continue
-                
-                user_data = user_doc.to_dict()
-                
-                if 'email' not in user_data:
-                    continue
-                
-                activities = streak_data.get('activities', {})
-                current_streak = streak_data.get('currentStreak', 0)
-                last_activity_date = streak_data.get('lastActivityDate')
-                
-                # Check if streak was broken (had activity yesterday but current streak is 0)
-                was_active_yesterday = yesterday in activities and activities[yesterday].get('count', 0) > 0
-                is_streak_broken = current_streak == 0 and was_active_yesterday
-                
-                # Check if we already sent a broken streak email today
-                notifications_ref = self.db.collection('notifications').document(user_id)
-                notifications_doc = notifications_ref.get()
-                
-                sent_today = False
-                if notifications_doc.exists:
-                    notifications_data = notifications_doc.to_dict()
-                    today_notifications = notifications_data.get(today, [])
-                    sent_today = any(n.get('type') == 'streak_broken' for n in today_notifications)
-                
-                if is_streak_broken and not sent_today:
-                    # Get the broken streak length from yesterday's data
-                    broken_streak = activities[yesterday].get('streak_before_break', 1)
-                    
-                    try:
-                        success = email_service.send_streak_broken_email(
-                            user_data['email'],
-                            user_data.get('displayName', 'Learner'),
-                            broken_streak
-                        )
-                        
-                        if success:
-                            logger.info(f"Sent broken streak email to {user_data['email']}")
-                            
-                            await self.log_notification(user_id, 'streak_broken', {
-                                'broken_streak': broken_streak,
-                                'email_sent': True
-                            })
-                        
-                    except Exception as e:
-                        logger.error(f"Error sending broken streak email to {user_data['email']}: {str(e)}")
+            await self.hydrate_notified()
+            await self.scan_active_yesterday('broken_streaks', handle)
             
         except Exception as e:
             logger.error(f"Error in check_broken_streaks: {str(e)}")
 
+    async def log_sent(self, message: Dict):
+        """Outbox hook: record a delivered email in the user's notification log"""
+        data = {key: value for key, value in message['payload'].items() if key != 'user_name'}
+        data['email_sent'] = True
+        self.notified.add(message['user_id'], message['type'], message['date'])
+        await self.log_notification(message['user_id'], message['type'], data)
+
+    def create_outbox_worker(self) -> OutboxWorker:
+        return OutboxWorker(get_email_outbox(), email_service, on_sent=self.log_sent)
+
     async def log_notification(self, user_id: str, notification_type: str, data: Dict):
-        """Log notification to Firestore"""
+        """Append a notification to the user's log for today"""
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            timestamp = datetime.now().isoformat()
-            
-            notification_data = {
-                'type': notification_type,
-                'timestamp': timestamp,
-                'data': data
-            }
-            
-            # Store in user's notification log
-            notifications_ref = self.db.collection('notifications').document(user_id)
-            notifications_doc = notifications_ref.get()
-            
-            if notifications_doc.exists:
-                notifications_data = notifications_doc.to_dict()
-                if today not in notifications_data:
-                    notifications_data[today] = []
-                notifications_data[today].append(notification_data)
-            else:
-                notifications_data = {today: [notification_data]}
-            
-            notifications_ref.set(notifications_data)
-            
+            await run_firestore(self.log.append, user_id, notification_type, data)
         except Exception as e:
             logger.error(f"Error logging notification: {str(e)}")
 
-    def schedule_daily_checks(self):
-        """Schedule daily notification checks"""
-        # Schedule streak reminders for 7 PM every day
-        schedule.every().day.at("19:00").do(lambda: asyncio.create_task(self.check_inactive_users()))
+    async def maintain_notification_log(self):
+        """Move legacy notification documents into day documents and delete days past retention"""
+        try:
+            migrated = await run_firestore(self.log.migrate_legacy)
+            pruned = await run_firestore(self.log.prune)
+            logger.info(f"Notification log: migrated {migrated} legacy logs, pruned {pruned} days")
+        except Exception as e:
+            logger.error(f"Error maintaining notification log: {str(e)}")
+
+    async def reconcile_preference_counts(self):
+        """Recount notification preference stats to correct counter drift"""
+        try:
+            counts = await run_firestore(get_preference_counts(self.db).reconcile)
+            logger.info(f"Reconciled notification preference counts: {counts}")
+        except Exception as e:
+            logger.error(f"Error reconciling preference counts: {str(e)}")
+
+    def schedule_daily_checks(self) -> TimerScheduler:
+        """Register the notification jobs on a timer scheduler that only runs them in the leader process"""
+        timers = TimerScheduler(leader=create_leader(self.db))
+        
+        # Streak reminders go out slot by slot, to the users whose reminder_time falls in each slot
+        timers.add_job('reminder_slot', self.check_reminder_slot, every_slot(REMINDER_SLOT_MINUTES))
         
-        # Schedule broken streak checks for 8 AM every day
-        schedule.every().day.at("08:00").do(lambda: asyncio.create_task(self.check_broken_streaks()))
+        # Broken streak checks at 8 AM server time every day
+        timers.add_job('broken_streaks', lambda scheduled: self.check_broken_streaks(), daily_at("08:00"))
+        
+        # Notification log retention, off-peak
+        timers.add_job('notification_log', lambda scheduled: self.maintain_notification_log(), daily_at("03:00"))
+        timers.add_job('preference_counts', lambda scheduled: self.reconcile_preference_counts(), daily_at("03:30"))
         
         logger.info("Scheduled daily notification checks")
+        return timers
 
     async def run_scheduler(self):
-        """Run the notification scheduler"""
+        """Run the notification scheduler until stop_scheduler() is called"""
         self.is_running = True
         logger.info("Starting notification scheduler...")
         
-        self.schedule_daily_checks()
-        
-        while self.is_running:
-            schedule.run_pending()
-            await asyncio.sleep(60)  # Check every minute
+        self.timers = self.schedule_daily_checks()
+        await self.timers.run()
 
     def stop_scheduler(self):
         """Stop the notification scheduler"""
         self.is_running = False
+        if self.timers is not None:
+            self.timers.stop()
         logger.info("Stopping notification scheduler...")
 
 # Create global scheduler instance
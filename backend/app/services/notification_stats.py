@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_STATS_TTL = float(os.getenv("NOTIFICATION_STATS_TTL", "30"))
+
+# Counter fields and the preference flag each one counts (None counts every document)
+COUNTERS = {
+    'total_users_with_preferences': None,
+    'email_reminders_enabled': 'email_reminders',
+    'streak_reminders_enabled': 'streak_reminders',
+}
+
+
+def preference_counts(prefs: Optional[Dict]) -> Dict[str, int]:
+    """What one preferences document (None if missing) contributes to each counter"""
+    if prefs is None:
+        return {name: 0 for name in COUNTERS}
+    return {name: 1 if flag is None or prefs.get(flag, True) else 0 for name, flag in COUNTERS.items()}
+
+
+class PreferenceCounts:
+    """
+    Notification preference counters kept in notification_meta/preference_counts.
+    Every preferences write adjusts them by the difference between the old
+    and new document in the same transaction, so reading the stats is one
+    document read instead of a scan of notification_preferences. Reads are
+    cached in process for `ttl` seconds, and reconcile() recounts from the
+    collection to correct any drift.
+    """
+
+    def __init__(self, db, ttl: float = NOTIFICATION_STATS_TTL):
+        self.db = db
+        self.ref = db.collection('notification_meta').document('preference_counts')
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.cached: Optional[Dict[str, int]] = None
+        self.cached_at = 0.0
+
+    def save_preferences(self, user_id: str, prefs: Dict):
+        """Write a user's preferences document and move the counters by its change"""
+        prefs_ref = self.db.collection('notification_preferences').document(user_id)
+
+        @firestore.transactional
+        def save(transaction):
+            snapshot = prefs_ref.get(transaction=transaction)
+            before = preference_counts(snapshot.to_dict() if snapshot.exists else None)
+            after = preference_counts(prefs)
+            transaction.set(prefs_ref, prefs)
+            changes = {name: firestore.Increment(after[name] - before[name])
+                       for name in COUNTERS if after[name] != before[name]}
+            if changes:
+                transaction.set(self.ref, changes, merge=True)
+
+        save(self.db.transaction())
+        self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            self.cached = None
+
+    def get(self) -> Dict[str, int]:
+        with self.lock:
+            if self.cached is not None and time.monotonic() - self.cached_at < self.ttl:
+                return self.cached
+        snapshot = self.ref.get()
+        if snapshot.exists:
+            data = snapshot.to_dict()
+            counts = {name: data.get(name, 0) for name in COUNTERS}
+        else:
+            # First use: build the counters with one scan
+            counts = self.reconcile()
+        with self.lock:
+            self.cached = counts
+            self.cached_at = time.monotonic()
+        return counts
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Recount from notification_preferences and overwrite the counters. A
+        preferences write that lands during the scan can be off by one until
+        the next reconcile.
+        """
+        counts = {name: 0 for name in COUNTERS}
+        flags = [flag for flag in COUNTERS.values() if flag is not None]
+        for doc in self.db.collection('notification_preferences').select(flags).stream():
+            for name, value in preference_counts(doc.to_dict()).items():
+                counts[name] += value
+        self.ref.set({**counts, 'reconciled_at': datetime.now().isoformat()})
+        self.invalidate()
+        return counts
+
+
+_counts: Optional[PreferenceCounts] = None
+_counts_lock = threading.Lock()
+
+
+def get_preference_counts(db) -> PreferenceCounts:
+    global _counts
+    if _counts is None:
+        with _counts_lock:
+            if _counts is None:
+                _counts = PreferenceCounts(db)
+    return _counts
@@ -0,0 +1,33 @@
+from typing import Optional, Set, Tuple
+
+from .email_outbox import EmailOutbox
+
+
+class NotifiedIndex:
+    """
+    In-memory set of (user, email type) pairs already queued or sent for
+    one date. It is hydrated from the outbox with one indexed query per
+    run and updated as emails are queued and sent, so "already notified
+    today?" costs a set lookup instead of a Firestore read per candidate.
+    The outbox's (user, type, date) key still rejects a duplicate that
+    the index did not know about, so no email is ever queued twice.
+    """
+
+    def __init__(self):
+        self.date: Optional[str] = None
+        self.keys: Set[Tuple[str, str]] = set()
+
+    def hydrate(self, outbox: EmailOutbox, date: str):
+        """Replace the index with every message the outbox holds for `date`"""
+        self.keys = outbox.day_keys(date)
+        self.date = date
+
+    def contains(self, user_id: str, message_type: str, date: str) -> bool:
+        return date == self.date and (user_id, message_type) in self.keys
+
+    def add(self, user_id: str, message_type: str, date: str):
+        if date == self.date:
+            self.keys.add((user_id, message_type))
+
+    def __len__(self) -> int:
+        return len(self.keys)
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PREFERENCES_CACHE_TTL = float(os.getenv("PREFERENCES_CACHE_TTL", "300"))
+PREFERENCES_CACHE_MAX_BYTES = int(os.getenv("PREFERENCES_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+
+class PreferencesCache:
+    """
+    Read-through cache of notification preferences documents by user id.
+    A missing document is cached as None, so users on the defaults are not
+    re-read either. Entries expire after `ttl` seconds and the least
+    recently used are evicted past `max_bytes` of serialized preferences.
+    Writes invalidate the user's entry in this process; other processes
+    see the change once their entry expires.
+    """
+
+    def __init__(self, ttl: float = PREFERENCES_CACHE_TTL, max_bytes: int = PREFERENCES_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # user_id -> (preferences or None, size, expires_at)
+        self.entries: "OrderedDict[str, Tuple[Optional[Dict], int, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped by every invalidation, so a read that started before a write cannot re-cache the old document
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Tuple[bool, Optional[Dict]]:
+        """(found, preferences); preferences is None for a user known to have none saved"""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(user_id)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def get_many(self, user_ids: Iterable[str]) -> Tuple[Dict[str, Optional[Dict]], List[str]]:
+        """Cached preferences for the ids that have an entry, and the ids that still need a read"""
+        found, missing = {}, []
+        for user_id in user_ids:
+            hit, prefs = self.get(user_id)
+            if hit:
+                found[user_id] = prefs
+            else:
+                missing.append(user_id)
+        return found, missing
+
+    def _remove(self, user_id: str):
+        _, size, _ = self.entries.pop(user_id)
+        self.current_bytes -= size
+
+    def put(self, user_id: str, prefs: Optional[Dict], generation: Optional[int] = None):
+        self.put_many({user_id: prefs}, generation)
+
+    def put_many(self, preferences: Dict[str, Optional[Dict]], generation: Optional[int] = None):
+        """
+        Warm the cache with documents already read, e.g. by a scheduler
+        query. Pass the `generation` seen before the read started; if an
+        invalidation happened since, nothing is cached.
+        """
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            for user_id, prefs in preferences.items():
+                size = len(user_id) + len(json.dumps(prefs, default=str))
+                if size > self.max_bytes:
+                    continue
+                if user_id in self.entries:
+                    self._remove(user_id)
+                self.entries[user_id] = (prefs, size, expires_at)
+                self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        with self.lock:
+            self.generation += 1
+            if user_id in self.entries:
+                self._remove(user_id)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by the preferences endpoints and the scheduler running in the same process
+preferences_cache = PreferencesCache()
@@ -0,0 +1,273 @@
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .progress_rollup import UserRollup
+from .progress_store import ProgressStore, session_key
+
+logger = logging.getLogger(__name__)
+
+# Maximum time an acknowledged update may sit in memory before it is written (0 disables buffering)
+FLUSH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "1.0"))
+# Flush early once this many sessions are waiting
+FLUSH_BATCH_SIZE = int(os.getenv("PROGRESS_FLUSH_BATCH", "500"))
+# Sessions held while the backend keeps failing; past this, new updates are refused
+MAX_PENDING_SESSIONS = int(os.getenv("PROGRESS_BUFFER_MAX_PENDING", "100000"))
+
+
+class WriteBufferFull(Exception):
+    """Raised when the backend has failed long enough for the buffer to fill up"""
+
+
+class WriteBehindProgressStore(ProgressStore):
+    """
+    Buffers session records in memory, grouped per user, and writes them to
+    the wrapped store in one batch every flush interval or once the batch
+    size is reached. Reads merge pending records over the wrapped store, so
+    callers always see their own writes. While the wrapped store is failing,
+    reads still succeed from the store plus the buffer, and once
+    `max_pending` sessions are waiting new updates are refused.
+    """
+
+    def __init__(self, store: ProgressStore, interval: float = FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = FLUSH_BATCH_SIZE, start_background: bool = True,
+                 max_pending: int = MAX_PENDING_SESSIONS):
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending: Dict[str, List[tuple]] = {}
+        self.pending_count = 0
+        # Records handed to the wrapped store but not yet committed; still merged into reads
+        self.in_flight: Dict[str, List[tuple]] = {}
+        self.lock = threading.Lock()
+        # Held across a commit so reads never see a batch both committed and pending
+        self.commit_lock = threading.RLock()
+        self.flush_needed = threading.Condition(threading.Lock())
+        self.stopping = threading.Event()
+
+        self.flushes = 0
+        self.flushed_records = 0
+        self.flushed_users = 0
+        self.largest_batch = 0
+        self.failed_flushes = 0
+        self.rejected_records = 0
+        self.batch_sizes = Counter()
+
+        self.thread = None
+        if start_background:
+            self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.thread.start()
+
+    # -- writes ------------------------------------------------------------
+
+    def record_sessions(self, records: Iterable[tuple]):
+        records = list(records)
+        with self.lock:
+            pending = self.pending_count
+            overflow = pending + len(records) > self.max_pending
+            if overflow:
+                self.rejected_records += len(records)
+            else:
+                for record in records:
+                    self.pending.setdefault(record[0], []).append(record)
+                self.pending_count += len(records)
+            full = self.pending_count >= self.batch_size
+        if overflow:
+            logger.error(f"Progress write-behind buffer is full ({pending} sessions waiting); refusing {len(records)}")
+            raise WriteBufferFull(f"{pending} progress updates are waiting to be written")
+        if full:
+            with self.flush_needed:
+                self.flush_needed.notify()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of sessions written"""
+        with self.commit_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, {}
+                count, self.pending_count = self.pending_count, 0
+                self.in_flight = batch
+            try:
+                self.store.record_sessions(record for records in batch.values() for record in records)
+            except Exception:
+                # Put the batch back in front of anything that arrived meanwhile
+                with self.lock:
+                    for user_id, records in self.pending.items():
+                        batch.setdefault(user_id, []).extend(records)
+                    self.pending = batch
+                    self.pending_count += count
+                    self.in_flight = {}
+                self.failed_flushes += 1
+                raise
+            with self.lock:
+                self.in_flight = {}
+
+        self.flushes += 1
+        self.flushed_records += count
+        self.flushed_users += len(batch)
+        self.largest_batch = max(self.largest_batch, count)
+        self.batch_sizes[self._bucket(count)] += 1
+        return count
+
+    @staticmethod
+    def _bucket(count: int) -> str:
+        """Power-of-two histogram bucket label, e.g. "5-8" """
+        upper = 1
+        while upper < count:
+            upper *= 2
+        return str(upper) if upper <= 2 else f"{upper // 2 + 1}-{upper}"
+
+    def _flush_loop(self):
+        while not self.stopping.is_set():
+            with self.flush_needed:
+                self.flush_needed.wait(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Progress write-behind flush failed: {str(e)}")
+
+    # -- reads -------------------------------------------------------------
+
+    def _buffered(self, user_id: str) -> List[tuple]:
+        with self.lock:
+            return self.in_flight.get(user_id, []) + self.pending.get(user_id, [])
+
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        with self.commit_lock:
+            buffered = self._buffered(user_id)
+            user = self.store.get_user(user_id)
+        if not buffered:
+            return user
+        if user is None:
+            user = {
+                "user_id": user_id,
+                "created_at": buffered[0][3],
+                "last_updated": buffered[0][3],
+                "scores": {},
+                "rollup": UserRollup(),
+            }
+        for _, section, score, timestamp, _ in buffered:
+            user["scores"][section] = max(user["scores"].get(section, 0), score)
+            user["last_updated"] = timestamp
+            user["rollup"].add(section, score, timestamp)
+        return user
+
+    def _flush_for_read(self) -> bool:
+        """Flush before a read; a failing backend delays writes but must not fail reads"""
+        try:
+            self.flush()
+            return True
+        except Exception as e:
+            logger.warning(f"Progress flush before read failed, reading buffered sessions from memory: {str(e)}")
+            return False
+
+    def _all_buffered(self) -> Dict[str, List[tuple]]:
+        with self.lock:
+            buffered = {user_id: list(records) for user_id, records in self.in_flight.items()}
+            for user_id, records in self.pending.items():
+                buffered.setdefault(user_id, []).extend(records)
+            return buffered
+
+    def get_session_page(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                         before: Optional[tuple] = None, limit: int = 20) -> List[Dict]:
+        # Pages need backend-assigned session IDs for their cursors, so write this user's sessions first
+        if not self._buffered(user_id) or self._flush_for_read():
+            return self.store.get_session_page(user_id, start, end, before, limit)
+
+        with self.commit_lock:
+            buffered = self._buffered(user_id)
+            page = self.store.get_session_page(user_id, start, end, before, limit)
+        # Unwritten sessions have no ID yet; 0 keeps cursors past them working
+        unwritten = [
+            {"id": 0, "section": section, "score": score, "timestamp": timestamp, "session_data": session_data or {}}
+            for _, section, score, timestamp, session_data in buffered
+            if (not start or timestamp >= start) and (not end or timestamp < end)
+            and (not before or (timestamp, 0) < tuple(before))
+        ]
+        return sorted(page + unwritten, key=session_key, reverse=True)[:limit]
+
+    # Bulk operations see a fully written store, or the store plus the buffer while it is failing
+
+    def import_users(self, users: Iterable[Dict]):
+        self.flush()
+        self.store.import_users(users)
+
+    def iter_user_summaries(self) -> Iterator[Dict]:
+        if self._flush_for_read():
+            return self.store.iter_user_summaries()
+        with self.commit_lock:
+            buffered = self._all_buffered()
+            summaries = list(self.store.iter_user_summaries())
+        return self._overlay_summaries(summaries, buffered)
+
+    @staticmethod
+    def _overlay_summaries(summaries: List[Dict], buffered: Dict[str, List[tuple]]) -> Iterator[Dict]:
+        for summary in summaries:
+            records = buffered.pop(summary["user_id"], None)
+            yield WriteBehindProgressStore._overlay_summary(summary, records) if records else summary
+        for user_id, records in buffered.items():
+            empty = {"user_id": user_id, "scores": {}, "average_score": 0, "total_sessions": 0}
+            yield WriteBehindProgressStore._overlay_summary(empty, records)
+
+    @staticmethod
+    def _overlay_summary(summary: Dict, records: List[tuple]) -> Dict:
+        scores = dict(summary["scores"])
+        for _, section, score, _, _ in records:
+            scores[section] = max(scores.get(section, 0), score)
+        total_sessions = summary["total_sessions"] + len(records)
+        total_score = summary["average_score"] * summary["total_sessions"] + sum(r[2] for r in records)
+        return {
+            "user_id": summary["user_id"],
+            "scores": scores,
+            "average_score": total_score / total_sessions,
+            "total_sessions": total_sessions,
+        }
+
+    def count_users(self) -> int:
+        if self._flush_for_read():
+            return self.store.count_users()
+        with self.commit_lock:
+            buffered = self._all_buffered()
+            count = self.store.count_users()
+            return count + sum(1 for user_id in buffered if self.store.get_user(user_id) is None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            pending = self.pending_count
+        return {
+            "flush_interval_seconds": self.interval,
+            "flush_batch_size": self.batch_size,
+            "pending_sessions": pending,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "max_pending_sessions": self.max_pending,
+            "rejected_sessions": self.rejected_records,
+            "flushed_sessions": self.flushed_records,
+            "average_batch_size": round(self.flushed_records / self.flushes, 1) if self.flushes else 0,
+            "average_users_per_batch": round(self.flushed_users / self.flushes, 1) if self.flushes else 0,
+            "largest_batch": self.largest_batch,
+            "batch_size_histogram": dict(self.batch_sizes),
+        }
+
+    def close(self):
+        """Stop the flusher, write what is left, then close the wrapped store"""
+        self.stopping.set()
+        with self.flush_needed:
+            self.flush_needed.notify()
+        if self.thread is not None:
+            self.thread.join()
+        try:
+            self.flush()
+        except Exception as e:
+            with self.lock:
+                unwritten = [record for records in self.pending.values() for record in records]
+            # Nothing will retry these; log them so they can be replayed by hand
+            logger.error(f"Failed to write {len(unwritten)} buffered progress updates on shutdown: {str(e)}")
+            for user_id, section, score, timestamp, _ in unwritten:
+                logger.error(f"Unwritten progress update: {user_id} {section} {score} {timestamp}")
+        finally:
+            self.store.close()
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List
+
+from .progress_rollup import UserRollup
+from .progress_store import MemoryProgressStore, session_key
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_LOG_DIR = os.getenv("PROGRESS_LOG_DIR", "progress_log")
+# Group commit: fsync at most this often, or sooner once this many events are pending
+FSYNC_INTERVAL_SECONDS = float(os.getenv("PROGRESS_LOG_FSYNC_INTERVAL", "0.05"))
+FSYNC_BATCH_EVENTS = int(os.getenv("PROGRESS_LOG_FSYNC_BATCH", "256"))
+# Snapshot on a timer, or early when the live segment grows past the size limit
+COMPACT_INTERVAL_SECONDS = float(os.getenv("PROGRESS_LOG_COMPACT_INTERVAL", "300"))
+COMPACT_SEGMENT_BYTES = int(os.getenv("PROGRESS_LOG_COMPACT_BYTES", str(64 * 1024 * 1024)))
+# Newest sessions per user kept in the snapshot; older ones move to the append-only archive
+SNAPSHOT_SESSIONS = int(os.getenv("PROGRESS_LOG_SNAPSHOT_SESSIONS", "50"))
+
+SNAPSHOT_FILE = "snapshot.json"
+ARCHIVE_FILE = "sessions-archive.log"
+SEGMENT_PATTERN = re.compile(r"^events-(\d{8})\.log$")
+
+
+def segment_name(number: int) -> str:
+    return f"events-{number:08d}.log"
+
+
+class EventLogProgressStore(MemoryProgressStore):
+    """
+    Progress kept in memory and persisted as an append-only log of session
+    events. A background compactor periodically writes a snapshot of best
+    scores, rollups and each user's recent sessions, after which older log
+    segments are dropped. Sessions that fall out of the snapshot are
+    appended once to a session archive, so full history survives without
+    being rewritten on every compaction.
+    """
+
+    def __init__(self, directory: str = PROGRESS_LOG_DIR, start_background: bool = True):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pending_events = 0
+        self.bytes_appended = 0
+        self.stopping = threading.Event()
+        # Serializes fsync with segment rotation so a sync never hits a closed file
+        self.sync_lock = threading.Lock()
+        self.sync_needed = threading.Condition(threading.Lock())
+
+        self.segment = self._recover()
+        self.log = open(os.path.join(directory, segment_name(self.segment)), "ab")
+
+        self.threads = []
+        if start_background:
+            for target in (self._sync_loop, self._compact_loop):
+                thread = threading.Thread(target=target, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    # -- recovery ----------------------------------------------------------
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _recover(self) -> int:
+        """Rebuild state from the last snapshot plus the log tail; returns the live segment"""
+        first_segment = 1
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            first_segment = snapshot["next_segment"]
+            for user_id, user in snapshot["users"].items():
+                if "next_id" not in user:
+                    # Snapshots from before session IDs kept the last 50 sessions only
+                    user["sessions"] = [dict(s, id=number) for number, s in enumerate(user["sessions"], 1)]
+                    user["next_id"] = len(user["sessions"]) + 1
+                # Snapshots written before rollups existed only have the recent sessions to go on
+                rollup = user.get("rollup")
+                user["rollup"] = UserRollup.from_dict(rollup) if rollup else UserRollup.from_sessions(user["sessions"])
+                user.setdefault("archived_through", 0)
+                self.users[user_id] = user
+            self._load_archive()
+
+        segments = [n for n in self._segments() if n >= first_segment]
+        replayed = 0
+        for number in segments:
+            replayed += self._replay(os.path.join(self.directory, segment_name(number)))
+        if replayed:
+            logger.info(f"Replayed {replayed} progress events after snapshot")
+        return segments[-1] if segments else first_segment
+
+    def _load_archive(self):
+        """Merge archived sessions back into the users loaded from the snapshot"""
+        path = os.path.join(self.directory, ARCHIVE_FILE)
+        if not os.path.exists(path):
+            return
+        archived: Dict[str, Dict[int, Dict]] = {}
+        good_offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    session = json.loads(line)
+                except ValueError:
+                    break
+                good_offset += len(line)
+                user = self.users.get(session["user_id"])
+                # Lines past the snapshot's watermark were written by a compaction that never finished;
+                # a later line for the same id (after a re-import) replaces the earlier one
+                if user is not None and session["id"] <= user["archived_through"]:
+                    archived.setdefault(session.pop("user_id"), {})[session["id"]] = session
+        self._truncate_torn(path, good_offset)
+        for user_id, sessions in archived.items():
+            user = self.users[user_id]
+            user["sessions"] = sorted(list(sessions.values()) + user["sessions"], key=session_key)
+
+    def _replay(self, path: str) -> int:
+        count = 0
+        good_offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                good_offset += len(line)
+                user = self.users.get(event.get("user_id"))
+                # The snapshot is taken user by user after rotation, so it may already hold this session
+                if "id" in event and user is not None and event["id"] < user["next_id"]:
+                    continue
+                self._apply(event)
+                count += 1
+        self._truncate_torn(path, good_offset)
+        return count
+
+    def _truncate_torn(self, path: str, good_offset: int):
+        if good_offset != os.path.getsize(path):
+            # A torn write from a crash; drop the partial record
+            logger.warning(f"Truncating partial record at {path}:{good_offset}")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+
+    # -- writes ------------------------------------------------------------
+
+    def _append(self, events: List[Dict]):
+        with self.lock:
+            for event in events:
+                session_id = self._apply(event)
+                if session_id is not None:
+                    # Lets replay skip sessions the snapshot already holds
+                    event["id"] = session_id
+            data = b"".join(json.dumps(e, separators=(",", ":")).encode("utf-8") + b"\n" for e in events)
+            self.log.write(data)
+            # Hand the bytes to the OS now; fsync happens in batches on the sync thread
+            self.log.flush()
+            self.bytes_appended += len(data)
+            self.pending_events += len(events)
+            pending = self.pending_events
+        if pending >= FSYNC_BATCH_EVENTS:
+            with self.sync_needed:
+                self.sync_needed.notify()
+
+    def sync(self):
+        """fsync everything appended so far"""
+        with self.sync_lock:
+            with self.lock:
+                if not self.pending_events:
+                    return
+                self.pending_events = 0
+                fd = self.log.fileno()
+            os.fsync(fd)
+
+    def _sync_loop(self):
+        while not self.stopping.is_set():
+            with self.sync_needed:
+                self.sync_needed.wait(FSYNC_INTERVAL_SECONDS)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Progress log fsync failed: {str(e)}")
+
+    # -- compaction --------------------------------------------------------
+
+    def compact(self):
+        """Rotate to a new segment, snapshot state, then drop the sealed segments"""
+        with self.sync_lock, self.lock:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.pending_events = 0
+            self.log.close()
+            sealed = self.segment
+            self.segment += 1
+            self.log = open(os.path.join(self.directory, segment_name(self.segment)), "ab")
+            user_ids = list(self.users)
+            next_segment = self.segment
+
+        # Users are copied one at a time so writers never wait for the whole state to be copied.
+        # A copy may include sessions already in the new segment; replay skips those by id.
+        users = {}
+        watermarks = []
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with open(archive_path, "ab") as archive:
+            for user_id in user_ids:
+                with self.lock:
+                    user = self.users.get(user_id)
+                    if user is None:
+                        continue
+                    sessions = list(user["sessions"])
+                    state = {
+                        "created_at": user["created_at"],
+                        "last_updated": user["last_updated"],
+                        "scores": dict(user["scores"]),
+                        "next_id": user["next_id"],
+                        "rollup": user["rollup"].to_dict(),
+                    }
+                    archived_through = user.get("archived_through", 0)
+
+                # Session ids count up per user, so an id watermark archives each session exactly once
+                cutoff = max(archived_through, state["next_id"] - 1 - SNAPSHOT_SESSIONS)
+                archive.write(b"".join(
+                    json.dumps(dict(s, user_id=user_id), separators=(",", ":")).encode("utf-8") + b"\n"
+                    for s in sessions if archived_through < s["id"] <= cutoff
+                ))
+                state["sessions"] = [s for s in sessions if s["id"] > cutoff]
+                state["archived_through"] = cutoff
+                users[user_id] = state
+                watermarks.append((user_id, user, cutoff))
+            archive.flush()
+            os.fsync(archive.fileno())
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temp_path = snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"next_segment": next_segment, "users": users}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, snapshot_path)
+
+        with self.lock:
+            for user_id, user, cutoff in watermarks:
+                # Skip users replaced by an import since they were copied
+                if self.users.get(user_id) is user:
+                    user["archived_through"] = cutoff
+
+        for number in self._segments():
+            if number <= sealed:
+                os.remove(os.path.join(self.directory, segment_name(number)))
+        logger.info(f"Compacted progress log: {len(users)} users, live segment {next_segment}")
+
+    def _compact_loop(self):
+        last_compaction = time.monotonic()
+        while not self.stopping.wait(1.0):
+            due = time.monotonic() - last_compaction >= COMPACT_INTERVAL_SECONDS
+            with self.lock:
+                oversized = self.log.tell() >= COMPACT_SEGMENT_BYTES
+            if due or oversized:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Progress log compaction failed: {str(e)}")
+                last_compaction = time.monotonic()
+
+    def close(self):
+        self.stopping.set()
+        with self.sync_needed:
+            self.sync_needed.notify()
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log.close()
@@ -0,0 +1,113 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+
+# Smoothing factors for the short- and long-horizon score averages used for trend
+FAST_ALPHA = 0.5
+SLOW_ALPHA = 0.2
+TREND_THRESHOLD = 0.5
+ACTIVITY_DAYS = 7
+
+
+class UserRollup:
+    """
+    Per-user analytics kept up to date on every recorded session, so reads
+    never have to scan session history: running sums and counts per section,
+    fast/slow exponential moving averages for the trend, and a ring buffer
+    of session counts for the last ACTIVITY_DAYS calendar days.
+    """
+
+    def __init__(self):
+        self.total_sessions = 0
+        self.total_score = 0
+        self.section_counts: Dict[str, int] = {}
+        self.section_sums: Dict[str, int] = {}
+        self.ema_fast: Optional[float] = None
+        self.ema_slow: Optional[float] = None
+        self.last_timestamp: Optional[str] = None
+        # Slot i holds the count for the day whose ordinal is days[i] (ordinal % ACTIVITY_DAYS == i)
+        self.days = [0] * ACTIVITY_DAYS
+        self.counts = [0] * ACTIVITY_DAYS
+
+    def add(self, section: str, score: int, timestamp: str):
+        self.total_sessions += 1
+        self.total_score += score
+        self.section_counts[section] = self.section_counts.get(section, 0) + 1
+        self.section_sums[section] = self.section_sums.get(section, 0) + score
+
+        if self.ema_fast is None:
+            self.ema_fast = self.ema_slow = float(score)
+        else:
+            self.ema_fast += FAST_ALPHA * (score - self.ema_fast)
+            self.ema_slow += SLOW_ALPHA * (score - self.ema_slow)
+
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+        day = datetime.fromisoformat(timestamp).toordinal()
+        slot = day % ACTIVITY_DAYS
+        if self.days[slot] < day:
+            self.days[slot] = day
+            self.counts[slot] = 0
+        if self.days[slot] == day:
+            self.counts[slot] += 1
+
+    @property
+    def average_score(self) -> float:
+        return self.total_score / self.total_sessions if self.total_sessions else 0.0
+
+    def section_average(self, section: str) -> float:
+        count = self.section_counts.get(section, 0)
+        return self.section_sums[section] / count if count else 0.0
+
+    def recent_activity(self, today: Optional[date] = None) -> int:
+        """Sessions recorded today and in the previous ACTIVITY_DAYS - 1 days"""
+        today_ordinal = (today or date.today()).toordinal()
+        return sum(
+            count for day, count in zip(self.days, self.counts)
+            if 0 <= today_ordinal - day < ACTIVITY_DAYS
+        )
+
+    def trend(self) -> str:
+        """Compare the fast and slow moving averages"""
+        if self.total_sessions < 2:
+            return "insufficient_data"
+        if self.ema_fast > self.ema_slow + TREND_THRESHOLD:
+            return "improving"
+        if self.ema_fast < self.ema_slow - TREND_THRESHOLD:
+            return "declining"
+        return "stable"
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_sessions": self.total_sessions,
+            "total_score": self.total_score,
+            "section_counts": dict(self.section_counts),
+            "section_sums": dict(self.section_sums),
+            "ema_fast": self.ema_fast,
+            "ema_slow": self.ema_slow,
+            "last_timestamp": self.last_timestamp,
+            "days": list(self.days),
+            "counts": list(self.counts),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserRollup":
+        rollup = cls()
+        rollup.total_sessions = data["total_sessions"]
+        rollup.total_score = data["total_score"]
+        rollup.section_counts = dict(data["section_counts"])
+        rollup.section_sums = dict(data["section_sums"])
+        rollup.ema_fast = data["ema_fast"]
+        rollup.ema_slow = data["ema_slow"]
+        rollup.last_timestamp = data["last_timestamp"]
+        rollup.days = list(data["days"])
+        rollup.counts = list(data["counts"])
+        return rollup
+
+    @classmethod
+    def from_sessions(cls, sessions: Iterable[Dict]) -> "UserRollup":
+        """Build a rollup from existing session records, oldest first"""
+        rollup = cls()
+        for s in sessions:
+            rollup.add(s["section"], s["score"], s["timestamp"])
+        return rollup
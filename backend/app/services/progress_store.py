@@ -0,0 +1,551 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .progress_rollup import UserRollup
+
+logger = logging.getLogger(__name__)
+
+# "sqlite", "eventlog" or "memory"
+PROGRESS_BACKEND = os.getenv("PROGRESS_BACKEND", "sqlite")
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH", "user_progress.db")
+LEGACY_PROGRESS_FILE = os.getenv("PROGRESS_FILE", "user_progress.json")
+LEADERBOARD_SECTIONS = ("speak", "write", "describe")
+# Session scores are 0-10; the update API rejects anything else
+MAX_SCORE = 10
+
+
+def clamp_score(score: int) -> int:
+    return min(max(score, 0), MAX_SCORE)
+
+
+class ProgressStore:
+    """Storage interface for per-user best scores and practice sessions"""
+
+    def record_session(self, user_id: str, section: str, score: int, timestamp: str, session_data: Dict):
+        """Append a session and raise the section's best score if needed"""
+        self.record_sessions([(user_id, section, score, timestamp, session_data)])
+
+    def record_sessions(self, records: Iterable[tuple]):
+        """
+        Apply many (user_id, section, score, timestamp, session_data) records
+        at once
+        """
+        raise NotImplementedError
+
+    def import_users(self, users: Iterable[Dict]):
+        """Bulk-load users shaped like get_user() plus a "sessions" list (used by migrations)"""
+        raise NotImplementedError
+
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        """Return {"user_id", "created_at", "last_updated", "scores", "rollup"} or None"""
+        raise NotImplementedError
+
+    def get_session_page(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                         before: Optional[tuple] = None, limit: int = 20) -> List[Dict]:
+        """
+        Up to `limit` sessions newest first, each with an "id". `start` is an
+        inclusive and `end` an exclusive timestamp bound; `before` is the
+        (timestamp, id) of the last session on the previous page.
+        """
+        raise NotImplementedError
+
+    def iter_user_summaries(self) -> Iterator[Dict]:
+        """Yield {"user_id", "scores", "average_score", "total_sessions"} for every user"""
+        raise NotImplementedError
+
+    def count_users(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def session_key(session: Dict) -> tuple:
+    return session["timestamp"], session["id"]
+
+
+def bisect_sessions(sessions: List[Dict], key: tuple, hi: Optional[int] = None) -> int:
+    """bisect_left over sessions sorted by session_key (bisect's key= needs Python 3.10)"""
+    low, high = 0, len(sessions) if hi is None else hi
+    while low < high:
+        middle = (low + high) // 2
+        if session_key(sessions[middle]) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class MemoryProgressStore(ProgressStore):
+    """Everything in process memory; nothing survives a restart (development and benchmarks)"""
+
+    def __init__(self):
+        self.users: Dict[str, Dict] = {}
+        self.lock = threading.RLock()
+
+    # -- state -------------------------------------------------------------
+
+    def _apply(self, event: Dict) -> Optional[int]:
+        """Apply one event to the in-memory state; returns the new session's id"""
+        if event.get("type") == "import":
+            user = event["user"]
+            sessions = sorted(user["sessions"], key=lambda s: s["timestamp"])
+            self.users[user["user_id"]] = {
+                "created_at": user["created_at"],
+                "last_updated": user["last_updated"],
+                "scores": dict(user["scores"]),
+                "sessions": [dict(s, id=number) for number, s in enumerate(sessions, 1)],
+                "next_id": len(sessions) + 1,
+                "rollup": UserRollup.from_dict(user["rollup"]),
+            }
+            return None
+
+        user_id = event["user_id"]
+        timestamp = event["timestamp"]
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = {
+                "created_at": timestamp,
+                "last_updated": timestamp,
+                "scores": {},
+                "sessions": [],
+                "next_id": 1,
+                "rollup": UserRollup(),
+            }
+        user["last_updated"] = timestamp
+        section = event["section"]
+        user["scores"][section] = max(user["scores"].get(section, 0), event["score"])
+        session = {
+            "id": user["next_id"],
+            "section": section,
+            "score": event["score"],
+            "timestamp": timestamp,
+            "session_data": event.get("session_data") or {},
+        }
+        user["next_id"] += 1
+        sessions = user["sessions"]
+        # Kept sorted by (timestamp, id); new sessions almost always go on the end
+        if not sessions or session_key(session) >= session_key(sessions[-1]):
+            sessions.append(session)
+        else:
+            sessions.insert(bisect_sessions(sessions, session_key(session)), session)
+        user["rollup"].add(section, event["score"], timestamp)
+        return session["id"]
+
+    # -- writes ------------------------------------------------------------
+
+    def _append(self, events: List[Dict]):
+        with self.lock:
+            for event in events:
+                self._apply(event)
+
+    def record_sessions(self, records: Iterable[tuple]):
+        self._append([
+            {
+                "user_id": user_id,
+                "section": section,
+                "score": score,
+                "timestamp": timestamp,
+                "session_data": session_data or {},
+            }
+            for user_id, section, score, timestamp, session_data in records
+        ])
+
+    def import_users(self, users: Iterable[Dict]):
+        self._append([
+            {
+                "type": "import",
+                "user": dict(
+                    user,
+                    sessions=list(user["sessions"]),
+                    rollup=UserRollup.from_sessions(user["sessions"]).to_dict(),
+                ),
+            }
+            for user in users
+        ])
+
+    # -- reads -------------------------------------------------------------
+
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is None:
+                return None
+            return {
+                "user_id": user_id,
+                "created_at": user["created_at"],
+                "last_updated": user["last_updated"],
+                "scores": dict(user["scores"]),
+                "rollup": UserRollup.from_dict(user["rollup"].to_dict()),
+            }
+
+    def get_session_page(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                         before: Optional[tuple] = None, limit: int = 20) -> List[Dict]:
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is None:
+                return []
+            sessions = user["sessions"]
+            # (timestamp,) sorts before every (timestamp, id), so these bisect on the timestamp alone
+            low = bisect_sessions(sessions, (start,)) if start else 0
+            high = len(sessions)
+            if end:
+                high = bisect_sessions(sessions, (end,), hi=high)
+            if before:
+                high = bisect_sessions(sessions, tuple(before), hi=high)
+            return sessions[max(low, high - limit):high][::-1]
+
+    def iter_user_summaries(self) -> Iterator[Dict]:
+        with self.lock:
+            summaries = [
+                {
+                    "user_id": user_id,
+                    "scores": dict(user["scores"]),
+                    "average_score": user["rollup"].average_score,
+                    "total_sessions": user["rollup"].total_sessions,
+                }
+                for user_id, user in self.users.items()
+            ]
+        return iter(summaries)
+
+    def count_users(self) -> int:
+        return len(self.users)
+
+
+class SQLiteProgressStore(ProgressStore):
+    """SQLite storage in WAL mode: one row per user, full session history indexed by (user_id, timestamp)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            last_updated TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS best_scores (
+            user_id TEXT NOT NULL,
+            section TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (user_id, section)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            section TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            session_data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_time ON sessions (user_id, timestamp);
+        CREATE TABLE IF NOT EXISTS rollups (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = PROGRESS_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self._connection().executescript(self.SCHEMA)
+        self._backfill_rollups()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def _backfill_rollups(self):
+        """Build rollups for users stored before rollups existed"""
+        conn = self._connection()
+        missing = [
+            r["user_id"] for r in conn.execute(
+                "SELECT user_id FROM users WHERE user_id NOT IN (SELECT user_id FROM rollups)"
+            )
+        ]
+        if not missing:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id in missing:
+                sessions = conn.execute(
+                    "SELECT section, score, timestamp FROM sessions WHERE user_id = ? ORDER BY timestamp, id",
+                    (user_id,),
+                ).fetchall()
+                self._save_rollup(conn, user_id, UserRollup.from_sessions(sessions))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Built progress rollups for {len(missing)} users")
+
+    def _load_rollup(self, conn: sqlite3.Connection, user_id: str) -> UserRollup:
+        row = conn.execute("SELECT data FROM rollups WHERE user_id = ?", (user_id,)).fetchone()
+        return UserRollup.from_dict(json.loads(row["data"])) if row else UserRollup()
+
+    def _save_rollup(self, conn: sqlite3.Connection, user_id: str, rollup: UserRollup):
+        conn.execute(
+            "INSERT OR REPLACE INTO rollups (user_id, data) VALUES (?, ?)",
+            (user_id, json.dumps(rollup.to_dict(), separators=(",", ":"))),
+        )
+
+    def record_sessions(self, records: Iterable[tuple]):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rollups: Dict[str, UserRollup] = {}
+            for user_id, section, score, timestamp, session_data in records:
+                conn.execute(
+                    "INSERT INTO users (user_id, created_at, last_updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET last_updated = excluded.last_updated",
+                    (user_id, timestamp, timestamp),
+                )
+                conn.execute(
+                    "INSERT INTO best_scores (user_id, section, score) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id, section) DO UPDATE SET score = MAX(score, excluded.score)",
+                    (user_id, section, score),
+                )
+                conn.execute(
+                    "INSERT INTO sessions (user_id, section, score, timestamp, session_data) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, section, score, timestamp, json.dumps(session_data or {})),
+                )
+                if user_id not in rollups:
+                    rollups[user_id] = self._load_rollup(conn, user_id)
+                rollups[user_id].add(section, score, timestamp)
+            for user_id, rollup in rollups.items():
+                self._save_rollup(conn, user_id, rollup)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def import_users(self, users: Iterable[Dict]):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user in users:
+                user_id = user["user_id"]
+                conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, created_at, last_updated) VALUES (?, ?, ?)",
+                    (user_id, user["created_at"], user["last_updated"]),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO best_scores (user_id, section, score) VALUES (?, ?, ?)",
+                    [(user_id, section, score) for section, score in user["scores"].items()],
+                )
+                # An import replaces the user, as in the other backends, so running it twice adds nothing
+                conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO sessions (user_id, section, score, timestamp, session_data) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (user_id, s["section"], s["score"], s["timestamp"], json.dumps(s.get("session_data") or {}))
+                        for s in user["sessions"]
+                    ],
+                )
+                self._save_rollup(conn, user_id, UserRollup.from_sessions(user["sessions"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT u.user_id, u.created_at, u.last_updated, r.data AS rollup FROM users u"
+            " LEFT JOIN rollups r ON r.user_id = u.user_id WHERE u.user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        scores = conn.execute("SELECT section, score FROM best_scores WHERE user_id = ?", (user_id,)).fetchall()
+        return {
+            "user_id": row["user_id"],
+            "created_at": row["created_at"],
+            "last_updated": row["last_updated"],
+            "scores": {r["section"]: r["score"] for r in scores},
+            "rollup": UserRollup.from_dict(json.loads(row["rollup"])) if row["rollup"] else UserRollup(),
+        }
+
+    def get_session_page(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                         before: Optional[tuple] = None, limit: int = 20) -> List[Dict]:
+        # Every condition is a range on the (user_id, timestamp) index, so cost follows the page size
+        clauses = ["user_id = ?"]
+        params: list = [user_id]
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if before:
+            # The bare "timestamp <= ?" keeps this a range scan on the index
+            clauses.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+            params.extend([before[0], before[0], before[1]])
+        rows = self._connection().execute(
+            "SELECT id, section, score, timestamp, session_data FROM sessions"
+            f" WHERE {' AND '.join(clauses)} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [
+            {
+                "id": r["id"],
+                "section": r["section"],
+                "score": r["score"],
+                "timestamp": r["timestamp"],
+                "session_data": json.loads(r["session_data"] or "{}"),
+            }
+            for r in rows
+        ]
+
+    def iter_user_summaries(self) -> Iterator[Dict]:
+        conn = self._connection()
+        scores: Dict[str, Dict[str, int]] = {}
+        for r in conn.execute("SELECT user_id, section, score FROM best_scores"):
+            scores.setdefault(r["user_id"], {})[r["section"]] = r["score"]
+        for r in conn.execute("SELECT user_id, data FROM rollups"):
+            rollup = json.loads(r["data"])
+            yield {
+                "user_id": r["user_id"],
+                "scores": scores.get(r["user_id"], {}),
+                "average_score": rollup["total_score"] / rollup["total_sessions"] if rollup["total_sessions"] else 0,
+                "total_sessions": rollup["total_sessions"],
+            }
+
+    def count_users(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+def migrate_json_progress(store: ProgressStore, json_path: str = LEGACY_PROGRESS_FILE) -> int:
+    """Import the legacy user_progress.json into a store; returns the number of users"""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    def legacy_users():
+        for user_id, user_data in data.items():
+            created_at = user_data.get("created_at") or datetime.now().isoformat()
+            sessions = [
+                {
+                    "section": s.get("section", "unknown"),
+                    "score": s.get("score", 0),
+                    "timestamp": s.get("timestamp", created_at),
+                    "session_data": s.get("session_data") or {},
+                }
+                for s in user_data.get("sessions", [])
+            ]
+            yield {
+                "user_id": user_id,
+                "created_at": created_at,
+                "last_updated": sessions[-1]["timestamp"] if sessions else created_at,
+                "scores": {
+                    key: value for key, value in user_data.items()
+                    if key not in ("sessions", "created_at") and isinstance(value, int)
+                },
+                "sessions": sessions,
+            }
+
+    store.import_users(legacy_users())
+    logger.info(f"Migrated {len(data)} users from {json_path}")
+    return len(data)
+
+
+@contextmanager
+def exclusive_file_lock(path: str):
+    """Blocking exclusive lock on `path`, shared by every process on this host"""
+    with open(path, "a+") as handle:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def migrate_legacy_progress(store: ProgressStore, json_path: str = LEGACY_PROGRESS_FILE):
+    """
+    Import and rename the legacy JSON file once. Every uvicorn worker calls
+    this on startup, so the import runs under a file lock and re-checks the
+    file once the lock is held: the first worker imports, the rest find it
+    already renamed.
+    """
+    if not os.path.exists(json_path):
+        return
+    with exclusive_file_lock(json_path + ".lock"):
+        if not os.path.exists(json_path):
+            return
+        migrate_json_progress(store, json_path)
+        os.replace(json_path, json_path + ".migrated")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_progress_store(backend: str = PROGRESS_BACKEND) -> ProgressStore:
+    """Build the configured storage backend, behind the write-behind buffer unless it is disabled"""
+    from .progress_buffer import FLUSH_INTERVAL_SECONDS, WriteBehindProgressStore
+
+    if backend == "sqlite":
+        store = SQLiteProgressStore(PROGRESS_DB_PATH)
+    elif backend == "eventlog":
+        from .progress_log import EventLogProgressStore
+        store = EventLogProgressStore()
+    elif backend == "memory":
+        store = MemoryProgressStore()
+    else:
+        raise ValueError(f"Unknown progress backend: {backend}")
+    if FLUSH_INTERVAL_SECONDS > 0:
+        store = WriteBehindProgressStore(store)
+    return store
+
+
+def get_progress_store() -> ProgressStore:
+    """Shared store; imports user_progress.json on first use if it is still around"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = create_progress_store()
+                migrate_legacy_progress(store, LEGACY_PROGRESS_FILE)
+                _store = store
+    return _store
+
+
+def close_progress_store():
+    """Flush and close the shared store on shutdown"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            try:
+                _store.close()
+            finally:
+                _store = None
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, List
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    # Python 3.8
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Reminder times are grouped into slots of this many minutes (must divide 60)
+REMINDER_SLOT_MINUTES = int(os.getenv("REMINDER_SLOT_MINUTES", "30"))
+DEFAULT_REMINDER_TIME = "19:00"
+# Where users who never saved preferences get their 19:00 reminder
+DEFAULT_REMINDER_TIMEZONE = os.getenv("REMINDER_DEFAULT_TIMEZONE", "UTC")
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        get_zone(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def slot_start(reminder_time: str) -> str:
+    """The slot an "HH:MM" reminder time falls in, e.g. "19:40" -> "19:30" for 30-minute slots"""
+    hours, minutes = (int(part) for part in reminder_time.split(":"))
+    return f"{hours:02d}:{minutes - minutes % REMINDER_SLOT_MINUTES:02d}"
+
+
+def reminder_bucket(reminder_time: str, timezone: str) -> str:
+    """Bucket key stored on a preferences document: local slot start plus its timezone"""
+    return f"{slot_start(reminder_time)}|{timezone}"
+
+
+def current_buckets(now: datetime, timezones: Iterable[str]) -> List[str]:
+    """
+    Buckets whose slot is starting at `now` (an aware datetime) somewhere.
+    Keys hold local wall-clock times, so reminders follow DST changes
+    without re-bucketing anyone.
+    """
+    buckets = []
+    for timezone in timezones:
+        if not is_valid_timezone(timezone):
+            continue
+        local = now.astimezone(get_zone(timezone))
+        buckets.append(reminder_bucket(f"{local.hour:02d}:{local.minute:02d}", timezone))
+    return buckets
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def model_dump(model: BaseModel) -> Dict:
+    """model.dict() on pydantic v1, model_dump() on v2 (where dict() is deprecated)"""
+    if hasattr(model, "model_dump"):
+        return model.model_dump()
+    return model.dict()
+
+
+def model_dump_json(model: BaseModel) -> str:
+    if hasattr(model, "model_dump_json"):
+        return model.model_dump_json()
+    return model.json()
+
+
+def cache_key(*parts: str) -> str:
+    """Combine a content digest with request parameters into one cache key"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class ResponseCache:
+    """LRU cache of API responses, bounded by the serialized size of its entries"""
+
+    def __init__(self, name: str, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, response: BaseModel):
+        size = len(model_dump_json(response)) + len(key)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self.entries[key] = (response, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[BaseModel]],
+        cacheable: Callable[[BaseModel], bool] = lambda response: True,
+    ) -> BaseModel:
+        """Serve a cached response, join an identical in-flight request, or compute it"""
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+            pending = self.inflight.get(key)
+            if pending is None:
+                break
+            # Double submits arrive while the first request is still waiting on Gemini
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The first request was cancelled (its client went away); compute it ourselves
+                if not pending.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[key] = future
+        try:
+            response = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            if cacheable(response):
+                self.put(key, response)
+            return response
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Shared caches for the speaking endpoints
+speak_response_cache = ResponseCache("speak_feedback")
+analysis_response_cache = ResponseCache("analyze_speech")
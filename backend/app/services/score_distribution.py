@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from .progress_store import LEADERBOARD_SECTIONS, ProgressStore, clamp_score
+
+logger = logging.getLogger(__name__)
+
+# Seconds between rebuilds from the store; 0 builds once per process
+SCORE_DISTRIBUTION_REFRESH_INTERVAL = float(os.getenv("SCORE_DISTRIBUTION_REFRESH_INTERVAL", "0"))
+
+
+class ScoreDistribution:
+    """
+    Per-section histogram of users' best scores. Scores are small integers,
+    so an exact count per distinct score takes less memory than a quantile
+    sketch and answers rank queries in time proportional to the score range,
+    independent of the number of users. Scores outside 0..MAX_SCORE (from
+    data written before the API validated them) are clamped into range.
+    """
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[int, int]] = {section: {} for section in LEADERBOARD_SECTIONS}
+        self.lock = threading.Lock()
+
+    def record_best(self, section: str, previous: Optional[int], best: int):
+        """Move one user from their previous best score (None for a first score) to the new one"""
+        histogram = self.counts.get(section)
+        if histogram is None:
+            return
+        best = clamp_score(best)
+        if previous is not None:
+            previous = clamp_score(previous)
+        if previous == best:
+            return
+        with self.lock:
+            if previous is not None:
+                remaining = histogram.get(previous, 0) - 1
+                if remaining > 0:
+                    histogram[previous] = remaining
+                else:
+                    histogram.pop(previous, None)
+            histogram[best] = histogram.get(best, 0) + 1
+
+    def users(self, section: str) -> int:
+        with self.lock:
+            return sum(self.counts[section].values())
+
+    def percentile_rank(self, section: str, score: int) -> float:
+        """Percentage of users whose best score in the section is below `score`"""
+        with self.lock:
+            histogram = self.counts[section]
+            total = sum(histogram.values())
+            below = sum(n for s, n in histogram.items() if s < score)
+        return round(100.0 * below / total, 1) if total else 0.0
+
+    def quantile(self, section: str, q: float) -> Optional[int]:
+        """Smallest best score with at least q of users at or below it"""
+        with self.lock:
+            histogram = sorted(self.counts[section].items())
+        total = sum(n for _, n in histogram)
+        if not total:
+            return None
+        seen = 0
+        for score, n in histogram:
+            seen += n
+            if seen >= q * total:
+                return score
+        return histogram[-1][0]
+
+    @classmethod
+    def from_store(cls, store: ProgressStore) -> "ScoreDistribution":
+        distribution = cls()
+        for summary in store.iter_user_summaries():
+            for section, score in summary["scores"].items():
+                distribution.record_best(section, None, score)
+        return distribution
+
+
+_distribution: Optional[ScoreDistribution] = None
+_distribution_lock = threading.Lock()
+_stop_refreshing: Optional[threading.Event] = None
+
+
+def _refresh_loop(store: ProgressStore, stop: threading.Event):
+    global _distribution
+    while not stop.wait(SCORE_DISTRIBUTION_REFRESH_INTERVAL):
+        try:
+            distribution = ScoreDistribution.from_store(store)
+        except Exception as e:
+            logger.error(f"Failed to refresh score distribution: {str(e)}")
+            continue
+        with _distribution_lock:
+            if not stop.is_set():
+                _distribution = distribution
+
+
+def get_score_distribution(store: ProgressStore) -> ScoreDistribution:
+    """
+    Shared distribution, built from the store with one scan on first use
+    so it always matches the stored best scores. Each worker process has
+    its own copy. With several workers, set SCORE_DISTRIBUTION_REFRESH_INTERVAL
+    so each worker rebuilds from the shared store and picks up the others'
+    updates.
+    """
+    global _distribution, _stop_refreshing
+    if _distribution is None:
+        with _distribution_lock:
+            if _distribution is None:
+                distribution = ScoreDistribution.from_store(store)
+                logger.info("Built score distribution from progress store")
+                if SCORE_DISTRIBUTION_REFRESH_INTERVAL > 0:
+                    _stop_refreshing = threading.Event()
+                    threading.Thread(target=_refresh_loop, args=(store, _stop_refreshing), daemon=True).start()
+                _distribution = distribution
+    return _distribution
+
+
+def reset_score_distribution():
+    """Drop the distribution so the next read rebuilds it (used when the store is swapped, and on shutdown)"""
+    global _distribution, _stop_refreshing
+    with _distribution_lock:
+        if _stop_refreshing is not None:
+            _stop_refreshing.set()
+            _stop_refreshing = None
+        _distribution = None
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+SCHEDULER_SCAN_SHARDS = int(os.getenv("SCHEDULER_SCAN_SHARDS", "8"))
+SCHEDULER_SCAN_PAGE_SIZE = int(os.getenv("SCHEDULER_SCAN_PAGE_SIZE", "500"))
+
+# Firebase Auth UIDs and Firestore auto-IDs draw from these characters (in sort order)
+ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Receives one page of (id, data) pairs and returns how many of them it acted on
+PageHandler = Callable[[List[Tuple[str, Dict]]], Awaitable[int]]
+
+
+def shard_bounds(shards: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Split the document-ID space into `shards` contiguous [lower, upper)
+    ranges by leading character. IDs are random, so the ranges hold about
+    equal numbers of documents. None means unbounded.
+    """
+    shards = max(1, min(shards, len(ID_ALPHABET)))
+    cuts = [ID_ALPHABET[len(ID_ALPHABET) * i // shards] for i in range(1, shards)]
+    return list(zip([None] + cuts, cuts + [None]))
+
+
+class ShardedScan:
+    """
+    Pages through the documents matching one field condition, split into
+    document-ID range shards that run concurrently. After each page is
+    handled, the shard's last document ID is checkpointed in
+    scheduler_runs/{run_id}, so a run that dies part way resumes every
+    shard after its last handled page. A page may be handled twice if the
+    process dies between handling it and saving the checkpoint, so handlers
+    must be idempotent. A run whose shards have all finished starts over.
+    """
+
+    def __init__(self, db, executor: Executor, run_id: str, collection: str, field: str, op: str, value,
+                 shards: int = SCHEDULER_SCAN_SHARDS, page_size: int = SCHEDULER_SCAN_PAGE_SIZE):
+        self.db = db
+        self.executor = executor
+        self.run_id = run_id
+        self.collection = collection
+        self.field = field
+        self.op = op
+        self.value = value
+        self.bounds = shard_bounds(shards)
+        self.page_size = page_size
+        self.ref = db.collection('scheduler_runs').document(run_id)
+
+    def _page(self, lower: Optional[str], upper: Optional[str], cursor: Optional[str]) -> List[Tuple[str, Dict]]:
+        query = self.db.collection(self.collection).where(self.field, self.op, self.value).order_by('__name__')
+        if cursor is not None:
+            query = query.start_after({'__name__': cursor})
+        elif lower is not None:
+            query = query.start_at({'__name__': lower})
+        if upper is not None:
+            query = query.end_before({'__name__': upper})
+        return [(doc.id, doc.to_dict()) for doc in query.limit(self.page_size).stream()]
+
+    def _load_checkpoints(self) -> Dict[str, Dict]:
+        snapshot = self.ref.get()
+        run = snapshot.to_dict() if snapshot.exists else {}
+        shards = run.get('shards', {})
+        if run.get('shard_count') != len(self.bounds):
+            return {}
+        if len(shards) == len(self.bounds) and all(state.get('done') for state in shards.values()):
+            return {}
+        return shards
+
+    def _checkpoint(self, shard: int, state: Dict):
+        self.ref.set({
+            'shard_count': len(self.bounds),
+            'shards': {str(shard): state},
+            'updated_at': datetime.now().isoformat()
+        }, merge=True)
+
+    async def _run_shard(self, shard: int, state: Dict, handle: PageHandler) -> Dict:
+        loop = asyncio.get_running_loop()
+        lower, upper = self.bounds[shard]
+        state = {'cursor': None, 'done': False, 'scanned': 0, 'matched': 0, 'seconds': 0.0, **state}
+        resumed = state['cursor'] is not None
+        while not state['done']:
+            started = time.monotonic()
+            page = await loop.run_in_executor(self.executor, self._page, lower, upper, state['cursor'])
+            if page:
+                state['matched'] += await handle(page)
+                state['scanned'] += len(page)
+                state['cursor'] = page[-1][0]
+            state['done'] = len(page) < self.page_size
+            state['seconds'] += time.monotonic() - started
+            await loop.run_in_executor(self.executor, self._checkpoint, shard, state)
+        return {'shard': shard, 'range': [lower, upper], 'resumed': resumed, **state}
+
+    async def run(self, handle: PageHandler) -> Dict:
+        """Scan every shard, handing each page to `handle`; returns the run summary"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        checkpoints = await loop.run_in_executor(self.executor, self._load_checkpoints)
+        shards = await asyncio.gather(*(
+            self._run_shard(shard, checkpoints.get(str(shard), {}), handle) for shard in range(len(self.bounds))
+        ), return_exceptions=True)
+        # A failed shard stops at its last checkpoint; the others finish, and the next run resumes it
+        for shard in shards:
+            if isinstance(shard, BaseException):
+                raise shard
+        return {
+            'run_id': self.run_id,
+            'scanned': sum(shard['scanned'] for shard in shards),
+            'matched': sum(shard['matched'] for shard in shards),
+            'seconds': round(time.monotonic() - started, 3),
+            'shards': [
+                {key: value for key, value in shard.items() if key not in ('cursor', 'done')}
+                for shard in shards
+            ],
+        }
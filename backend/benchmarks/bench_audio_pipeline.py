@@ -0,0 +1,81 @@
+"""
+Audio normalization benchmark
+Decodes and resamples multi-minute synthetic recordings to 16 kHz mono PCM.
+
+Run from the backend folder:
+    python -m benchmarks.bench_audio_pipeline --minutes 1 3 10
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.audio_pipeline import CHUNK_SIZE, normalize_chunks
+
+
+def make_wav(minutes: float, sample_rate: int, channels: int) -> bytes:
+    """Build a speech-like WAV (tone bursts separated by pauses)"""
+    total = int(minutes * 60 * sample_rate)
+    t = np.arange(total) / sample_rate
+    envelope = (np.sin(2 * np.pi * 0.7 * t) > -0.3).astype(np.float32)
+    signal = 0.4 * np.sin(2 * np.pi * 220 * t) * envelope
+    frames = np.repeat(signal[:, None], channels, axis=1)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((frames * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def iter_chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def run(minutes: float, sample_rate: int, channels: int):
+    data = make_wav(minutes, sample_rate, channels)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    audio = normalize_chunks(iter_chunks(data, CHUNK_SIZE))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    try:
+        speed = audio.duration_seconds / elapsed
+        print(f"  {minutes:>5.1f} min {sample_rate} Hz x{channels}: "
+              f"{elapsed * 1000:8.1f} ms  ({speed:7.0f}x realtime)  "
+              f"input {len(data) / 1e6:6.1f} MB  peak heap {peak / 1e6:5.2f} MB  "
+              f"-> {audio.num_samples} samples")
+    finally:
+        audio.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio normalization pipeline")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--rates", type=int, nargs="+", default=[16000, 44100, 48000])
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Audio normalization benchmark")
+    print("=" * 50)
+    for rate in args.rates:
+        for channels in (1, 2):
+            for minutes in args.minutes:
+                run(minutes, rate, channels)
+
+
+if __name__ == "__main__":
+    main()
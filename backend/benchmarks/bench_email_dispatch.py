@@ -0,0 +1,87 @@
+"""
+Email dispatch throughput benchmark
+Sends N reminder emails to a local SMTP sink two ways:
+  before - the original path: connect, greet and quit for every message, one at a time
+  after  - EmailDispatcher: pooled persistent connections sending concurrently
+
+--latency-ms delays every server reply to model the network round trip,
+and --connect-ms delays the greeting to stand in for TLS and login.
+
+Run from the backend folder:
+    python -m benchmarks.bench_email_dispatch --messages 2000 --latency-ms 5 --connect-ms 50
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.email_dispatch import EmailDispatcher
+from app.services.email_service import EmailService
+from benchmarks.smtp_sink import SMTPSink
+
+
+def messages(service: EmailService, count: int):
+    return [service.streak_reminder_message(f"user-{i}@example.com", "Learner", 7, 10) for i in range(count)]
+
+
+def before(port: int, batch) -> float:
+    start = time.perf_counter()
+    for msg in batch:
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.sendmail(msg.from_addr, msg.to_addrs, msg.data)
+    return time.perf_counter() - start
+
+
+async def send_all(dispatcher: EmailDispatcher, batch):
+    return await asyncio.gather(*(dispatcher.send_async(msg) for msg in batch))
+
+
+def after(port: int, batch, pool_size: int, rate: float) -> float:
+    dispatcher = EmailDispatcher("127.0.0.1", port, pool_size=pool_size, rate=rate,
+                                 burst=pool_size, starttls=False)
+    start = time.perf_counter()
+    results = asyncio.run(send_all(dispatcher, batch))
+    elapsed = time.perf_counter() - start
+    dispatcher.close()
+    assert all(results), dispatcher.stats()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled SMTP dispatch against a local sink")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--rate", type=float, default=0, help="send-rate limit in messages/second (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--connect-ms", type=float, default=50)
+    parser.add_argument("--skip-before", action="store_true")
+    args = parser.parse_args()
+
+    sink = SMTPSink(latency=args.latency_ms / 1000, connect_delay=args.connect_ms / 1000).start()
+    batch = messages(EmailService(), args.messages)
+
+    print("=" * 50)
+    print(f"Email dispatch: {args.messages} messages, {args.latency_ms:g} ms/reply, {args.connect_ms:g} ms/connect")
+    print("=" * 50)
+
+    if not args.skip_before:
+        connections = sink.counts["connections"]
+        elapsed = before(sink.port, batch)
+        print(f"  {'before (connect per message)':<30} {elapsed:>7.2f}s  {len(batch) / elapsed:>8.1f} msg/s"
+              f"  {sink.counts['connections'] - connections} connections")
+
+    for pool_size in args.pool_sizes:
+        connections = sink.counts["connections"]
+        elapsed = after(sink.port, batch, pool_size, args.rate)
+        print(f"  {f'after (pool of {pool_size})':<30} {elapsed:>7.2f}s  {len(batch) / elapsed:>8.1f} msg/s"
+              f"  {sink.counts['connections'] - connections} connections")
+
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
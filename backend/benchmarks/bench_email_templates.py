@@ -0,0 +1,89 @@
+"""
+Email rendering benchmark
+Renders N personalized streak reminders, ready for SMTP DATA, two ways:
+  before - format the full HTML/text sources per message, build a MIMEMultipart
+           tree and serialize it (what send_message did for every recipient)
+  after  - compiled templates: splice values between cached encoded segments
+           and pre-encoded MIME framing
+
+Reports wall time (untraced), then peak traced memory while rendering and
+discarding messages, and bytes allocated per message, via tracemalloc.
+
+Run from the backend folder:
+    python -m benchmarks.bench_email_templates --messages 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.email_service import EmailService
+from app.services.email_templates import STREAK_REMINDER_HTML, STREAK_REMINDER_TEXT
+
+
+def before(service: EmailService, i: int) -> bytes:
+    current, longest = i % 30 + 1, 25
+    near_record = current >= longest - 2
+    values = {
+        "user_name": f"Learner {i}",
+        "current_streak": current,
+        "record_note_html": f"<p>🏆 You're getting close to beating your personal record of <strong>{longest} days</strong>!</p>" if near_record else "",
+        "record_note_text": f"🏆 You're getting close to beating your personal record of {longest} days!" if near_record else "",
+    }
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"🔥 Don't break your {current}-day learning streak!"
+    msg['From'] = f"{service.from_name} <{service.email_address}>"
+    msg['To'] = f"user-{i}@example.com"
+    msg.attach(MIMEText(STREAK_REMINDER_TEXT.format(**values), 'plain'))
+    msg.attach(MIMEText(STREAK_REMINDER_HTML.format(**values), 'html'))
+    return msg.as_bytes()
+
+
+def after(service: EmailService, i: int) -> bytes:
+    return service.streak_reminder_message(f"user-{i}@example.com", f"Learner {i}", i % 30 + 1, 25).data
+
+
+def measure(name: str, render, service: EmailService, messages: int, traced: int):
+    start = time.perf_counter()
+    size = 0
+    for i in range(messages):
+        size += len(render(service, i))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    for i in range(traced):
+        render(service, i)
+    _, peak = tracemalloc.get_traced_memory()
+    # Allocation volume: snapshot the heap with every rendered message kept alive
+    kept = [render(service, i) for i in range(traced)]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {name:<7} {elapsed:>7.2f}s  {elapsed / messages * 1e6:>7.1f} us/msg  {size / messages:>7.0f} B/msg on the wire"
+          f"  peak {(peak - base) / 1024:>7.1f} KiB  retained {(held - base) / len(kept):>7.0f} B/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark email template rendering")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--traced", type=int, default=2000, help="messages rendered under tracemalloc")
+    args = parser.parse_args()
+
+    service = EmailService()
+
+    print("=" * 50)
+    print(f"Email rendering: {args.messages} streak reminders")
+    print("=" * 50)
+    measure("before", before, service, args.messages, args.traced)
+    measure("after", after, service, args.messages, args.traced)
+
+
+if __name__ == "__main__":
+    main()
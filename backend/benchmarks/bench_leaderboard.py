@@ -0,0 +1,69 @@
+"""
+Leaderboard index benchmark
+Fills the in-memory leaderboard index with N users and measures top-10 reads
+and single-user re-ranks, to check read latency stays flat as N grows.
+
+Run from the backend folder:
+    python -m benchmarks.bench_leaderboard --users 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.leaderboard import LeaderboardIndex
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def random_entry():
+    return random.randint(0, 30), random.uniform(1, 10), random.randint(1, 50)
+
+
+def bench(users: int, reads: int, updates: int):
+    index = LeaderboardIndex()
+    start = time.perf_counter()
+    for i in range(users):
+        index.update(f"user-{i}", *random_entry())
+    build = time.perf_counter() - start
+
+    read_times = []
+    for _ in range(reads):
+        t = time.perf_counter()
+        index.top(10)
+        read_times.append(time.perf_counter() - t)
+
+    update_times = []
+    for _ in range(updates):
+        user_id = f"user-{random.randrange(users)}"
+        t = time.perf_counter()
+        index.update(user_id, *random_entry())
+        update_times.append(time.perf_counter() - t)
+
+    print(f"  {users:>9} users  build {build:>6.1f}s"
+          f"  top-10 p50 {percentile(read_times, 0.5) * 1e6:>6.1f} us  p99 {percentile(read_times, 0.99) * 1e6:>6.1f} us"
+          f"  update p50 {percentile(update_times, 0.5) * 1e6:>6.1f} us  p99 {percentile(update_times, 0.99) * 1e6:>6.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the leaderboard index")
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--reads", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=10000)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Leaderboard index benchmark")
+    print("=" * 50)
+    for users in args.users:
+        bench(users, args.reads, args.updates)
+
+
+if __name__ == "__main__":
+    main()
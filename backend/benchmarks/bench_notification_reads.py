@@ -0,0 +1,144 @@
+"""
+Notification scheduler read benchmark (Firestore emulator)
+Seeds N synthetic users with streak and notification documents, then times
+the scheduler's candidate lookups two ways:
+  before - stream the collection and get() each related document in turn
+  after  - query streaks on lastActivityDate, skip users already queued
+           today (from the outbox), then chunked get_all for the remaining
+           candidates' users
+
+Requires the Firestore emulator:
+    firebase emulators:start --only firestore
+    export FIRESTORE_EMULATOR_HOST=localhost:8080
+
+Run from the backend folder:
+    python -m benchmarks.bench_notification_reads --users 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(db, prefix: str, users: int):
+    """Users with emails, streaks with recent activity, and a few notification logs"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    batch = db.batch()
+    writes = 0
+    for i in range(users):
+        user_id = f"user-{i:06d}"
+        active_yesterday = random.random() < 0.3
+        active_today = random.random() < 0.5
+        activities = {}
+        if active_yesterday:
+            activities[yesterday] = {"count": 1, "speak": True, "streak_before_break": random.randint(1, 20)}
+        if active_today:
+            activities[today] = {"count": 1, "write": True}
+        documents = [
+            (f"{prefix}users", {"email": f"{user_id}@example.com", "displayName": f"Learner {i}"}),
+            (f"{prefix}streaks", {
+                "currentStreak": random.choice([0, 0, 1, 3, 7]),
+                "longestStreak": 10,
+                "lastActivityDate": today if active_today else yesterday if active_yesterday else None,
+                "activities": activities,
+            }),
+        ]
+        if random.random() < 0.1:
+            documents.append((f"{prefix}notifications", {today: [{"type": "streak_broken", "timestamp": today}]}))
+        for collection, data in documents:
+            batch.set(db.collection(collection).document(user_id), data)
+            writes += 1
+            if writes == 500:
+                batch.commit()
+                batch = db.batch()
+                writes = 0
+    if writes:
+        batch.commit()
+
+
+def before(db, prefix: str):
+    """The original access pattern: one get() per related document"""
+    reads = 0
+    users = list(db.collection(f"{prefix}users").stream())
+    reads += len(users)
+    for user_doc in users:
+        db.collection(f"{prefix}streaks").document(user_doc.id).get()
+        reads += 1
+    streaks = list(db.collection(f"{prefix}streaks").stream())
+    reads += len(streaks)
+    for streak_doc in streaks:
+        db.collection(f"{prefix}users").document(streak_doc.id).get()
+        db.collection(f"{prefix}notifications").document(streak_doc.id).get()
+        reads += 2
+    return reads
+
+
+class PrefixedClient:
+    """Routes the scheduler's collection names to this run's prefixed collections"""
+
+    def __init__(self, db, prefix: str):
+        self.db = db
+        self.prefix = prefix
+
+    def collection(self, name: str):
+        return self.db.collection(self.prefix + name)
+
+    def document(self, path: str):
+        return self.db.document(self.prefix + path)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+async def after(scheduler):
+    await scheduler.find_inactive_users()
+    await scheduler.find_broken_streaks()
+    return scheduler.data.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark notification scheduler reads")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--skip-before", action="store_true", help="only time the batched reads")
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        print("Set FIRESTORE_EMULATOR_HOST to run this benchmark against the Firestore emulator")
+        sys.exit(1)
+
+    from google.cloud import firestore
+    from app.services.notification_scheduler import NotificationScheduler
+
+    db = firestore.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "fluentease-bench"))
+    prefix = f"bench{uuid.uuid4().hex[:8]}_"
+
+    print("=" * 50)
+    print(f"Notification read benchmark: {args.users} users")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    seed(db, prefix, args.users)
+    print(f"  seeded in {time.perf_counter() - start:.1f}s")
+
+    if not args.skip_before:
+        start = time.perf_counter()
+        reads = before(db, prefix)
+        print(f"  before: {time.perf_counter() - start:>7.1f}s  {reads} document reads, {reads} round trips (plus streams)")
+
+    scheduler = NotificationScheduler(db=PrefixedClient(db, prefix))
+    start = time.perf_counter()
+    stats = asyncio.run(after(scheduler))
+    print(f"  after:  {time.perf_counter() - start:>7.1f}s  {stats['document_reads']} document reads,"
+          f" {stats['round_trips']} round trips")
+    scheduler.data.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Progress backend conformance and throughput benchmark
+Runs the same behaviour checks and the same workload against every progress
+storage backend so one can be picked per deployment on measured numbers.
+
+Run from the backend folder:
+    python -m benchmarks.bench_progress_backends --backends memory sqlite eventlog
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.progress_store import MemoryProgressStore, SQLiteProgressStore
+
+SECTIONS = ["speak", "write", "describe"]
+
+
+def open_store(backend: str, scratch: str):
+    if backend == "memory":
+        return MemoryProgressStore()
+    if backend == "sqlite":
+        return SQLiteProgressStore(os.path.join(scratch, f"{uuid.uuid4().hex}.db"))
+    if backend == "eventlog":
+        from app.services.progress_log import EventLogProgressStore
+        return EventLogProgressStore(os.path.join(scratch, uuid.uuid4().hex))
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+# -- conformance -----------------------------------------------------------
+
+def check_unknown_user(store):
+    assert store.get_user("nobody") is None
+    assert store.get_session_page("nobody") == []
+
+
+def check_best_score_and_rollup(store):
+    store.record_session("alice", "speak", 6, "2024-03-01T10:00:00", {})
+    store.record_session("alice", "speak", 4, "2024-03-01T11:00:00", {"note": "x"})
+    store.record_session("alice", "write", 7, "2024-03-02T09:00:00", {})
+    user = store.get_user("alice")
+    assert user["scores"] == {"speak": 6, "write": 7}, user["scores"]
+    assert user["created_at"] == "2024-03-01T10:00:00"
+    assert user["last_updated"] == "2024-03-02T09:00:00"
+    rollup = user["rollup"]
+    assert rollup.total_sessions == 3
+    assert rollup.section_counts == {"speak": 2, "write": 1}
+    assert abs(rollup.section_average("speak") - 5.0) < 1e-9
+
+
+def check_batch_of_records(store):
+    store.record_sessions([
+        ("bob", "describe", 3, "2024-03-01T08:00:00", {}),
+        ("carol", "speak", 9, "2024-03-01T08:00:00", {}),
+        ("bob", "describe", 8, "2024-03-01T08:30:00", {}),
+    ])
+    assert store.get_user("bob")["scores"] == {"describe": 8}
+    assert store.get_user("carol")["rollup"].total_sessions == 1
+
+
+def check_pages_newest_first(store):
+    # Repeated timestamps make the id part of the cursor matter
+    for i in range(25):
+        store.record_session("dave", "speak", i % 10, f"2024-04-{1 + i // 3:02d}T12:00:00", {"i": i})
+    seen = []
+    before = None
+    while True:
+        page = store.get_session_page("dave", before=before, limit=7)
+        seen.extend(page)
+        if len(page) < 7:
+            break
+        before = (page[-1]["timestamp"], page[-1]["id"])
+    assert [s["session_data"]["i"] for s in seen] == list(range(24, -1, -1))
+
+
+def check_time_range(store):
+    for day in range(1, 11):
+        store.record_session("erin", "write", day, f"2024-05-{day:02d}T07:00:00", {})
+    page = store.get_session_page("erin", start="2024-05-03", end="2024-05-06", limit=100)
+    assert [s["score"] for s in page] == [5, 4, 3], [s["score"] for s in page]
+
+
+def check_import_and_summaries(store):
+    store.import_users([{
+        "user_id": "frank",
+        "created_at": "2024-01-01T00:00:00",
+        "last_updated": "2024-01-03T00:00:00",
+        "scores": {"speak": 8},
+        "sessions": [
+            {"section": "speak", "score": 8, "timestamp": "2024-01-03T00:00:00"},
+            {"section": "speak", "score": 2, "timestamp": "2024-01-02T00:00:00"},
+        ],
+    }])
+    user = store.get_user("frank")
+    assert user["scores"] == {"speak": 8}
+    assert user["rollup"].total_sessions == 2
+    assert [s["score"] for s in store.get_session_page("frank")] == [8, 2]
+    summaries = {s["user_id"]: s for s in store.iter_user_summaries()}
+    assert summaries["frank"]["total_sessions"] == 2
+    assert summaries["frank"]["average_score"] == 5
+    assert store.count_users() == len(summaries)
+
+
+CHECKS = [
+    check_unknown_user,
+    check_best_score_and_rollup,
+    check_batch_of_records,
+    check_pages_newest_first,
+    check_time_range,
+    check_import_and_summaries,
+]
+
+
+def run_conformance(backend: str, scratch: str) -> bool:
+    store = open_store(backend, scratch)
+    ok = True
+    try:
+        for check in CHECKS:
+            try:
+                check(store)
+                print(f"  PASS  {check.__name__}")
+            except AssertionError as e:
+                ok = False
+                print(f"  FAIL  {check.__name__}: {e}")
+    finally:
+        store.close()
+    return ok
+
+
+# -- throughput ------------------------------------------------------------
+
+def measure(name: str, calls: int, make_call):
+    start = time.perf_counter()
+    for i in range(calls):
+        make_call(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<28} {calls:>7} calls  {calls / elapsed:>10.0f} ops/s  {elapsed / calls * 1e6:>9.1f} us/op")
+
+
+def run_throughput(backend: str, scratch: str, users: int, calls: int, batch: int):
+    store = open_store(backend, scratch)
+    try:
+        now = time.time()
+
+        def timestamp(i):
+            return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now + i))
+
+        def update(i):
+            store.record_session(f"user-{random.randrange(users)}", random.choice(SECTIONS),
+                                 random.randint(1, 10), timestamp(i), {})
+
+        def batched_update(i):
+            store.record_sessions([
+                (f"user-{random.randrange(users)}", random.choice(SECTIONS), random.randint(1, 10),
+                 timestamp(i * batch + j), {})
+                for j in range(batch)
+            ])
+
+        measure("record_session", calls, update)
+        batches = max(1, calls // batch)
+        start = time.perf_counter()
+        for i in range(batches):
+            batched_update(i)
+        elapsed = time.perf_counter() - start
+        print(f"  {f'record_sessions x{batch}':<28} {batches * batch:>7} rows   {batches * batch / elapsed:>10.0f} rows/s")
+        measure("get_user", calls, lambda i: store.get_user(f"user-{random.randrange(users)}"))
+        measure("get_session_page(20)", calls, lambda i: store.get_session_page(f"user-{random.randrange(users)}"))
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformance and throughput across progress backends")
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite", "eventlog"])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100, help="records per record_sessions call")
+    args = parser.parse_args()
+
+    failed = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for backend in args.backends:
+            print("=" * 50)
+            print(f"Progress backend: {backend}")
+            print("=" * 50)
+            if not run_conformance(backend, scratch):
+                failed.append(backend)
+            run_throughput(backend, scratch, args.users, args.calls, args.batch)
+
+    if failed:
+        print(f"Conformance failures: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Progress storage benchmark
+Seeds a scratch store with N users, then measures the /progress endpoint
+handlers (update, user progress, history, leaderboard) called in-process.
+
+Run from the backend folder:
+    python -m benchmarks.bench_progress_store --users 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import progress_store
+from app.services import score_distribution
+from app.services.leaderboard import reset_leaderboard_index
+
+SECTIONS = ["speak", "write", "describe"]
+
+
+def seed(store, users: int, sessions_per_user: int, batch: int = 5000):
+    """Bulk-load synthetic users through the store's migration path"""
+    start = datetime.now() - timedelta(days=60)
+    pending = []
+    for i in range(users):
+        sessions = [
+            {
+                "section": random.choice(SECTIONS),
+                "score": random.randint(1, 10),
+                "timestamp": (start + timedelta(minutes=i % 50000 + j * 90)).isoformat(),
+                "session_data": {},
+            }
+            for j in range(sessions_per_user)
+        ]
+        scores = {}
+        for s in sessions:
+            scores[s["section"]] = max(scores.get(s["section"], 0), s["score"])
+        pending.append({
+            "user_id": f"user-{i}",
+            "created_at": start.isoformat(),
+            "last_updated": sessions[-1]["timestamp"],
+            "scores": scores,
+            "sessions": sessions,
+        })
+        if len(pending) >= batch:
+            store.import_users(pending)
+            pending = []
+    if pending:
+        store.import_users(pending)
+
+
+async def measure(name: str, calls: int, make_call):
+    start = time.perf_counter()
+    for i in range(calls):
+        await make_call(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<32} {calls:>7} calls  {calls / elapsed:>10.0f} ops/s  {elapsed / calls * 1e6:>9.1f} us/op")
+
+
+async def run(users: int, sessions_per_user: int, calls: int, leaderboard_calls: int):
+    from app.routes import progress
+
+    async def update(i):
+        await progress.update_progress(progress.ProgressUpdate(
+            user_id=f"user-{random.randrange(users)}",
+            section=random.choice(SECTIONS),
+            score=random.randint(1, 10),
+        ))
+
+    async def read_progress(i):
+        await progress.get_user_progress(f"user-{random.randrange(users)}")
+
+    async def read_history(i):
+        await progress.get_session_history(f"user-{random.randrange(users)}", limit=20, cursor=None, from_=None, to=None)
+
+    async def read_leaderboard(i):
+        await progress.get_leaderboard()
+
+    async def read_percentile(i):
+        await progress.get_percentiles(random.choice(SECTIONS), score=random.randint(1, 10), user_id=None)
+
+    start = time.perf_counter()
+    await progress.get_leaderboard()
+    print(f"  leaderboard index build: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    await progress.get_percentiles("speak", score=5, user_id=None)
+    print(f"  score distribution build: {time.perf_counter() - start:.2f}s")
+
+    await measure("POST /progress/update", calls, update)
+    await measure("GET /progress/user/{id}", calls, read_progress)
+    await measure("GET /progress/user/{id}/history", calls, read_history)
+    await measure("GET /progress/leaderboard", leaderboard_calls, read_leaderboard)
+    await measure("GET /progress/percentiles", calls, read_percentile)
+
+
+async def run_deep_history(store, sessions: int, calls: int):
+    """One user with a long history: page cost should not grow with it"""
+    from app.routes import progress
+
+    start = datetime.now() - timedelta(days=sessions // 10 + 1)
+    store.import_users([{
+        "user_id": "deep-user",
+        "created_at": start.isoformat(),
+        "last_updated": start.isoformat(),
+        "scores": {"speak": 10},
+        "sessions": [
+            {"section": "speak", "score": 5, "timestamp": (start + timedelta(minutes=j * 144)).isoformat()}
+            for j in range(sessions)
+        ],
+    }])
+    middle = (start + timedelta(minutes=sessions // 2 * 144)).isoformat()
+    cursor = progress.encode_cursor({"timestamp": middle, "id": 2 ** 62})
+
+    async def first_page(i):
+        await progress.get_session_history("deep-user", limit=20, cursor=None, from_=None, to=None)
+
+    async def middle_page(i):
+        await progress.get_session_history("deep-user", limit=20, cursor=cursor, from_=None, to=None)
+
+    print(f"  one user with {sessions} sessions:")
+    await measure("history, newest page of 20", calls, first_page)
+    await measure("history, cursor page of 20", calls, middle_page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark progress storage")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--sessions-per-user", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--leaderboard-calls", type=int, default=20)
+    parser.add_argument("--backend", choices=["sqlite", "eventlog"], default="sqlite")
+    parser.add_argument("--deep-history", type=int, default=100000,
+                        help="sessions for the single long-history user (0 skips it)")
+    parser.add_argument("--flush-interval", type=float, default=0,
+                        help="seconds between write-behind flushes (0 writes each update directly)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.backend == "eventlog":
+            from app.services.progress_log import EventLogProgressStore
+            store = EventLogProgressStore(os.path.join(scratch, "log"))
+        else:
+            store = progress_store.SQLiteProgressStore(os.path.join(scratch, "bench.db"))
+        print("=" * 50)
+        print(f"Progress storage benchmark: {args.users} users, {args.backend} backend")
+        print("=" * 50)
+
+        start = time.perf_counter()
+        seed(store, args.users, args.sessions_per_user)
+        print(f"  seeded in {time.perf_counter() - start:.1f}s")
+
+        served = store
+        if args.flush_interval > 0:
+            from app.services.progress_buffer import WriteBehindProgressStore
+            served = WriteBehindProgressStore(store, interval=args.flush_interval)
+
+        progress_store._store = served
+        reset_leaderboard_index()
+        score_distribution.reset_score_distribution()
+        appended_before = getattr(store, "bytes_appended", 0)
+        asyncio.run(run(args.users, args.sessions_per_user, args.calls, args.leaderboard_calls))
+        if served is not store:
+            served.flush()
+            stats = served.stats()
+            print(f"  write-behind: {stats['flushes']} flushes, average batch {stats['average_batch_size']},"
+                  f" largest {stats['largest_batch']}")
+            print(f"  batch sizes: {stats['batch_size_histogram']}")
+        if args.backend == "eventlog":
+            per_update = (store.bytes_appended - appended_before) / args.calls
+            print(f"  log bytes appended per update: {per_update:.0f}")
+            start = time.perf_counter()
+            store.compact()
+            print(f"  snapshot compaction: {time.perf_counter() - start:.2f}s")
+        if args.deep_history:
+            asyncio.run(run_deep_history(served, args.deep_history, args.calls))
+        served.close()
+        score_distribution.reset_score_distribution()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Notification scheduler scale benchmark
+Seeds a synthetic population of users, streaks (shaped like the client's
+streaks.js writes), notification preferences and notification logs, then
+times each scheduler stage end to end:
+  slot      - the 19:00 UTC reminder slot (check_reminder_slot)
+  inactive  - a full check_inactive_users scan
+  broken    - check_broken_streaks
+  deliver   - an outbox worker sending everything queued to a local SMTP
+              sink and logging each email
+and reports wall time, Firestore document reads, writes and RPCs, and
+emails per second for each.
+
+By default Firestore is the in-memory stand-in in benchmarks/memory_firestore.py,
+with --rpc-ms of simulated round trip per call. --emulator runs against the
+Firestore emulator instead (reads are then counted by the scheduler's data
+layer only, and writes are not counted):
+    firebase emulators:start --only firestore
+    export FIRESTORE_EMULATOR_HOST=localhost:8080
+
+Run from the backend folder:
+    python -m benchmarks.bench_scheduler_scale --users 10000 100000 1000000 --rpc-ms 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import email_outbox
+from app.services.email_dispatch import EmailDispatcher
+from app.services.email_outbox import OutboxWorker, close_email_outbox, get_email_outbox
+from app.services.email_service import EmailService
+from app.services.notification_scheduler import NotificationScheduler
+from app.services.preferences_cache import PreferencesCache
+from app.services.reminder_slots import reminder_bucket
+from benchmarks.memory_firestore import MemoryFirestore
+from benchmarks.smtp_sink import SMTPSink
+
+TIMEZONES = ["UTC", "Europe/London", "Asia/Kolkata", "America/New_York", "Asia/Tokyo"]
+REMINDER_TIMES = ["19:00", "19:00", "19:00", "07:30", "12:00", "19:30", "21:00"]
+ID_CHARACTERS = string.ascii_letters + string.digits
+# Activity records shared between users: the scheduler only reads them, and sharing keeps 1M users in memory
+DAY_RECORDS = [
+    {"speak": True, "write": False, "describe": False, "count": 1},
+    {"speak": True, "write": True, "describe": False, "count": 2},
+    {"speak": True, "write": True, "describe": True, "count": 3},
+]
+
+
+def population(users: int, history_days: int, seed: int = 42):
+    """(collection, document id, data) for a synthetic user base"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    days = [(now - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(history_days)]
+    for i in range(users):
+        user_id = "".join(rng.choices(ID_CHARACTERS, k=28))
+        yield "users", user_id, {"email": f"{user_id}@example.com", "displayName": f"Learner {i}"}
+
+        roll = rng.random()
+        if roll < 0.4:
+            last_active = 0  # practiced today
+        elif roll < 0.7:
+            last_active = 1  # practiced yesterday, not yet today
+        else:
+            last_active = rng.randint(2, history_days)
+        activities = {
+            day: rng.choice(DAY_RECORDS)
+            for offset, day in enumerate(days) if offset >= last_active and rng.random() < 0.6
+        }
+        if last_active < len(days):
+            activities[days[last_active]] = rng.choice(DAY_RECORDS)
+        streak = rng.randint(1, 30) if last_active <= 1 else 0
+        if last_active == 1 and rng.random() < 0.1:
+            # The broken-streak check looks for yesterday's activity with the streak already reset
+            activities[days[1]] = {**activities[days[1]], "streak_before_break": streak}
+            streak = 0
+        yield "streaks", user_id, {
+            "currentStreak": streak,
+            "longestStreak": streak + rng.randint(0, 20),
+            "totalDays": len(activities),
+            "lastActivityDate": days[last_active] if last_active < len(days) else None,
+            "activities": activities,
+        }
+
+        if rng.random() < 0.5:
+            reminder_time, zone = rng.choice(REMINDER_TIMES), rng.choice(TIMEZONES)
+            yield "notification_preferences", user_id, {
+                "email_reminders": rng.random() < 0.9,
+                "streak_reminders": True,
+                "achievement_notifications": True,
+                "reminder_time": reminder_time,
+                "timezone": zone,
+                "reminder_bucket": reminder_bucket(reminder_time, zone),
+            }
+        if rng.random() < 0.05:
+            yield f"notifications/{user_id}/notification_days", today, {
+                "date": today,
+                "entries": [{"type": "streak_reminder", "timestamp": now.isoformat(), "data": {"email_sent": True}}],
+            }
+    yield "notification_meta", "reminder_timezones", {"zones": TIMEZONES}
+
+
+def seed_memory(db: MemoryFirestore, users: int, history_days: int):
+    collections = {}
+    for collection, document_id, data in population(users, history_days):
+        collections.setdefault(collection, []).append((document_id, data))
+    for collection, documents in collections.items():
+        db.load(collection, documents)
+
+
+def seed_emulator(db, users: int, history_days: int):
+    batch = db.batch()
+    writes = 0
+    for collection, document_id, data in population(users, history_days):
+        batch.set(db.collection(collection).document(document_id), data)
+        writes += 1
+        if writes == 500:
+            batch.commit()
+            batch = db.batch()
+            writes = 0
+    if writes:
+        batch.commit()
+
+
+def counters(db, scheduler: NotificationScheduler):
+    if isinstance(db, MemoryFirestore):
+        return db.stats()
+    return {"reads": scheduler.data.stats()["document_reads"], "writes": None, "rpcs": scheduler.data.stats()["round_trips"]}
+
+
+def report(name: str, elapsed: float, before, after, emails: int):
+    def delta(key):
+        return "-" if after[key] is None else after[key] - before[key]
+    print(f"  {name:<9} {elapsed:>8.2f}s {delta('reads'):>10} {delta('writes'):>9} {delta('rpcs'):>8}"
+          f" {emails:>8} {emails / elapsed if elapsed else 0:>10.1f}")
+
+
+async def run_stages(db, scheduler: NotificationScheduler, service: EmailService):
+    outbox = get_email_outbox()
+    slot = datetime.now(timezone.utc).replace(hour=19, minute=0, second=0, microsecond=0)
+    stages = [
+        ("slot", lambda: scheduler.check_reminder_slot(slot)),
+        ("inactive", scheduler.check_inactive_users),
+        ("broken", scheduler.check_broken_streaks),
+    ]
+    for name, stage in stages:
+        before, queued = counters(db, scheduler), outbox.stats()["pending"]
+        start = time.perf_counter()
+        await stage()
+        elapsed = time.perf_counter() - start
+        report(name, elapsed, before, counters(db, scheduler), outbox.stats()["pending"] - queued)
+
+    worker = OutboxWorker(outbox, service, on_sent=scheduler.log_sent)
+    before = counters(db, scheduler)
+    start = time.perf_counter()
+    await worker.drain()
+    elapsed = time.perf_counter() - start
+    report("deliver", elapsed, before, counters(db, scheduler), outbox.stats()["sent"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the notification scheduler at scale")
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--history-days", type=int, default=14, help="days of activity history per streak")
+    parser.add_argument("--rpc-ms", type=float, default=0, help="simulated Firestore round trip (in-memory only)")
+    parser.add_argument("--smtp-latency-ms", type=float, default=1)
+    parser.add_argument("--pool-size", type=int, default=8, help="SMTP connections")
+    parser.add_argument("--emulator", action="store_true", help="use the Firestore emulator instead of the stand-in")
+    args = parser.parse_args()
+
+    if args.emulator and not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        print("Set FIRESTORE_EMULATOR_HOST to run this benchmark against the Firestore emulator")
+        sys.exit(1)
+
+    sink = SMTPSink(latency=args.smtp_latency_ms / 1000).start()
+    service = EmailService()
+    service.dispatcher = EmailDispatcher("127.0.0.1", sink.port, pool_size=args.pool_size, rate=0,
+                                         burst=args.pool_size, starttls=False)
+
+    for users in args.users:
+        print("=" * 50)
+        print(f"Scheduler scale: {users} users, {args.history_days} days of history,"
+              f" {'emulator' if args.emulator else f'in-memory, {args.rpc_ms:g} ms/RPC'}")
+        print("=" * 50)
+
+        start = time.perf_counter()
+        if args.emulator:
+            from google.cloud import firestore
+            from benchmarks.bench_notification_reads import PrefixedClient
+            client = firestore.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "fluentease-bench"))
+            db = PrefixedClient(client, f"bench{uuid.uuid4().hex[:8]}_")
+            seed_emulator(db, users, args.history_days)
+        else:
+            db = MemoryFirestore()
+            seed_memory(db, users, args.history_days)
+            db.latency = args.rpc_ms / 1000
+        print(f"  seeded in {time.perf_counter() - start:.1f}s")
+
+        # A fresh outbox per population so every run queues and sends from scratch
+        outbox_dir = tempfile.mkdtemp(prefix="bench_outbox_")
+        email_outbox.EMAIL_OUTBOX_PATH = os.path.join(outbox_dir, "email_outbox.db")
+        # and a cold preferences cache, so no population reuses another's documents
+        scheduler = NotificationScheduler(db=db, prefs_cache=PreferencesCache())
+
+        print(f"  {'stage':<9} {'wall':>9} {'reads':>10} {'writes':>9} {'rpcs':>8} {'emails':>8} {'emails/s':>10}")
+        asyncio.run(run_stages(db, scheduler, service))
+
+        scheduler.data.close()
+        close_email_outbox()
+
+    service.close()
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+In-memory Firestore stand-in for benchmarks
+Implements the part of the google-cloud-firestore client the notification
+scheduler uses: collections and subcollections, document get/set/delete,
+where/select/order_by('__name__')/cursors/limit queries, collection groups,
+get_all, batches, transactions (usable with firestore.transactional), and
+the ArrayUnion/Increment/DELETE_FIELD/SERVER_TIMESTAMP transforms.
+
+Equality and "in" filters use per-field indexes, like Firestore's automatic
+single-field indexes, so paging through a million documents does not
+rescan the collection per page. Every RPC can be delayed by `latency`
+seconds to model the network round trip, and `stats()` counts billed
+document reads, writes and RPCs.
+"""
+import bisect
+import copy
+import itertools
+import operator
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.cloud.firestore_v1 import transforms
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "array_contains": lambda value, item: isinstance(value, list) and item in value,
+}
+MISSING = object()
+
+
+def _get_field(data: Dict, field: str):
+    for part in field.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return MISSING
+        data = data[part]
+    return data
+
+
+def _apply(current: Dict, fields: Dict, merge: bool) -> Dict:
+    """The document after writing `fields` over `current` (transforms resolved)"""
+    result = copy.deepcopy(current) if merge else {}
+    for key, value in fields.items():
+        existing = result.get(key, MISSING)
+        if value is transforms.DELETE_FIELD:
+            result.pop(key, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            result[key] = datetime.now(timezone.utc)
+        elif isinstance(value, transforms.ArrayUnion):
+            array = list(existing) if isinstance(existing, list) else []
+            array.extend(item for item in value.values if item not in array)
+            result[key] = array
+        elif isinstance(value, transforms.ArrayRemove):
+            result[key] = [item for item in existing if item not in value.values] if isinstance(existing, list) else []
+        elif isinstance(value, transforms.Increment):
+            result[key] = (existing if isinstance(existing, (int, float)) else 0) + value.value
+        elif isinstance(value, dict) and merge and isinstance(existing, dict):
+            result[key] = _apply(existing, value, merge=True)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        value = _get_field(self._data or {}, field)
+        return None if value is MISSING else value
+
+
+class DocumentReference:
+    def __init__(self, client: "MemoryFirestore", path: str):
+        self._client = client
+        self.path = path
+        self.parent_path, _, self.id = path.rpartition("/")
+
+    def collection(self, name: str) -> "Query":
+        return Query(self._client, f"{self.path}/{name}")
+
+    def get(self, transaction=None) -> DocumentSnapshot:
+        self._client._rpc(reads=1)
+        return DocumentSnapshot(self, self._client._read(self.path))
+
+    def set(self, fields: Dict, merge: bool = False):
+        self._client._rpc(writes=1)
+        self._client._write(self.path, fields, merge)
+
+    def update(self, fields: Dict):
+        self._client._rpc(writes=1)
+        self._client._update(self.path, fields)
+
+    def delete(self):
+        self._client._rpc(writes=1)
+        self._client._delete(self.path)
+
+
+class Query:
+    """A collection reference, or a query over one collection or a collection group"""
+
+    def __init__(self, client: "MemoryFirestore", path: str, group: bool = False, filters: Tuple = (),
+                 fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                 start: Optional[Tuple[str, bool]] = None, end: Optional[str] = None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._filters = filters
+        self._fields = fields
+        self._limit = limit
+        self._start = start
+        self._end = end
+        self.id = path.rpartition("/")[2]
+
+    def _copy(self, **changes) -> "Query":
+        state = dict(path=self._path, group=self._group, filters=self._filters, fields=self._fields,
+                     limit=self._limit, start=self._start, end=self._end)
+        state.update(changes)
+        return Query(self._client, **state)
+
+    def document(self, document_id: str) -> DocumentReference:
+        return DocumentReference(self._client, f"{self._path}/{document_id}")
+
+    def where(self, field: str, op: str, value) -> "Query":
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def select(self, fields: Iterable[str]) -> "Query":
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "Query":
+        # Results are always in document-ID order, which is all the scheduler asks for
+        if field != "__name__" or direction != "ASCENDING":
+            raise ValueError("Only order_by('__name__') is supported")
+        return self
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit=count)
+
+    @staticmethod
+    def _cursor_id(cursor) -> str:
+        value = cursor["__name__"] if isinstance(cursor, dict) else cursor.id
+        return value.id if isinstance(value, DocumentReference) else value
+
+    def start_at(self, cursor) -> "Query":
+        return self._copy(start=(self._cursor_id(cursor), True))
+
+    def start_after(self, cursor) -> "Query":
+        return self._copy(start=(self._cursor_id(cursor), False))
+
+    def end_before(self, cursor) -> "Query":
+        return self._copy(end=self._cursor_id(cursor))
+
+    def stream(self, transaction=None):
+        documents = self._client._query(self)
+        # Firestore bills at least one read per query, even when nothing matches
+        self._client._rpc(reads=max(1, len(documents)))
+        for path, data in documents:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield DocumentSnapshot(DocumentReference(self._client, path), data)
+
+    def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return list(self.stream())
+
+
+class WriteBatch:
+    def __init__(self, client: "MemoryFirestore"):
+        self._client = client
+        self._writes: List[Tuple] = []
+
+    def set(self, reference: DocumentReference, fields: Dict, merge: bool = False):
+        self._writes.append(("set", reference.path, fields, merge))
+
+    def update(self, reference: DocumentReference, fields: Dict):
+        self._writes.append(("update", reference.path, fields, None))
+
+    def delete(self, reference: DocumentReference):
+        self._writes.append(("delete", reference.path, None, None))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        self._client._rpc(writes=len(self._writes))
+        with self._client._lock:
+            for kind, path, fields, merge in self._writes:
+                if kind == "set":
+                    self._client._write(path, fields, merge)
+                elif kind == "update":
+                    self._client._update(path, fields)
+                else:
+                    self._client._delete(path)
+        self._writes = []
+
+
+class Transaction(WriteBatch):
+    """Buffers writes and applies them on commit; enough for firestore.transactional"""
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, client: "MemoryFirestore"):
+        super().__init__(client)
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._client._transaction_ids)
+
+    def _commit(self):
+        self.commit()
+        self._clean_up()
+
+    def _rollback(self):
+        self._clean_up()
+
+
+class MemoryFirestore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._lock = threading.RLock()
+        # collection path -> {document id: data}
+        self._collections: Dict[str, Dict[str, Dict]] = {}
+        self._sorted_ids: Dict[str, List[str]] = {}
+        # (collection path, field) -> {value: sorted document ids}
+        self._indexes: Dict[Tuple[str, str], Dict] = {}
+        self._transaction_ids = itertools.count(1)
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+
+    def _rpc(self, reads: int = 0, writes: int = 0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.rpcs += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Storage; the lock is reentrant so a batch can hold it across its writes
+
+    def _changed(self, collection: str):
+        self._sorted_ids.pop(collection, None)
+        for key in [key for key in self._indexes if key[0] == collection]:
+            del self._indexes[key]
+
+    def _read(self, path: str) -> Optional[Dict]:
+        collection, _, document_id = path.rpartition("/")
+        with self._lock:
+            return self._collections.get(collection, {}).get(document_id)
+
+    def _write(self, path: str, fields: Dict, merge: bool):
+        collection, _, document_id = path.rpartition("/")
+        with self._lock:
+            documents = self._collections.setdefault(collection, {})
+            documents[document_id] = _apply(documents.get(document_id) or {}, fields, merge)
+            self._changed(collection)
+
+    def _update(self, path: str, fields: Dict):
+        current = self._read(path)
+        if current is None:
+            raise KeyError(f"No document to update: {path}")
+        nested: Dict = {}
+        for field, value in fields.items():
+            *parents, last = field.split(".")
+            target = nested
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[last] = value
+        self._write(path, nested, merge=True)
+
+    def _delete(self, path: str):
+        collection, _, document_id = path.rpartition("/")
+        with self._lock:
+            if self._collections.get(collection, {}).pop(document_id, None) is not None:
+                self._changed(collection)
+
+    def load(self, collection: str, documents: Iterable[Tuple[str, Dict]]):
+        """Seed documents directly: no copies, no RPCs and not counted"""
+        with self._lock:
+            self._collections.setdefault(collection, {}).update(documents)
+            self._changed(collection)
+
+    def _ids(self, collection: str) -> List[str]:
+        ids = self._sorted_ids.get(collection)
+        if ids is None:
+            ids = self._sorted_ids[collection] = sorted(self._collections.get(collection, {}))
+        return ids
+
+    def _index(self, collection: str, field: str) -> Dict:
+        index = self._indexes.get((collection, field))
+        if index is None:
+            index = {}
+            documents = self._collections.get(collection, {})
+            for document_id in self._ids(collection):
+                value = _get_field(documents[document_id], field)
+                if value is not MISSING and value.__hash__ is not None:
+                    index.setdefault(value, []).append(document_id)
+            self._indexes[(collection, field)] = index
+        return index
+
+    def _candidates(self, collection: str, filters: Tuple) -> Tuple[List[str], Tuple]:
+        """Sorted candidate IDs from the first indexable filter, and the filters still to check"""
+        for position, (field, op, value) in enumerate(filters):
+            if op == "==" and value.__hash__ is not None:
+                ids = self._index(collection, field).get(value, [])
+            elif op == "in" and all(item.__hash__ is not None for item in value):
+                index = self._index(collection, field)
+                ids = sorted(set().union(*(index.get(item, []) for item in value)))
+            else:
+                continue
+            return ids, filters[:position] + filters[position + 1:]
+        return self._ids(collection), filters
+
+    def _query(self, query: Query) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            if query._group:
+                collections = sorted(path for path in self._collections if path.rpartition("/")[2] == query._path)
+            else:
+                collections = [query._path]
+            results = []
+            for collection in collections:
+                documents = self._collections.get(collection, {})
+                ids, remaining = self._candidates(collection, query._filters)
+                start, end = 0, len(ids)
+                if query._start is not None:
+                    cursor, inclusive = query._start
+                    start = (bisect.bisect_left if inclusive else bisect.bisect_right)(ids, cursor)
+                if query._end is not None:
+                    end = bisect.bisect_left(ids, query._end)
+                for document_id in ids[start:end]:
+                    data = documents[document_id]
+                    if all(
+                        (value := _get_field(data, field)) is not MISSING and OPERATORS[op](value, expected)
+                        for field, op, expected in remaining
+                    ):
+                        results.append((f"{collection}/{document_id}", data))
+                        if query._limit is not None and len(results) >= query._limit:
+                            return results
+            return results
+
+    # Client interface
+
+    def collection(self, path: str) -> Query:
+        return Query(self, path)
+
+    def collection_group(self, name: str) -> Query:
+        return Query(self, name, group=True)
+
+    def document(self, path: str) -> DocumentReference:
+        return DocumentReference(self, path)
+
+    def get_all(self, references: Iterable[DocumentReference], transaction=None):
+        references = list(references)
+        self._rpc(reads=len(references))
+        for reference in references:
+            yield DocumentSnapshot(reference, self._read(reference.path))
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> Transaction:
+        return Transaction(self)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"reads": self.reads, "writes": self.writes, "rpcs": self.rpcs}
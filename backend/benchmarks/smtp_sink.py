@@ -0,0 +1,72 @@
+"""
+Local SMTP sink for benchmarks
+Accepts and discards mail over plain SMTP. Every reply can be delayed to
+model a remote server's round trip, and the greeting can be delayed further
+to stand in for the TLS handshake and login a real provider requires.
+"""
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.count("connections")
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-sink\r\n250-8BITMIME\r\n250 SIZE 52428800")
+            elif command.startswith("HELO"):
+                self.reply("250 sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self.server.count("messages")
+                self.reply("250 OK queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, connect_delay: float = 0.0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.lock = threading.Lock()
+        self.counts = {"connections": 0, "messages": 0}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, name: str):
+        with self.lock:
+            self.counts[name] += 1
+
+    def start(self) -> "SMTPSink":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -2,11 +2,15 @@ import React, { useState, useEffect, useContext } from 'react';
 import { AuthContext } from '../context/AuthContext';
 import { toast } from 'react-toastify';
 
+// Reminders are sent at reminder_time in the user's own timezone
+const browserTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone || "UTC";
+
 const NotificationSettings = () => {
   const { user } = useContext(AuthContext);
   const [preferences, setPreferences] = useState({
     email_reminders: true,
     reminder_time: "19:00",
+    timezone: browserTimezone,
     streak_reminders: true,
     achievement_notifications: true
   });
@@ -46,7 +50,7 @@ const NotificationSettings = () => {
         },
         body: JSON.stringify({
           user_id: user.uid,
-          preferences: preferences
+          preferences: { ...preferences, timezone: browserTimezone }
         })
       });
 
@@ -148,7 +152,7 @@ const NotificationSettings = () => {
           <div className="flex items-center justify-between p-4 bg-blue-50 rounded-lg border border-blue-200">
             <div>
               <h4 className="font-medium text-gray-800">Reminder Time</h4>
-              <p className="text-sm text-gray-600">What time should we send daily reminders?</p>
+              <p className="text-sm text-gray-600">What time should we send daily reminders? ({browserTimezone})</p>
             </div>
             <select
               value={preferences.reminder_time}